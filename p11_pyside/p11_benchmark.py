@@ -0,0 +1,514 @@
+"""
+Замеры скорости геометрии и отрисовки плоскости Лобачевского без экрана:
+построения, преобразования, отрисовка HypArea в изображения разных размеров и
+массовые операции HypControls, сохранение и открытие сцены, запросы к индексу по гиперболическому
+расстоянию, пересчёт построенных объектов, а также время холодного старта скрипта,
+которому нужна только геометрия. Нагрузки воспроизводимы (генератор случайных
+чисел с фиксированным зерном), результаты пишутся в JSON, чтобы сравнивать
+прогоны на разных коммитах.
+
+Ядра p11_kernels замеряются в каждом доступном бэкенде, остальное -- в
+выбранном (--backend, по умолчанию эталонном numpy).
+
+Кроме того, воспроизводятся записанные сеансы (p11_session): для каждого
+сеанса -- процентили задержек его событий.
+
+Запуск:
+  QT_QPA_PLATFORM=offscreen python p11_benchmark.py [-n число объектов] [-o файл.json] [-k подстрока]
+                                                    [-s сеанс.json ...] [--speed темп] [--backend бэкенд]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tempfile
+
+import numpy as np
+
+# без экрана, если не сказано иное
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PySide2 import QtCore, QtGui, QtWidgets
+import PySide2
+
+import p11_kernels
+from p11_index import HypSpatialIndex, bkDistance
+from p11_session import loadSession, HypSessionPlayer, latencySummary
+from p11_hyperbolic import (HypModel, HypPoint, HypPointArray, HypTransform, HypTransformArray,
+                            HypPointStore, HypLineStore, HypArea, HypControls,
+                            drawLineThroughPoints, intersectLines, drawPerpendicular, drawParallels,
+                            drawLineThroughPointsBatch, intersectLinesBatch, drawPerpendicularBatch,
+                            drawParallelsBatch, intersectAllLinesBatch, HypTiling, HypScene, saveScene,
+                            loadScene, HypConstructionGraph, HypWindow)
+
+
+def uniformPoints(n, rng, radius=5.0):
+    """
+    Точки, равномерно распределённые по гиперболической площади круга радиуса radius
+    с центром в центре диска. Площадь круга радиуса rho пропорциональна cosh(rho) - 1.
+
+    Returns
+    -------
+    HypPointArray
+      Точки в модели Пуанкаре.
+    """
+    rho = np.arccosh(1 + rng.random(n) * (np.cosh(radius) - 1))
+    phi = rng.uniform(0, 2 * np.pi, n)
+    return HypPointArray(np.tanh(rho / 2) * np.exp(1j * phi), HypModel.Poincare)
+
+
+def randomGeodesics(n, rng):
+    """
+    Прямые через пары независимых равномерно распределённых идеальных точек.
+    """
+    p = np.exp(1j * rng.uniform(0, 2 * np.pi, n))
+    q = np.exp(1j * rng.uniform(0, 2 * np.pi, n))
+    return drawLineThroughPointsBatch(HypPointArray(p), HypPointArray(q))
+
+
+def tilingEdges(p=7, q=3, radius=5.0):
+    """
+    Прямые сторон правильного разбиения {p, q} с центрами многоугольников в круге
+    радиуса radius, см. HypTiling.
+
+    Returns
+    -------
+    HypLineArray
+    """
+    return HypTiling(p, q, radius).edges()
+
+
+class Benchmark:
+    """
+    Набор замеров. Каждый замер повторяется repeat раз, в результат идёт лучшее
+    время и все времена.
+
+    Parameters
+    ----------
+    repeat: int
+    pattern: str
+      Выполнять только замеры, в имени которых есть эта подстрока.
+    """
+    def __init__(self, repeat=3, pattern=''):
+        self.repeat = repeat
+        self.pattern = pattern
+        self.results = []
+
+    def measure(self, name, n, run, setup=None):
+        """
+        Замерить run(state), где state = setup() готовится заново перед каждым
+        повторением и в замер не входит.
+
+        Parameters
+        ----------
+        name: str
+        n: int
+          Размер нагрузки (число объектов), для сравнения в пересчёте на объект.
+        """
+        if self.pattern not in name:
+            return
+        times = []
+        for _ in range(self.repeat):
+            state = setup() if setup is not None else None
+            t = time.perf_counter()
+            run(state)
+            times.append(time.perf_counter() - t)
+        self.record(name, n, min(times), times=times)
+
+    def record(self, name, n, seconds, **values):
+        """
+        Добавить результат замера, сделанного вне measure. seconds -- то, с чем
+        сравниваются прогоны (см. compare), values -- что ещё записать.
+        """
+        result = {'name': name, 'n': n, 'seconds': seconds}
+        result.update(values)
+        self.results.append(result)
+        print('{:50} {:>9} {:10.4f} s'.format(name, n, seconds), flush=True)
+
+
+def geometryBenchmarks(bench, n, rng):
+    points = uniformPoints(n, rng)
+    others = uniformPoints(n, rng)
+    lines = randomGeodesics(n, rng)
+    otherLines = randomGeodesics(n, rng)
+    few = min(n, 10000)
+    pointList, otherList = list(points[:few]), list(others[:few])
+    lineList = list(lines[:few])
+
+    bench.measure('geometry.lineThroughPoints', few,
+                  lambda _: [drawLineThroughPoints(p, q) for p, q in zip(pointList, otherList)])
+    bench.measure('geometry.intersectLines', few,
+                  lambda _: [intersectLines(l, m) for l, m in zip(lineList, lineList[1:])])
+    bench.measure('geometry.perpendicular', few,
+                  lambda _: [drawPerpendicular(l, p) for l, p in zip(lineList, pointList)])
+    bench.measure('geometry.parallels', few,
+                  lambda _: [drawParallels(l, p) for l, p in zip(lineList, pointList)])
+    bench.measure('geometry.lineThroughPointsBatch', n, lambda _: drawLineThroughPointsBatch(points, others))
+    bench.measure('geometry.intersectLinesBatch', n, lambda _: intersectLinesBatch(lines, otherLines))
+    bench.measure('geometry.perpendicularBatch', n, lambda _: drawPerpendicularBatch(lines, points))
+    bench.measure('geometry.parallelsBatch', n, lambda _: drawParallelsBatch(lines, points))
+    # все пересечения -- квадратичная по выходу нагрузка, поэтому прямых меньше
+    some = lines[:int(few ** 0.5) * 20]
+    bench.measure('geometry.intersectAllLines', len(some), lambda _: list(intersectAllLinesBatch(some)))
+    # около n многоугольников {7, 3}: их число в круге радиуса r -- примерно 3 e**r
+    radius = np.log(max(n, 3) / 3)
+    bench.measure('geometry.tiling', n, lambda _: HypTiling(7, 3, radius))
+    tiling = HypTiling(7, 3, radius)
+    bench.measure('geometry.tilingEdges', len(tiling), lambda _: tiling.edges())
+
+
+def transformBenchmarks(bench, n, rng):
+    points = uniformPoints(n, rng)
+    few = min(n, 10000)
+    pointList = list(points[:few])
+    steps = HypTransformArray.pToQ(uniformPoints(n, rng, 0.1), uniformPoints(n, rng, 0.1))
+    stepList = list(steps[:few])
+    t = HypTransform.pToQ(HypPoint(0j), HypPoint(0.3 + 0.1j))
+
+    bench.measure('transform.applyPoint', few, lambda _: [t(p) for p in pointList])
+    bench.measure('transform.applyArray', n, lambda _: t(points))
+    bench.measure('transform.composePairs', few, lambda _: [s * u for s, u in zip(stepList, stepList[1:])])
+    bench.measure('transform.composeArray', n, lambda _: steps * steps.inv)
+    bench.measure('transform.product', n, lambda _: steps.prod())
+
+
+def kernelBenchmarks(bench, n, rng):
+    z = uniformPoints(n, rng).z
+    lines = randomGeodesics(n, rng)
+    others = randomGeodesics(n, rng)
+    t = HypTransformArray.pToQ(uniformPoints(n, rng, 0.2), uniformPoints(n, rng, 0.2))
+    arguments = {'toPoincare': (z,), 'toKlein': (z,), 'idealPoints': (lines.a, lines.b, lines.c),
+                 'intersect': (lines.a, lines.b, lines.c, others.a, others.b, others.c),
+                 'moebius': (t.a, t.b, z), 'pToQ': (z, z[::-1])}
+    for backend in p11_kernels.available():
+        # циклы Python -- на меньшем числе элементов
+        size = min(n, 10000) if backend == 'python' else n
+        for kernel in p11_kernels.KERNELS:
+            run = p11_kernels.implementation(kernel, backend)
+            args = [x[:size] for x in arguments[kernel]]
+            # numba компилирует ядро при первом вызове, это в замер не входит
+            run(*(x[:1] for x in args))
+            bench.measure('kernel.{}.{}'.format(kernel, backend), size, lambda _: run(*args))
+
+
+def indexBenchmarks(bench, n, rng, queries=100):
+    points = uniformPoints(n, rng, 6.0).toModel(HypModel.BeltramiKlein).z
+    centers = uniformPoints(queries, rng, 6.0).toModel(HypModel.BeltramiKlein).z.tolist()
+    bench.measure('index.build', n, lambda _: HypSpatialIndex(points))
+    index = HypSpatialIndex(points)
+    # время одного запроса -- это время замера, делённое на queries
+    for k in [1, 10, 100]:
+        bench.measure('index.nearest{}'.format(k), queries, lambda _: [index.nearestPoints(u, k) for u in centers])
+    for rho in [0.01, 0.1, 0.5]:
+        bench.measure('index.within{}'.format(rho), queries, lambda _: [index.pointsWithin(u, rho) for u in centers])
+    # то же без индекса, на меньшем числе запросов
+    few = centers[:10]
+    bench.measure('index.nearest10Brute', len(few),
+                  lambda _: [np.argpartition(bkDistance(u, points), 9)[:10] for u in few])
+
+
+def constructionChain(n, rng):
+    """
+    Сцена с графом построений: n точек, прямые через соседние точки и точки
+    пересечения соседних прямых. От каждой точки зависит лишь несколько объектов.
+
+    Returns
+    -------
+    points: HypPointStore
+    lines: HypLineStore
+    graph: HypConstructionGraph
+    """
+    points, lines, graph = HypPointStore(), HypLineStore(), HypConstructionGraph()
+    pointIds = points.append(**HypPointStore.columnsOf(uniformPoints(n, rng, 2.0)))
+    i = np.arange(n - 1)
+    lineIds = lines.append(**HypLineStore.columnsOf(drawLineThroughPointsBatch(points.points(i), points.points(i + 1))))
+    graph.add('lines', lineIds, 'lineThroughPoints', np.stack([pointIds[i], pointIds[i + 1]], -1))
+    j = np.arange(n - 2)
+    crossings = intersectLinesBatch(lines.lines(j), lines.lines(j + 1))
+    valid = crossings.isValid()
+    graph.add('points', points.append(**HypPointStore.columnsOf(crossings[valid])), 'intersection',
+              np.stack([lineIds[j[valid]], lineIds[j[valid] + 1]], -1))
+    return points, lines, graph
+
+
+def graphBenchmarks(bench, n, rng):
+    points, lines, graph = constructionChain(n, rng)
+    sources = points.ids[:n]
+    noLines = np.zeros(0, np.int64)
+    # упорядочение графа строится при первом пересчёте
+    graph.recompute(points, lines, sources[:1], noLines)
+    few = sources[rng.choice(n, 10, replace=False)]
+    bench.measure('graph.recomputeOne', len(few), lambda _: [graph.recompute(points, lines, few[k:k + 1], noLines)
+                                                      for k in range(len(few))])
+    bench.measure('graph.recomputeAll', len(graph), lambda _: graph.recompute(points, lines, sources, noLines))
+    bench.measure('graph.descendants', len(few),
+                  lambda _: [graph.descendants(few[k:k + 1], noLines) for k in range(len(few))])
+
+
+def _settle(app, area):
+    # дождаться всех заказанных кадров и растеризаций
+    while area.scheduler.timer.isActive() or area._renderer.isBusy():
+        app.processEvents(QtCore.QEventLoop.AllEvents, 5)
+    app.processEvents()
+
+
+def paintBenchmarks(bench, n, rng, app, sizes=((400, 400), (800, 600), (1600, 1200))):
+    workloads = {
+        'uniform': (uniformPoints(n, rng), randomGeodesics(n // 10, rng)),
+        'geodesics': (HypPointArray(), randomGeodesics(n, rng)),
+        'tiling': (HypPointArray(), tilingEdges(radius=6.3 if n >= 100000 else 5.3)),
+    }
+    for name, (points, lines) in workloads.items():
+        pointStore, lineStore = HypPointStore(), HypLineStore()
+        pointStore.append(**HypPointStore.columnsOf(points))
+        lineStore.append(**HypLineStore.columnsOf(lines))
+        total = len(pointStore) + len(lineStore)
+        for model in ['Beltrami-Klein', 'Poincare']:
+            for width, height in sizes:
+                area = HypArea()
+                area.setStores(pointStore, lineStore)
+                area.setModel(model)
+                area.resize(width, height)
+                area.show()
+                _settle(app, area)
+                prefix = 'paint.{}.{}.{}x{}'.format(name, model, width, height)
+
+                moves = iter(HypTransformArray.pToQ(uniformPoints(100, rng, 0.2), uniformPoints(100, rng, 0.2)))
+
+                def move(_):
+                    # кадр после сдвига плоскости: слой объектов заново и его растеризация
+                    area.transform = next(moves) * area.transform
+                    area.scheduler.request()
+                    _settle(app, area)
+
+                bench.measure(prefix + '.frame', total, move)
+                image = QtGui.QImage(area.size(), QtGui.QImage.Format_ARGB32_Premultiplied)
+                # paintEvent, когда все слои уже растеризованы
+                bench.measure(prefix + '.paintEvent', total, lambda _: area.render(image))
+                area.close()
+                area.deleteLater()
+                _settle(app, area)
+
+
+def controlsBenchmarks(bench, n, rng):
+    points = uniformPoints(n, rng)
+    lines = randomGeodesics(n, rng)
+
+    def fresh():
+        return HypControls()
+
+    def filled():
+        controls = HypControls()
+        controls.addPoints(points)
+        controls.addLines(lines)
+        return controls
+
+    def selected():
+        controls = filled()
+        controls.pointModel.setSelected(np.arange(n), True)
+        controls.lineModel.setSelected(np.arange(n), True)
+        return controls
+
+    def deleted():
+        controls = selected()
+        controls.deleteObjects()
+        return controls
+
+    def undone():
+        controls = deleted()
+        controls.undo()
+        return controls
+
+    def add(controls):
+        controls.addPoints(points)
+        controls.addLines(lines)
+
+    def added():
+        controls = fresh()
+        add(controls)
+        return controls
+
+    def undoAdd(controls):
+        controls.undo()
+        controls.undo()
+
+    def select(controls):
+        controls.pointModel.setSelected(np.arange(n), True)
+        controls.lineModel.setSelected(np.arange(n), True)
+
+    bench.measure('controls.add', 2 * n, add, fresh)
+    bench.measure('controls.selectAll', 2 * n, select, filled)
+    bench.measure('controls.delete', 2 * n, lambda controls: controls.deleteObjects(), selected)
+    bench.measure('controls.undoDelete', 2 * n, lambda controls: controls.undo(), deleted)
+    bench.measure('controls.redoDelete', 2 * n, lambda controls: controls.redo(), undone)
+    bench.measure('controls.undoAdd', 2 * n, undoAdd, added)
+    bench.measure('controls.clear', 2 * n, lambda controls: controls.clearObjects(), filled)
+
+
+def sceneBenchmarks(bench, n, rng, app):
+    pointStore, lineStore = HypPointStore(), HypLineStore()
+    pointStore.append(**HypPointStore.columnsOf(uniformPoints(n, rng)))
+    lineStore.append(**HypLineStore.columnsOf(randomGeodesics(n, rng)))
+    area = HypArea()
+    area.setStores(pointStore, lineStore)
+    scene = HypScene(pointStore, lineStore, index=area.spatialIndex())
+    total = len(pointStore) + len(lineStore)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'scene.hyps')
+        bench.measure('scene.save', total, lambda _: saveScene(path, scene))
+        saveScene(path, scene)
+        bench.measure('scene.open', total, lambda _: loadScene(path))
+
+        def frame(opened):
+            # первый кадр открытой сцены, с сохранённым индексом или без него
+            area = HypArea()
+            area.setStores(opened.points, opened.lines, opened.index)
+            area.resize(800, 600)
+            area.show()
+            _settle(app, area)
+            area.close()
+            area.deleteLater()
+
+        def withoutIndex():
+            opened = loadScene(path)
+            opened.index = None
+            return opened
+
+        bench.measure('scene.firstFrame', total, frame, lambda: loadScene(path))
+        bench.measure('scene.firstFrameWithoutIndex', total, frame, withoutIndex)
+        app.processEvents()
+
+        # векторный снимок всей сцены в обеих моделях
+        area.resize(800, 600)
+        for model in ['Beltrami-Klein', 'Poincare']:
+            area.setModel(model)
+            for extension in ['svg', 'pdf']:
+                exported = os.path.join(directory, 'view.' + extension)
+                bench.measure('scene.export.{}.{}'.format(extension, model), total,
+                              lambda _: area.exportView(exported))
+    area.deleteLater()
+
+
+def sessionBenchmarks(bench, paths, speed=None):
+    """
+    Воспроизвести записанные сеансы (см. p11_session) repeat раз каждый. Для
+    каждой группы событий сеанса (см. HypSession.groups) записывается медиана
+    задержки как seconds и процентили p90, p99 и max; у каждого события
+    берётся лучшая задержка из повторений.
+
+    Parameters
+    ----------
+    paths: list of str
+      Файлы сеансов.
+    speed: float
+      Темп воспроизведения относительно записи; None -- так быстро, как возможно.
+    """
+    for path in paths:
+        prefix = 'session.' + os.path.splitext(os.path.basename(path))[0]
+        if bench.pattern not in prefix:
+            continue
+        session = loadSession(path)
+        window = HypWindow()
+        player = HypSessionPlayer(window, session)
+        latencies = np.min([player.play(speed) for _ in range(bench.repeat)], axis=0)
+        for group, row in latencySummary(session.groups(), latencies).items():
+            bench.record('{}.{}'.format(prefix, group), row.pop('n'), row.pop('p50'), **row)
+        window.close()
+        window.deleteLater()
+
+
+def compare(old, new):
+    """
+    Вывести отношения времён прогона new к временам прогона old по общим замерам.
+
+    Parameters
+    ----------
+    old, new: dict
+      Результаты в том виде, в каком они пишутся в JSON.
+    """
+    before = {r['name']: r['seconds'] for r in old['results']}
+    print('compared to {} ({})'.format(old['meta']['commit'][:10], old['meta']['time']))
+    for r in new['results']:
+        if r['name'] in before and before[r['name']] > 0:
+            print('{:50} {:8.2f}x'.format(r['name'], r['seconds'] / before[r['name']]))
+
+
+# сценарии холодного старта: пустой Python, numpy, геометрия без Qt и виджеты;
+# сценарий геометрии завершается с ошибкой, если он всё-таки загрузил Qt
+STARTUP = {
+    'python': 'pass',
+    'numpy': 'import numpy',
+    'geometry': ('import sys, p11_hyperbolic as h; h.drawLineThroughPoints(h.HypPoint(0j), h.HypPoint(0.5j)); '
+                 'sys.exit("PySide2" in sys.modules)'),
+    'widgets': 'import p11_hyperbolic as h; h.HypArea',
+}
+
+
+def startupBenchmarks(bench):
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name, code in STARTUP.items():
+        def run(_, code=code):
+            subprocess.run([sys.executable, '-c', code], cwd=here, check=True)
+
+        bench.measure('startup.' + name, 1, run)
+
+
+def metadata(n, repeat):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'commit': commit, 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'n': n, 'repeat': repeat,
+            'python': platform.python_version(), 'numpy': np.__version__, 'pyside': PySide2.__version__,
+            'qt': QtCore.qVersion(), 'platform': platform.platform(),
+            'qpa': QtGui.QGuiApplication.platformName(), 'backend': p11_kernels.backend()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', type=int, default=100000, help='число объектов в нагрузках')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='число повторений замера')
+    parser.add_argument('-k', '--filter', default='', help='только замеры с этой подстрокой в имени')
+    parser.add_argument('-o', '--output', default='p11_benchmark.json', help='куда записать результаты')
+    parser.add_argument('-c', '--compare', help='сравнить с результатами из этого файла')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-s', '--session', action='append', default=[],
+                        help='воспроизвести записанный сеанс (можно несколько раз)')
+    parser.add_argument('--speed', type=float, default=0,
+                        help='темп воспроизведения сеансов относительно записи, 0 -- без ожидания')
+    parser.add_argument('--backend', choices=list(p11_kernels.BACKENDS),
+                        help='бэкенд ядер геометрии (по умолчанию -- из HYP_BACKEND или эталонный)')
+    args = parser.parse_args(argv)
+    if args.backend:
+        p11_kernels.setBackend(args.backend)
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    bench = Benchmark(args.repeat, args.filter)
+    rng = np.random.default_rng(args.seed)
+    startupBenchmarks(bench)
+    geometryBenchmarks(bench, args.n, rng)
+    transformBenchmarks(bench, args.n, rng)
+    kernelBenchmarks(bench, args.n, rng)
+    indexBenchmarks(bench, args.n, rng)
+    graphBenchmarks(bench, args.n, rng)
+    paintBenchmarks(bench, args.n, rng, app)
+    controlsBenchmarks(bench, args.n, rng)
+    sceneBenchmarks(bench, args.n, rng, app)
+    sessionBenchmarks(bench, args.session, args.speed or None)
+
+    results = {'meta': metadata(args.n, args.repeat), 'results': bench.results}
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=1)
+    print('written to', args.output)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+"""
+Запись отрисовки плоскости Лобачевского в векторные файлы SVG и PDF.
+
+Примитивы (точки, отрезки, дуги окружностей) передаются частями и сразу
+пишутся в файл, так что документ целиком в памяти не собирается: память
+на запись зависит от размера части, а не от числа объектов. Содержимое
+страницы PDF сжимается по ходу записи.
+
+Модуль не зависит от Qt: примитивы задаются массивами numpy в координатах
+единичного диска, как в слоях отрисовки p11_widgets.HypArea.
+"""
+import abc
+import os
+import re
+import zlib
+
+import numpy as np
+
+
+def _fixed(values, decimals):
+    # Числа с decimals знаками после точки: по строке ASCII на число, все одной ширины,
+    # лишнее место слева -- пробелы. Цифры всех чисел получаются векторно, по разряду
+    # за шаг, без форматирования каждого числа по отдельности.
+    values = np.asarray(values, np.float64)
+    scaled = np.round(np.abs(values) * 10 ** decimals).astype(np.int64)
+    negative = (values < 0) & (scaled > 0)
+    digits = max(len(str(int(scaled.max(initial=0)))), decimals + 1)
+    width = digits + (decimals > 0) + bool(negative.any())
+    out = np.full((len(values), width), ord(' '), np.uint8)
+    # сколько знаков занимает число без знака минус
+    length = np.zeros(len(values), np.int64)
+    column = width - 1
+    for k in range(digits):
+        if decimals and k == decimals:
+            out[:, column] = ord('.')
+            column -= 1
+        # дробная часть и единицы пишутся всегда, старшие разряды -- пока число не кончилось
+        shown = scaled > 0 if k > decimals else np.ones(len(values), np.bool_)
+        out[shown, column] = ord('0') + scaled[shown] % 10
+        length += shown
+        scaled //= 10
+        column -= 1
+    length += decimals > 0
+    rows = np.flatnonzero(negative)
+    out[rows, width - 1 - length[rows]] = ord('-')
+    return out
+
+
+def _rows(fmt, *columns):
+    # Строки текста по столбцам чисел: fmt -- шаблон строки с полями %.2f и %d, по
+    # полю на столбец. Числа пишутся в поля одной ширины на столбец (см. _fixed):
+    # пробелы -- разделители и в путях SVG, и в содержимом страниц PDF.
+    pieces = [piece.encode('ascii') for piece in re.split(r'%\.2f|%d', fmt)]
+    fields = [_fixed(column, 2 if field == '%.2f' else 0)
+              for field, column in zip(re.findall(r'%\.2f|%d', fmt), columns)]
+    out = np.empty((len(columns[0]), sum(map(len, pieces)) + sum(field.shape[1] for field in fields)), np.uint8)
+    position = 0
+    for piece, field in zip(pieces, fields + [None]):
+        out[:, position:position + len(piece)] = np.frombuffer(piece, np.uint8)
+        position += len(piece)
+        if field is not None:
+            out[:, position:position + field.shape[1]] = field
+            position += field.shape[1]
+    return out.tobytes()
+
+
+class HypVectorWriter(abc.ABC):
+    """
+    Запись отрисовки в векторный файл: единичный диск с центром center и
+    радиусом radius (в единицах страницы) на странице width x height,
+    ось y направлена вниз, как на экране.
+
+    Используется как контекстный менеджер: файл дописывается и закрывается
+    при выходе из блока with (или вызовом close).
+
+    Наследники пишут примитивы своего формата в методах _segments и _points
+    (координаты -- на странице) и _arcs (центры и радиусы -- в единичном диске).
+
+    Parameters
+    ----------
+    path: str
+    width, height: float
+      Размер страницы.
+    center: tuple
+      Центр диска (x, y).
+    radius: float
+      Радиус диска.
+    """
+    def __init__(self, path, width, height, center, radius):
+        self.width, self.height = width, height
+        self.center = center
+        self.radius = radius
+        self.file = open(path, 'wb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _page(self, x, y):
+        # координаты единичного диска -> координаты страницы
+        return self.center[0] + self.radius * np.asarray(x), self.center[1] + self.radius * np.asarray(y)
+
+    def absolute(self, color):
+        """
+        Нарисовать абсолют -- окружность единичного диска.
+        """
+        self._arcs(np.zeros(1), np.zeros(1), np.ones(1), np.zeros(1), np.full(1, 360.0), color)
+
+    def layer(self, points, segments, arcs, color, pointSize):
+        """
+        Нарисовать часть слоя одним цветом: отрезки, дуги и поверх них точки.
+
+        Parameters
+        ----------
+        points: numpy.ndarray
+          Координаты точек (n, 2).
+        segments: numpy.ndarray
+          Отрезки (m, 4): x, y начала и конца.
+        arcs: list
+          Наборы дуг (x, y центров окружностей, радиусы, начальные углы и
+          углы дуг в градусах; углы отсчитываются против часовой стрелки на
+          странице, как в QPainterPath.arcTo).
+        color: tuple
+          Цвет (r, g, b), 0..255.
+        pointSize: float
+          Диаметр точек в единицах страницы.
+        """
+        if len(segments):
+            self._segments(*self._page(segments[:, 0], segments[:, 1]), *self._page(segments[:, 2], segments[:, 3]),
+                           color)
+        for cx, cy, r, start, span in arcs:
+            if len(r):
+                self._arcs(cx, cy, r, start, span, color)
+        if len(points):
+            self._points(*self._page(points[:, 0], points[:, 1]), pointSize, color)
+
+    @abc.abstractmethod
+    def _segments(self, x1, y1, x2, y2, color):
+        pass
+
+    @abc.abstractmethod
+    def _arcs(self, cx, cy, r, start, span, color):
+        pass
+
+    @abc.abstractmethod
+    def _points(self, x, y, size, color):
+        pass
+
+    def close(self):
+        self.file.close()
+
+
+class HypSvgWriter(HypVectorWriter):
+    """
+    Запись отрисовки в SVG: на каждую часть -- по пути на отрезки, дуги и точки.
+    """
+    def __init__(self, path, width, height, center, radius):
+        super(HypSvgWriter, self).__init__(path, width, height, center, radius)
+        self._write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                    '<svg xmlns="http://www.w3.org/2000/svg" width="{0:g}" height="{1:g}" '
+                    'viewBox="0 0 {0:g} {1:g}">\n'.format(width, height))
+
+    def _write(self, text):
+        self.file.write(text if isinstance(text, bytes) else text.encode('ascii'))
+
+    def _path(self, d, color, width=None):
+        # путь с обводкой толщины width или, если width не задана, с заливкой
+        color = '#{:02x}{:02x}{:02x}'.format(*color)
+        if width is None:
+            self._write('<path fill="{}" stroke="none" d="'.format(color))
+        else:
+            self._write('<path fill="none" stroke="{}" stroke-width="{:g}" d="'.format(color, width))
+        self._write(d)
+        self._write('"/>\n')
+
+    def _segments(self, x1, y1, x2, y2, color):
+        self._path(_rows('M%.2f %.2fL%.2f %.2f', x1, y1, x2, y2), color, 1)
+
+    def _arcs(self, cx, cy, r, start, span, color):
+        x, y = self._page(cx, cy)
+        r = self.radius * np.asarray(r)
+        a, b = np.radians(start), np.radians(np.asarray(start) + span)
+        large = (np.abs(span) > 180).astype(np.int64)
+        # на странице y растёт вниз: дуга против часовой стрелки -- это sweep-flag 0
+        sweep = (np.asarray(span) < 0).astype(np.int64)
+        # полная окружность -- две половины, у дуги SVG концы не совпадают
+        full = np.abs(span) >= 360
+        m = np.where(full, a + np.pi, b)
+        large = np.where(full, 0, large)
+        d = _rows('M%.2f %.2fA%.2f %.2f 0 %d %d %.2f %.2f', x + r * np.cos(a), y - r * np.sin(a), r, r, large, sweep,
+                  x + r * np.cos(m), y - r * np.sin(m))
+        if full.any():
+            d += _rows('M%.2f %.2fA%.2f %.2f 0 0 %d %.2f %.2f', *(v[full] for v in (
+                x + r * np.cos(m), y - r * np.sin(m), r, r, sweep, x + r * np.cos(a), y - r * np.sin(a))))
+        self._path(d, color, 1)
+
+    def _points(self, x, y, size, color):
+        # точка -- залитый круг из двух полуокружностей (отрезки нулевой длины с
+        # круглыми концами рисуют не все программы просмотра)
+        r = np.full(len(x), size / 2)
+        self._path(_rows('M%.2f %.2fa%.2f %.2f 0 1 0 %.2f 0a%.2f %.2f 0 1 0 %.2f 0',
+                         x - r, y, r, r, 2 * r, r, r, -2 * r), color)
+
+    def close(self):
+        if not self.file.closed:
+            self._write('</svg>\n')
+        super(HypSvgWriter, self).close()
+
+
+class HypPdfWriter(HypVectorWriter):
+    """
+    Запись отрисовки в одностраничный PDF. Единица страницы -- пункт, дуги
+    приближаются кривыми Безье (по одной на четверть окружности и меньше).
+    Содержимое страницы сжимается и пишется по частям, его длина -- отдельным
+    объектом после него.
+    """
+    def __init__(self, path, width, height, center, radius):
+        super(HypPdfWriter, self).__init__(path, width, height, center, radius)
+        self._offsets = []
+        self.file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self._object('<< /Type /Catalog /Pages 2 0 R >>')
+        self._object('<< /Type /Pages /Kids [3 0 R] /Count 1 >>')
+        self._object('<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {:g} {:g}] /Contents 4 0 R /Resources << >> >>'
+                     .format(width, height))
+        self._offsets.append(self.file.tell())
+        self.file.write(b'4 0 obj\n<< /Length 5 0 R /Filter /FlateDecode >>\nstream\n')
+        self._streamStart = self.file.tell()
+        # быстрое сжатие: текст координат сжимается уровнем 1 почти так же, как 6, но в несколько раз быстрее
+        self._compressor = zlib.compressobj(1)
+        # в PDF ось y направлена вверх, а координаты страницы -- как на экране
+        self._write('1 0 0 -1 0 {:g} cm\n'.format(height))
+
+    def _object(self, text):
+        self._offsets.append(self.file.tell())
+        self.file.write('{} 0 obj\n{}\nendobj\n'.format(len(self._offsets), text).encode('ascii'))
+
+    def _write(self, text):
+        self.file.write(self._compressor.compress(text if isinstance(text, bytes) else text.encode('ascii')))
+
+    def _stroke(self, color, width, cap=0):
+        self._write('{:.4g} {:.4g} {:.4g} RG {:g} w {} J\n'.format(*(c / 255 for c in color), width, cap))
+
+    def _segments(self, x1, y1, x2, y2, color):
+        self._stroke(color, 1)
+        self._write(_rows('%.2f %.2f m %.2f %.2f l\n', x1, y1, x2, y2))
+        self._write('S\n')
+
+    def _arcs(self, cx, cy, r, start, span, color):
+        x, y = self._page(cx, cy)
+        r = self.radius * np.asarray(r)
+        span = np.asarray(span, np.float64)
+        # дуга режется на n кусков не больше 90 градусов, кусок -- кривая Безье
+        n = np.maximum(np.ceil(np.abs(span) / 90 - 1e-9), 1).astype(np.int64)
+        arc = np.repeat(np.arange(len(n)), n)
+        piece = np.arange(len(arc)) - np.repeat(np.cumsum(n) - n, n)
+        step = np.radians(span / n)[arc]
+        # угол против часовой стрелки при оси y, направленной вниз, -- это минус угол
+        a = -(np.radians(np.asarray(start, np.float64))[arc] + piece * step)
+        b = a - step
+        k = 4 / 3 * np.tan((b - a) / 4)
+        x, y, r = x[arc], y[arc], r[arc]
+        self._stroke(color, 1)
+        self._write(_rows('%.2f %.2f m %.2f %.2f %.2f %.2f %.2f %.2f c\n',
+                          x + r * np.cos(a), y + r * np.sin(a),
+                          x + r * (np.cos(a) - k * np.sin(a)), y + r * (np.sin(a) + k * np.cos(a)),
+                          x + r * (np.cos(b) + k * np.sin(b)), y + r * (np.sin(b) - k * np.cos(b)),
+                          x + r * np.cos(b), y + r * np.sin(b)))
+        self._write('S\n')
+
+    def _points(self, x, y, size, color):
+        # точка -- отрезок нулевой длины с круглыми концами
+        self._stroke(color, size, 1)
+        self._write(_rows('%.2f %.2f m %.2f %.2f l\n', x, y, x, y))
+        self._write('S\n')
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.file.write(self._compressor.flush())
+        length = self.file.tell() - self._streamStart
+        self.file.write(b'\nendstream\nendobj\n')
+        self._object(str(length))
+        xref = self.file.tell()
+        entries = ''.join('{:010d} 00000 n \n'.format(offset) for offset in self._offsets)
+        self.file.write('xref\n0 {}\n0000000000 65535 f \n{}trailer\n<< /Size {} /Root 1 0 R >>\nstartxref\n{}\n%%EOF\n'
+                        .format(len(self._offsets) + 1, entries, len(self._offsets) + 1, xref).encode('ascii'))
+        super(HypPdfWriter, self).close()
+
+
+# расширение файла -> класс записи
+WRITERS = {'.svg': HypSvgWriter, '.pdf': HypPdfWriter}
+
+
+def vectorWriter(path, width, height, center, radius):
+    """
+    Запись отрисовки в файл path, формат -- по расширению (.svg или .pdf),
+    см. HypVectorWriter.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in WRITERS:
+        raise ValueError('{}: unknown vector format, expected one of {}'.format(path, ', '.join(WRITERS)))
+    return WRITERS[extension](path, width, height, center, radius)
@@ -0,0 +1,104 @@
+"""
+Замер компактности объектов плоскости Лобачевского: сколько байт занимает
+одна точка и одна прямая (в сравнении с прежними dataclass-ами и с массивами
+HypPointArray/HypLineArray) и сколько пересчётов между моделями экономит
+кэш в HypPoint.
+
+Запуск:
+  python p11_footprint.py [число объектов]
+"""
+import sys
+import random
+import tracemalloc
+from dataclasses import dataclass
+
+from p11_hyperbolic import (HypModel, HypPoint, HypLine, HypPointArray, HypLineArray, HypTransform,
+                            drawLineThroughPoints, conversionStats, resetConversionStats)
+
+
+@dataclass(frozen=True)
+class LegacyPoint:
+    # прежнее представление точки, только для сравнения
+    z: complex
+    m: HypModel = HypModel.BeltramiKlein
+
+
+@dataclass(unsafe_hash=True, init=False)
+class LegacyLine:
+    # прежнее представление прямой, только для сравнения
+    a: float
+    b: float
+    c: float
+
+    def __init__(self, a, b, c):
+        n = (a ** 2 + b ** 2) ** 0.5
+        self.a, self.b, self.c = a / n, b / n, c / n
+
+
+def bytesPerObject(make, n):
+    """
+    Сколько байт в среднем занимает один объект, созданный make(i),
+    вместе со всем, на что он ссылается единолично.
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [make(i) for i in range(n)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # список ссылок на объекты к самим объектам не относится
+    return (after - before - sys.getsizeof(objects)) / len(objects)
+
+
+def randomPoints(n, rng):
+    points = []
+    while len(points) < n:
+        z = complex(rng.uniform(-1, 1), rng.uniform(-1, 1))
+        if abs(z) < 1:
+            points.append(HypPoint(z, rng.choice([HypModel.BeltramiKlein, HypModel.Poincare])))
+    return points
+
+
+def conversionWorkload(points, frames=3):
+    """
+    Типичная работа с точками: несколько кадров отрисовки через преобразование,
+    вывод в список и построение прямых через соседние точки.
+
+    Returns
+    -------
+    dict
+      См. conversionStats.
+    """
+    transform = HypTransform.pToQ(HypPoint(0j), HypPoint(0.3 + 0.1j))
+    resetConversionStats()
+    for _ in range(frames):
+        for p in points:
+            transform(p)
+    for p in points:
+        str(p)
+    for p, q in zip(points, points[1:]):
+        drawLineThroughPoints(p, q)
+    return conversionStats()
+
+
+def main(n):
+    rng = random.Random(0)
+    coords = [complex(rng.uniform(-0.7, 0.7), rng.uniform(-0.7, 0.7)) for _ in range(n)]
+    abc = [(rng.uniform(-1, 1), rng.uniform(-1, 1), rng.uniform(-1, 1)) for _ in range(n)]
+
+    print('bytes per object, n = {}'.format(n))
+    print('  LegacyPoint   {:8.1f}'.format(bytesPerObject(lambda i: LegacyPoint(coords[i] + 0), n)))
+    print('  HypPoint      {:8.1f}'.format(bytesPerObject(lambda i: HypPoint(coords[i] + 0), n)))
+    print('  HypPointArray {:8.1f}'.format(bytesPerObject(lambda i: HypPointArray(coords), 1) / n))
+    print('  LegacyLine    {:8.1f}'.format(bytesPerObject(lambda i: LegacyLine(*abc[i]), n)))
+    print('  HypLine       {:8.1f}'.format(bytesPerObject(lambda i: HypLine(*abc[i]), n)))
+    a, b, c = zip(*abc)
+    print('  HypLineArray  {:8.1f}'.format(bytesPerObject(lambda i: HypLineArray(a, b, c), 1) / n))
+
+    stats = conversionWorkload(randomPoints(n, rng))
+    total = stats['computed'] + stats['cached']
+    print('model conversions: {} requested, {} computed, {} saved ({:.0%})'.format(
+        total, stats['computed'], stats['cached'], stats['cached'] / max(total, 1)))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
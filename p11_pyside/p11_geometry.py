@@ -0,0 +1,2149 @@
+"""
+Геометрия плоскости Лобачевского: точки и прямые в моделях Бельтрами-Клейна
+и Пуанкаре, их массивы, построения, преобразования плоскости и правильные
+разбиения, хранилища объектов, граф зависимостей построенных объектов, история
+правок и файлы сцен.
+
+Модуль не зависит от Qt, поэтому годится для расчётов без графического
+интерфейса; виджеты для отрисовки -- в p11_widgets. Вычисления над массивами
+точек, прямых и преобразований идут через ядра p11_kernels, реализацию
+которых можно выбрать; одиночные точки, прямые и преобразования считаются
+формулами на обычных числах.
+"""
+import abc
+from collections import deque
+from enum import Enum
+import json
+import os
+import struct
+import numpy as np
+
+import p11_kernels as kernels
+from p11_index import (HypIncrementalIndex, HypDedupeIndex, HypChordSweep, GRID_TOLERANCE, gridKeys,
+                       sortedContains)
+
+
+class HypModel(Enum):
+    """
+    Модели плоскости Лобачевского. Простой перечислительный тип для удобства.
+    """
+    BeltramiKlein = 0
+    Poincare = 1
+
+
+# счётчики пересчётов координат между моделями: [посчитано, взято из кэша]
+_conversionStats = [0, 0]
+
+
+def conversionStats():
+    """
+    Статистика пересчётов координат точек между моделями с момента запуска
+    или последнего resetConversionStats.
+
+    Returns
+    -------
+    dict
+      computed -- сколько раз координаты действительно пересчитывались,
+      cached -- сколько пересчётов удалось не делать благодаря кэшу в HypPoint.
+    """
+    return {'computed': _conversionStats[0], 'cached': _conversionStats[1]}
+
+
+def resetConversionStats():
+    """
+    Обнулить счётчики conversionStats.
+    """
+    _conversionStats[0] = _conversionStats[1] = 0
+
+
+class HypPoint:
+    """
+    Класс для точек плоскости Лобачевского. Координаты точек заданы в модели Бельтрами-Клейна.
+
+    Точки неизменяемые и компактные: атрибуты лежат в __slots__, без словаря
+    на каждый объект. Координаты в другой модели запоминаются при первом
+    вызове toModel, так что повторные пересчёты (в т.ч. туда и обратно)
+    корень уже не извлекают.
+
+    Parameters
+    ----------
+    z: complex
+      Координаты точки в какой-либо модели плоскости.
+    m: HypModel
+      Модель, в которой заданы координаты.
+    """
+    __slots__ = ('z', 'm', '_other')
+
+    def __init__(self, z, m=HypModel.BeltramiKlein, _other=None):
+        object.__setattr__(self, 'z', z)
+        object.__setattr__(self, 'm', m)
+        # координаты той же точки во второй из моделей, если уже известны
+        object.__setattr__(self, '_other', _other)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('cannot assign to field {!r}'.format(name))
+
+    def __eq__(self, other):
+        if other.__class__ is not HypPoint:
+            return NotImplemented
+        return self.z == other.z and self.m is other.m
+
+    def __hash__(self):
+        return hash((self.z, self.m))
+
+    def __repr__(self):
+        return 'HypPoint(z={!r}, m={!r})'.format(self.z, self.m)
+
+    def __reduce__(self):
+        return HypPoint, (self.z, self.m)
+
+    def isValid(self):
+        """
+        Лежит ли точка в плоскости Лобачевского?
+
+        Returns
+        -------
+        bool
+          Если лежит, то True.
+        """
+        return abs(self.z) < 1.0
+
+    def __str__(self):
+        bk = self.toModel(HypModel.BeltramiKlein)
+        return 'x={:.06f}, y={:.06f}'.format(bk.z.real, bk.z.imag)
+
+    def toModel(self, m):
+        """
+        Приведение координат к какой-либо модели.
+
+        Parameters
+        ----------
+        m: HypModel
+          Модель, к которой приводить координаты.
+
+        Returns
+        -------
+        HypPoint
+          Точка с координатами в новой модели.
+        """
+        if self.m is m:
+            return self
+        elif self._other is not None and isinstance(m, HypModel):
+            _conversionStats[1] += 1
+            return HypPoint(self._other, m, self.z)
+        elif self.m is HypModel.BeltramiKlein and m is HypModel.Poincare:
+            w = self.z / (1 + (1 - abs(self.z) ** 2) ** 0.5)
+        elif self.m is HypModel.Poincare and m is HypModel.BeltramiKlein:
+            w = 2 * self.z / (1 + abs(self.z) ** 2)
+        else:
+            raise ValueError('unknown hyperbolic model {}'.format(m))
+        _conversionStats[0] += 1
+        object.__setattr__(self, '_other', w)
+        # новая точка помнит исходные координаты, но не саму точку:
+        # так не образуется циклических ссылок
+        return HypPoint(w, m, self.z)
+
+
+class HypLine:
+    """
+    Прямая на плоскости Лобачевского. Задаётся прямой в модели Бельтрами-Клейна:
+      a x + b y + c = 0
+    При создании каждого объекта коэффициенты приводятся к a**2 + b**2 = 1.
+
+    Как и точки, прямые неизменяемые и хранятся в __slots__.
+
+    Parameters
+    ----------
+    a, b, c
+      коэффициенты, задающие прямую в модели Бельтрами-Клейна.
+    """
+    __slots__ = ('a', 'b', 'c')
+
+    def __init__(self, a, b, c):
+        n = (a ** 2 + b ** 2) ** 0.5
+        object.__setattr__(self, 'a', a / n)
+        object.__setattr__(self, 'b', b / n)
+        object.__setattr__(self, 'c', c / n)
+
+    @staticmethod
+    def _fromNormalized(a, b, c):
+        # прямая из уже нормированных коэффициентов, без повторной нормировки
+        line = object.__new__(HypLine)
+        object.__setattr__(line, 'a', a)
+        object.__setattr__(line, 'b', b)
+        object.__setattr__(line, 'c', c)
+        return line
+
+    def __setattr__(self, name, value):
+        raise AttributeError('cannot assign to field {!r}'.format(name))
+
+    def __eq__(self, other):
+        if other.__class__ is not HypLine:
+            return NotImplemented
+        return self.a == other.a and self.b == other.b and self.c == other.c
+
+    def __hash__(self):
+        return hash((self.a, self.b, self.c))
+
+    def __repr__(self):
+        return 'HypLine(a={!r}, b={!r}, c={!r})'.format(self.a, self.b, self.c)
+
+    def __reduce__(self):
+        return HypLine._fromNormalized, (self.a, self.b, self.c)
+
+    def isValid(self):
+        """
+        Проверка на то, лежит ли вообще прямая с соответствующими коэффициентами в плоскости Лобачевского.
+
+        Returns
+        -------
+        bool
+          True, если прямая лежит в плоскости.
+        """
+        return abs(self.c) < 1
+
+    def idealPoints(self, m=HypModel.BeltramiKlein):
+        """
+        Вычисление идеальных точек прямой, т.е. точек абсолюта, к которым подходит прямая.
+
+        Parameters
+        ----------
+        m
+          В какой модели возвращать точки прямой. В обоих моделях координаты точек одинаковые,
+          поэтому этот параметр не влияет на расчёт, а только на то, каковы будут соответствующие
+          флаги у точек.
+
+        Returns
+        -------
+        p
+          Одна из идеальных точек.
+        q
+          Вторая из идеальных точек.
+        """
+        a, b, c = self.a, self.b, self.c
+        nc = (1 - c ** 2) ** 0.5
+        zp = complex(-a * c - b * nc, -b * c + a * nc)
+        zq = complex(-a * c + b * nc, -b * c - a * nc)
+        # на абсолюте координаты в обеих моделях совпадают, поэтому "другие"
+        # координаты у идеальных точек известны сразу
+        return HypPoint(zp, m, zp), HypPoint(zq, m, zq)
+
+    def pole(self):
+        """
+        Полюс прямой. Выделенная точка вне плоскости Лобачевского. С её помощью
+        проводятся некоторые построения, в т.ч. построение перпендекуляра.
+
+        Returns
+        -------
+        HypPoint
+          Полюс.
+        """
+        p, q = self.idealPoints()
+        return intersectLines(HypLine(p.z.real, p.z.imag, -1), HypLine(q.z.real, q.z.imag, -1))
+
+    def __str__(self):
+        return '{:.06f} x + {:.06f} y + {:.06f} = 0'.format(self.a, self.b, self.c)
+
+
+def drawLineThroughPoints(p, q):
+    """
+    Провести прямую через две точки.
+
+    Parameters
+    ----------
+    p: HypPoint
+      Одна из точек.
+    q: HypPoint
+      Вторая.
+
+    Returns
+    -------
+    HypLine
+      Прямая, проходящая через точки p и q.
+    """
+    p = p.toModel(HypModel.BeltramiKlein).z
+    q = q.toModel(HypModel.BeltramiKlein).z
+    return HypLine(p.imag - q.imag, q.real - p.real, p.real * q.imag - p.imag * q.real)
+
+
+def intersectLines(l1, l2):
+    """
+    Точка пересечения прямых. Если прямые расходятся, то точка может оказаться не валидной.
+
+    Parameters
+    ----------
+    l1: HypLine
+      Одна из прямых для пересечения.
+    l2: HypLine
+      Вторая прямая для поиска пересечения.
+
+    Returns
+    -------
+    HypPoint
+      Точка. В модели Бельтрами-Клейна. Может оказаться вне плоскости, если прямые расходятся.
+    """
+    d = l1.a * l2.b - l1.b * l2.a
+    return HypPoint(complex((l1.b * l2.c - l2.b * l1.c) / d, (l2.a * l1.c - l1.a * l2.c) / d))
+
+
+def drawPerpendicular(line, p):
+    """
+    Построение перпендикуляра к прямой через точку.
+
+    Parameters
+    ----------
+    line: HypLine
+      Прямая, к которой строить перпендикуляр.
+    p: HypPoint
+      Точка, через которую проводить перпендикуляр.
+
+    Returns
+    -------
+    HypLine
+      Прямая, перпендикулярная line и проходящая через p.
+    """
+    q = line.pole()
+    return drawLineThroughPoints(p, q)
+
+
+def drawParallels(line, point):
+    """
+    Провести две параллельных прямых через точку вне прямой. В геометрии
+    Лобачевского это прямые, ограничивающие конус всевозможных прямых,
+    проходящих через заданную точку вне прямой и не пересекающихся с данной.
+
+    Parameters
+    ----------
+    line
+      Прямая, параллельные к которой проводить.
+
+    point
+      Точка, через которую проводить параллельные.
+
+    Returns
+    -------
+    tuple
+      Пара из двух HypLine.
+    """
+    p, q = line.idealPoints()
+    return drawLineThroughPoints(p, point), drawLineThroughPoints(q, point)
+
+
+def pointDistance(p, q):
+    """
+    Гиперболическое расстояние между точками.
+
+    Считается в модели Пуанкаре: cosh d = 1 + 2 |p - q|**2 / ((1 - |p|**2)(1 - |q|**2)),
+    то есть d = 2 arsinh(|p - q| / sqrt((1 - |p|**2)(1 - |q|**2))), что точно
+    и для близких точек.
+
+    Parameters
+    ----------
+    p, q: HypPoint
+
+    Returns
+    -------
+    float
+    """
+    p = p.toModel(HypModel.Poincare).z
+    q = q.toModel(HypModel.Poincare).z
+    return float(2 * np.arcsinh(abs(p - q) / ((1 - abs(p) ** 2) * (1 - abs(q) ** 2)) ** 0.5))
+
+
+class HypPointArray:
+    """
+    Массив точек плоскости Лобачевского. Координаты всех точек хранятся одним
+    столбцом complex128 в одной и той же модели. Индексация целым числом
+    возвращает обычный HypPoint, срезом или маской -- снова HypPointArray.
+
+    Parameters
+    ----------
+    z: array_like
+      Координаты точек в какой-либо модели плоскости.
+    m: HypModel
+      Модель, в которой заданы координаты.
+    """
+    def __init__(self, z=(), m=HypModel.BeltramiKlein):
+        self.z = np.ascontiguousarray(z, dtype=np.complex128).reshape(-1)
+        self.m = m
+
+    @staticmethod
+    def fromPoints(points, m=HypModel.BeltramiKlein):
+        """
+        Собрать массив из последовательности HypPoint.
+
+        Parameters
+        ----------
+        points
+          Точки, в любых моделях.
+        m: HypModel
+          Модель, в которой хранить координаты массива.
+
+        Returns
+        -------
+        HypPointArray
+        """
+        return HypPointArray([p.toModel(m).z for p in points], m)
+
+    def __len__(self):
+        return len(self.z)
+
+    def __getitem__(self, i):
+        if isinstance(i, (int, np.integer)):
+            return HypPoint(complex(self.z[i]), self.m)
+        return HypPointArray(self.z[i], self.m)
+
+    def __iter__(self):
+        m = self.m
+        return (HypPoint(z, m) for z in self.z.tolist())
+
+    def isValid(self):
+        """
+        Какие из точек лежат в плоскости Лобачевского?
+
+        Returns
+        -------
+        numpy.ndarray
+          Булев массив, True для точек внутри абсолюта.
+        """
+        return np.abs(self.z) < 1.0
+
+    def toModel(self, m):
+        """
+        Приведение координат всех точек к какой-либо модели.
+
+        Parameters
+        ----------
+        m: HypModel
+          Модель, к которой приводить координаты.
+
+        Returns
+        -------
+        HypPointArray
+          Массив точек с координатами в новой модели.
+        """
+        if self.m == m:
+            return self
+        elif self.m == HypModel.BeltramiKlein and m == HypModel.Poincare:
+            # точки вне абсолюта превращаются в nan, а не в комплексный корень
+            return HypPointArray(kernels.toPoincare(self.z), m)
+        elif self.m == HypModel.Poincare and m == HypModel.BeltramiKlein:
+            return HypPointArray(kernels.toKlein(self.z), m)
+        else:
+            raise ValueError('unknown hyperbolic model {}'.format(m))
+
+
+class HypLineArray:
+    """
+    Массив прямых плоскости Лобачевского. Коэффициенты a, b, c прямых
+    a x + b y + c = 0 в модели Бельтрами-Клейна хранятся тремя столбцами float64
+    и, как и у HypLine, нормируются к a**2 + b**2 = 1. Вырожденные прямые
+    (например, через две совпадающие точки) получают коэффициенты nan
+    и считаются невалидными.
+
+    Parameters
+    ----------
+    a, b, c: array_like
+      Коэффициенты прямых в модели Бельтрами-Клейна.
+    normalized: bool
+      Если True, то коэффициенты уже нормированы и копируются как есть.
+    """
+    def __init__(self, a=(), b=(), c=(), normalized=False):
+        a, b, c = np.broadcast_arrays(*(np.asarray(x, dtype=np.float64).reshape(-1) for x in (a, b, c)))
+        if not normalized:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                n = np.hypot(a, b)
+                a, b, c = a / n, b / n, c / n
+        self.a = np.ascontiguousarray(a)
+        self.b = np.ascontiguousarray(b)
+        self.c = np.ascontiguousarray(c)
+
+    @staticmethod
+    def fromLines(lines):
+        """
+        Собрать массив из последовательности HypLine.
+
+        Returns
+        -------
+        HypLineArray
+        """
+        coeffs = np.array([(line.a, line.b, line.c) for line in lines], dtype=np.float64).reshape(-1, 3)
+        return HypLineArray(coeffs[:, 0], coeffs[:, 1], coeffs[:, 2], normalized=True)
+
+    def __len__(self):
+        return len(self.a)
+
+    def __getitem__(self, i):
+        if isinstance(i, (int, np.integer)):
+            return HypLine._fromNormalized(float(self.a[i]), float(self.b[i]), float(self.c[i]))
+        return HypLineArray(self.a[i], self.b[i], self.c[i], normalized=True)
+
+    def __iter__(self):
+        return (HypLine._fromNormalized(a, b, c) for a, b, c in zip(self.a.tolist(), self.b.tolist(), self.c.tolist()))
+
+    def isValid(self):
+        """
+        Какие из прямых лежат в плоскости Лобачевского?
+
+        Returns
+        -------
+        numpy.ndarray
+          Булев массив, True для прямых, пересекающих абсолют.
+        """
+        return np.abs(self.c) < 1
+
+    def idealPoints(self, m=HypModel.BeltramiKlein):
+        """
+        Идеальные точки всех прямых, см. HypLine.idealPoints.
+
+        Returns
+        -------
+        p: HypPointArray
+          Первые идеальные точки прямых.
+        q: HypPointArray
+          Вторые идеальные точки прямых.
+        """
+        p, q = kernels.idealPoints(self.a, self.b, self.c)
+        return HypPointArray(p, m), HypPointArray(q, m)
+
+    def pole(self):
+        """
+        Полюса всех прямых. Полюс прямой a x + b y + c = 0 -- это точка -(a, b) / c,
+        поэтому, в отличие от HypLine.pole, пересекать касательные не нужно.
+        Для прямых через центр диска полюс уходит на бесконечность.
+
+        Returns
+        -------
+        HypPointArray
+          Полюса в модели Бельтрами-Клейна.
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return HypPointArray(-(self.a + 1j * self.b) / self.c)
+
+
+def _joinPoints(px, py, qx, qy, qw=1.0):
+    # прямая через две точки в однородных координатах (px, py, 1) и (qx, qy, qw)
+    return HypLineArray(py * qw - qy, qx - px * qw, px * qy - py * qx)
+
+
+def drawLineThroughPointsBatch(p, q):
+    """
+    Провести прямые через пары точек, см. drawLineThroughPoints.
+
+    Parameters
+    ----------
+    p: HypPointArray
+      Первые точки пар.
+    q: HypPointArray
+      Вторые точки пар. Длины p и q должны совпадать (или одна из них равна 1).
+
+    Returns
+    -------
+    HypLineArray
+      Прямые, i-ая из которых проходит через p[i] и q[i].
+    """
+    p = p.toModel(HypModel.BeltramiKlein).z
+    q = q.toModel(HypModel.BeltramiKlein).z
+    return _joinPoints(p.real, p.imag, q.real, q.imag)
+
+
+def intersectLinesBatch(l1, l2):
+    """
+    Точки пересечения пар прямых, см. intersectLines.
+
+    Parameters
+    ----------
+    l1: HypLineArray
+      Первые прямые пар.
+    l2: HypLineArray
+      Вторые прямые пар.
+
+    Returns
+    -------
+    HypPointArray
+      Точки в модели Бельтрами-Клейна. Для расходящихся прямых могут оказаться
+      вне плоскости, для совпадающих или параллельных в модели БК -- бесконечными.
+    """
+    return HypPointArray(kernels.intersect(l1.a, l1.b, l1.c, l2.a, l2.b, l2.c))
+
+
+def intersectAllLinePairs(lines, chunkSize=1 << 15):
+    """
+    Все пары прямых, пересекающихся в плоскости Лобачевского.
+
+    Прямые модели Бельтрами-Клейна -- хорды единичного круга, и пересекаются они
+    в плоскости, только если их концы на абсолюте чередуются. Такие пары находит
+    заметание по концам хорд (HypChordSweep) за O((n + k) log n), где k -- число
+    пересечений, вместо перебора всех n (n - 1) / 2 пар.
+
+    Parameters
+    ----------
+    lines: HypLineArray
+      Прямые; не пересекающие абсолют пропускаются.
+    chunkSize: int
+      Примерное число пар в одной части результата.
+
+    Yields
+    ------
+    i, j: numpy.ndarray
+      Номера прямых очередных пар в lines.
+    fraction: float
+      Доля выполненной работы.
+    """
+    valid = np.flatnonzero(lines.isValid())
+    p, q = lines[valid].idealPoints()
+    sweep = HypChordSweep(np.angle(p.z), np.angle(q.z))
+    n = len(sweep)
+    # хорд за раз берётся столько, чтобы пар было около chunkSize; сначала --
+    # в расчёте на худший случай, дальше -- по числу пар на хорду в прошлый раз
+    step = max(1, 4 * chunkSize // max(n, 1))
+    lo = 0
+    while lo < n:
+        hi = min(lo + step, n)
+        i, j = sweep.crossings(lo, hi)
+        for k in range(0, len(i), chunkSize):
+            yield valid[i[k:k + chunkSize]], valid[j[k:k + chunkSize]], hi / n
+        step = int(min(4 * step, max(1, step * chunkSize // max(len(i), 1))))
+        lo = hi
+
+
+def intersectAllLinesBatch(lines, chunkSize=1 << 15):
+    """
+    Точки пересечения всех пар прямых, пересекающихся в плоскости Лобачевского,
+    см. intersectAllLinePairs.
+
+    Yields
+    ------
+    points: HypPointArray
+      Очередные точки пересечения в модели Бельтрами-Клейна.
+    fraction: float
+      Доля выполненной работы.
+    """
+    for i, j, fraction in intersectAllLinePairs(lines, chunkSize):
+        yield intersectLinesBatch(lines[i], lines[j]), fraction
+
+
+def drawPerpendicularBatch(lines, points):
+    """
+    Перпендикуляры к прямым через точки, см. drawPerpendicular.
+
+    Прямая проводится через точку и полюс в однородных координатах, поэтому
+    перпендикуляры к прямым через центр диска (с полюсом на бесконечности)
+    тоже строятся.
+
+    Parameters
+    ----------
+    lines: HypLineArray
+      Прямые, к которым строить перпендикуляры.
+    points: HypPointArray
+      Точки, через которые проводить перпендикуляры.
+
+    Returns
+    -------
+    HypLineArray
+      Прямые, i-ая из которых перпендикулярна lines[i] и проходит через points[i].
+    """
+    p = points.toModel(HypModel.BeltramiKlein).z
+    # знак однородной координаты полюса выбран так, чтобы коэффициенты совпали
+    # с drawPerpendicular и по знаку
+    s = np.where(lines.c > 0, -1.0, 1.0)
+    return _joinPoints(p.real, p.imag, s * lines.a, s * lines.b, -s * lines.c)
+
+
+def drawParallelsBatch(lines, points):
+    """
+    Параллельные к прямым через точки, см. drawParallels.
+
+    Returns
+    -------
+    tuple
+      Пара из двух HypLineArray: параллельные через первые и через вторые
+      идеальные точки прямых.
+    """
+    p, q = lines.idealPoints()
+    return drawLineThroughPointsBatch(p, points), drawLineThroughPointsBatch(q, points)
+
+
+def pointDistanceBatch(p, q):
+    """
+    Расстояния между парами точек, см. pointDistance.
+
+    Parameters
+    ----------
+    p, q: HypPointArray
+      Длины p и q должны совпадать (или одна из них равна 1).
+
+    Returns
+    -------
+    numpy.ndarray
+      Расстояние от p[i] до q[i].
+    """
+    p = p.toModel(HypModel.Poincare).z
+    q = q.toModel(HypModel.Poincare).z
+    return 2 * np.arcsinh(np.abs(p - q) / np.sqrt((1 - p.real ** 2 - p.imag ** 2) * (1 - q.real ** 2 - q.imag ** 2)))
+
+
+def _trilIndices(lo, hi):
+    # пары (i, j), j < i, с номерами lo..hi-1 в порядке np.tril_indices:
+    # номер пары t = i (i - 1) / 2 + j, отсюда i -- целая часть корня уравнения
+    t = np.arange(lo, hi, dtype=np.int64)
+    i = ((1 + np.sqrt(1 + 8 * t.astype(np.float64))) / 2).astype(np.int64)
+    # поправка на ошибки округления корня
+    i -= i * (i - 1) // 2 > t
+    i += (i + 1) * i // 2 <= t
+    return i, t - i * (i - 1) // 2
+
+
+class HypTransform:
+    def __init__(self, a, b):
+        """
+        Преобразование плоскости Лобачевского. Задаётся двумя параметрами как
+        дробно-линейное преобразование модели Пуанкаре на диске:
+        z -> (a z + b) / (b^* z + a^*)
+
+        Конструктор нормирует параметры к соотношению |a|**2 - |b|**2 = 1.
+
+        Parameters
+        ----------
+        a
+          Параметр преобразования.
+
+        b
+          Параметр преобразования.
+        """
+        n = (a * a.conjugate() - b * b.conjugate()) ** 0.5
+        self.a = a / n
+        self.b = b / n
+
+    def __mul__(self, other):
+        """
+        Композиция преобразований.
+        """
+        if not isinstance(other, HypTransform):
+            return NotImplemented
+        return HypTransform(self.a * other.a + self.b * other.b.conjugate(),
+                            self.a * other.b + self.b * other.a.conjugate())
+
+    @property
+    def inv(self):
+        """
+        Обратное преобразование.
+        """
+        return HypTransform(self.a.conjugate(), -self.b)
+
+    @staticmethod
+    def identity():
+        """
+        Тождественное преобразование.
+        """
+        return HypTransform(1 + 0j, 0j)
+
+    def __call__(self, point):
+        """
+        Применение преобразования к точке или, одним векторным вызовом,
+        к массиву точек HypPointArray.
+        """
+        if isinstance(point, HypPointArray):
+            return HypPointArray(self.apply(point.toModel(HypModel.Poincare).z), HypModel.Poincare)
+        z = point.toModel(HypModel.Poincare).z
+        a = self.a
+        b = self.b
+        w = (a * z + b) / (b.conjugate() * z + a.conjugate())
+        return HypPoint(w, HypModel.Poincare)
+
+    def apply(self, z):
+        """
+        Применение преобразования к массиву координат в модели Пуанкаре.
+
+        Parameters
+        ----------
+        z: numpy.ndarray
+          Комплексные координаты точек в модели Пуанкаре.
+
+        Returns
+        -------
+        numpy.ndarray
+          Координаты образов в модели Пуанкаре.
+        """
+        return kernels.moebius(self.a, self.b, z)
+
+    @staticmethod
+    def pToQ(p, q):
+        """
+        Преобразование переноса вдоль прямой, переводящее одну точку в другую.
+
+        Parameters
+        ----------
+        p: HypPoint
+          Точка, которую преобразование должно перенести.
+        q: HypPoint
+          Точка, в которую должна быть перенесена исходная.
+
+        Returns
+        -------
+        HypTransform
+          Преобразование, переносящее точку p в точку q вдоль прямой pq.
+        """
+        p = p.toModel(HypModel.Poincare).z
+        q = q.toModel(HypModel.Poincare).z
+        p2 = abs(p) ** 2
+        q2 = abs(q) ** 2
+        return HypTransform(1 - 2 * p.conjugate() * q + p2 * q2, (1 + p2) * q - (1 + q2) * p)
+
+
+class HypTransformArray:
+    """
+    Стопка преобразований плоскости Лобачевского. Каждое преобразование --
+    матрица из SU(1,1)
+      [[a,   b  ],
+       [b^*, a^*]],
+    поэтому хранятся только два комплексных столбца a и b. Композиция,
+    обращение и применение к точкам выполняются поэлементно (с обычными
+    правилами broadcasting numpy) одним векторным выражением.
+
+    Parameters
+    ----------
+    a, b: array_like
+      Параметры преобразований, см. HypTransform. Нормируются к |a|**2 - |b|**2 = 1.
+    """
+    def __init__(self, a=(), b=()):
+        a, b = np.broadcast_arrays(*(np.asarray(x, dtype=np.complex128).reshape(-1) for x in (a, b)))
+        n = np.sqrt(a.real ** 2 + a.imag ** 2 - b.real ** 2 - b.imag ** 2)
+        self.a = a / n
+        self.b = b / n
+
+    @staticmethod
+    def fromTransforms(transforms):
+        """
+        Собрать стопку из последовательности HypTransform.
+        """
+        ab = np.array([(t.a, t.b) for t in transforms], dtype=np.complex128).reshape(-1, 2)
+        return HypTransformArray(ab[:, 0], ab[:, 1])
+
+    @staticmethod
+    def fromMatrices(matrices):
+        """
+        Собрать стопку из массива матриц формы (n, 2, 2). Используется только
+        первая строка каждой матрицы, вторая в SU(1,1) ей однозначно задаётся.
+        """
+        matrices = np.asarray(matrices, dtype=np.complex128).reshape(-1, 2, 2)
+        return HypTransformArray(matrices[:, 0, 0], matrices[:, 0, 1])
+
+    @staticmethod
+    def identity(n):
+        """
+        Стопка из n тождественных преобразований.
+        """
+        return HypTransformArray(np.ones(n, dtype=np.complex128), np.zeros(n, dtype=np.complex128))
+
+    @staticmethod
+    def pToQ(p, q):
+        """
+        Переносы вдоль прямых, переводящие p[i] в q[i], см. HypTransform.pToQ.
+
+        Parameters
+        ----------
+        p: HypPointArray
+          Точки, которые нужно перенести.
+        q: HypPointArray
+          Точки, в которые они должны быть перенесены.
+
+        Returns
+        -------
+        HypTransformArray
+        """
+        return HypTransformArray(*kernels.pToQ(p.toModel(HypModel.Poincare).z, q.toModel(HypModel.Poincare).z))
+
+    def matrices(self):
+        """
+        Преобразования в виде массива матриц формы (n, 2, 2).
+        """
+        return np.stack([np.stack([self.a, self.b], -1),
+                         np.stack([self.b.conjugate(), self.a.conjugate()], -1)], -2)
+
+    def __len__(self):
+        return len(self.a)
+
+    def __getitem__(self, i):
+        if isinstance(i, (int, np.integer)):
+            return HypTransform(complex(self.a[i]), complex(self.b[i]))
+        return HypTransformArray(self.a[i], self.b[i])
+
+    def __iter__(self):
+        return (HypTransform(a, b) for a, b in zip(self.a.tolist(), self.b.tolist()))
+
+    def __mul__(self, other):
+        """
+        Поэлементная композиция со стопкой или с одиночным преобразованием.
+        """
+        if not isinstance(other, (HypTransform, HypTransformArray)):
+            return NotImplemented
+        return HypTransformArray(self.a * other.a + self.b * np.conjugate(other.b),
+                                 self.a * other.b + self.b * np.conjugate(other.a))
+
+    def __rmul__(self, other):
+        if not isinstance(other, HypTransform):
+            return NotImplemented
+        return HypTransformArray(other.a * self.a + other.b * self.b.conjugate(),
+                                 other.a * self.b + other.b * self.a.conjugate())
+
+    @property
+    def inv(self):
+        """
+        Поэлементно обратные преобразования.
+        """
+        return HypTransformArray(self.a.conjugate(), -self.b)
+
+    def prod(self):
+        """
+        Композиция всей стопки t[0] * t[1] * ... * t[n - 1] в одно преобразование.
+        Перемножение идёт попарно, так что требуется лишь log2(n) векторных шагов.
+
+        Returns
+        -------
+        HypTransform
+        """
+        a, b = self.a, self.b
+        if len(a) == 0:
+            return HypTransform.identity()
+        while len(a) > 1:
+            # нечётный хвост откладываем до следующего шага
+            tail_a, tail_b = a[len(a) // 2 * 2:], b[len(b) // 2 * 2:]
+            a1, b1, a2, b2 = a[0:-1:2], b[0:-1:2], a[1::2], b[1::2]
+            a = np.concatenate([a1 * a2 + b1 * b2.conjugate(), tail_a])
+            b = np.concatenate([a1 * b2 + b1 * a2.conjugate(), tail_b])
+        return HypTransform(complex(a[0]), complex(b[0]))
+
+    def apply(self, z):
+        """
+        Применение i-го преобразования к i-ой точке (координаты в модели Пуанкаре).
+        Для применения всех преобразований ко всем точкам сразу можно передать
+        z[None, :] и получить матрицу размера (число преобразований, число точек).
+        """
+        a = self.a if np.ndim(z) < 2 else self.a[:, None]
+        b = self.b if np.ndim(z) < 2 else self.b[:, None]
+        return kernels.moebius(a, b, z)
+
+    def __call__(self, points):
+        """
+        Применение i-го преобразования к i-ой точке массива HypPointArray.
+        """
+        return HypPointArray(self.apply(points.toModel(HypModel.Poincare).z), HypModel.Poincare)
+
+
+def groupOrbit(generators, radius, base=HypPoint(0j), limit=None):
+    """
+    Элементы группы, порождённой преобразованиями generators, -- обход в ширину
+    слов из порождающих. Слово следующего слоя -- это слово текущего слоя,
+    умноженное справа на порождающее, так что каждое произведение считается один
+    раз (от уже посчитанного префикса), а весь слой -- одним векторным умножением.
+
+    Элементы различаются образом точки base: совпадающие образы (с точностью
+    p11_index.GRID_TOLERANCE) отбрасываются через хэш-индекс совпадений. Если
+    стабилизатор base тривиален, это и есть различные элементы группы. Иначе
+    находится по одному элементу на образ, и тогда порождающие должны переходить
+    друг в друга при сопряжении стабилизатором (как повороты на pi вокруг середин
+    всех сторон правильного многоугольника с центром в base).
+
+    Parameters
+    ----------
+    generators: HypTransformArray или последовательность HypTransform
+    radius: float
+      Гиперболический радиус: слова, уводящие base дальше, отбрасываются
+      (вместе со всеми своими продолжениями).
+    base: HypPoint
+    limit: int
+      Наибольшее число элементов, по умолчанию без ограничения.
+
+    Returns
+    -------
+    HypTransformArray
+      Элементы по возрастанию длины слова, первым -- тождественное преобразование.
+    """
+    if not isinstance(generators, HypTransformArray):
+        generators = HypTransformArray.fromTransforms(generators)
+    z = base.toModel(HypModel.Poincare).z
+    # cosh d(z, w) = 1 + 2 |z - w|**2 / ((1 - |z|**2)(1 - |w|**2))
+    bound = (np.cosh(radius) - 1) / 2 * (1 - abs(z) ** 2)
+    limit = np.inf if limit is None else limit
+
+    seen = HypDedupeIndex()
+    seen.add(gridKeys(np.array([z.real]), np.array([z.imag]))[0])
+    layers = [HypTransformArray.identity(1)]
+    count = 1
+    while len(layers[-1]) and count < limit:
+        words, k = layers[-1], len(generators)
+        words = (HypTransformArray(np.repeat(words.a, k), np.repeat(words.b, k))
+                 * HypTransformArray(np.tile(generators.a, len(words)), np.tile(generators.b, len(words))))
+        w = words.apply(z)
+        inside = np.abs(w - z) ** 2 <= bound * (1 - w.real ** 2 - w.imag ** 2)
+        words, w = words[inside], w[inside]
+        keys, probes = gridKeys(w.real, w.imag)
+        new = np.flatnonzero(seen.isNew(keys, probes))[:int(min(limit - count, len(w)))]
+        seen.add(keys[new])
+        layers.append(words[new])
+        count += len(new)
+    return HypTransformArray(np.concatenate([t.a for t in layers]), np.concatenate([t.b for t in layers]))
+
+
+# модели по их номерам, для столбцов-меток модели в хранилищах
+_MODELS = {m.value: m for m in HypModel}
+
+
+def _shiftRows(column, lo, hi, shift, chunk=1 << 14):
+    # Сдвинуть column[lo:hi] на shift строк к концу. Перекрывающееся присваивание numpy
+    # копирует назад втрое медленнее, поэтому отрезок переносится кусками с конца через буфер.
+    buffer = np.empty((min(chunk, hi - lo),) + column.shape[1:], column.dtype)
+    for end in range(hi, lo, -chunk):
+        start = max(lo, end - chunk)
+        part = buffer[:end - start]
+        part[...] = column[start:end]
+        column[start + shift:end + shift] = part
+
+
+class HypObjectStore(abc.ABC):
+    """
+    Хранилище объектов одного рода (точек или прямых). Объекты лежат по строкам
+    в столбцах numpy одинаковой длины; у каждой строки есть уникальный id и флаг
+    выделения. Id выдаются по возрастанию, а удаление строк не меняет порядок
+    оставшихся, поэтому строка по id находится двоичным поиском.
+
+    Набор столбцов задаётся в наследниках словарём columns (имя -> dtype),
+    ключи совпадений -- методом dedupeKeys, объект строки -- методом object.
+
+    Все строки хранилища зарегистрированы в индексе совпадений self.dedupe
+    по ключам из dedupeKeys, так что isNew отличает новые объекты от уже
+    имеющихся за O(1) в среднем на объект.
+    """
+    columns = {}
+    # до скольких строк takeIds и restore сдвигают строки в столбцах по отрезкам, а не маской
+    shiftRows = 64
+
+    def __init__(self):
+        self._data = self._emptyColumns()
+        self.count = 0
+        self.nextId = 0
+        self.dedupe = HypDedupeIndex()
+
+    def _emptyColumns(self, capacity=16):
+        dtypes = dict(self.columns, id=np.int64, selected=np.bool_)
+        return {name: np.zeros(capacity, dtype) for name, dtype in dtypes.items()}
+
+    def __len__(self):
+        return self.count
+
+    def column(self, name):
+        """
+        Столбец хранилища (без копирования, только занятые строки).
+        """
+        return self._data[name][:self.count]
+
+    @property
+    def ids(self):
+        return self.column('id')
+
+    @property
+    def selected(self):
+        return self.column('selected')
+
+    def _reserve(self, n):
+        # место ещё под n строк, ёмкость растёт вдвое
+        capacity = len(self._data['id'])
+        if self.count + n <= capacity:
+            return
+        capacity = max(2 * capacity, self.count + n)
+        for name, col in self._data.items():
+            grown = np.zeros(capacity, col.dtype)
+            grown[:self.count] = col[:self.count]
+            self._data[name] = grown
+
+    def append(self, **values):
+        """
+        Добавить строки в конец.
+
+        Parameters
+        ----------
+        values
+          Массивы одинаковой длины для всех столбцов из columns.
+
+        Returns
+        -------
+        numpy.ndarray
+          Id новых строк.
+        """
+        n = len(next(iter(values.values())))
+        self._reserve(n)
+        lo, hi = self.count, self.count + n
+        for name in self.columns:
+            self._data[name][lo:hi] = values[name]
+        ids = np.arange(self.nextId, self.nextId + n, dtype=np.int64)
+        self._data['id'][lo:hi] = ids
+        self._data['selected'][lo:hi] = False
+        self.count = hi
+        self.nextId += n
+        self.dedupe.add(self.dedupeKeys(values)[0])
+        return ids
+
+    @abc.abstractmethod
+    def dedupeKeys(self, values):
+        """
+        Ключи для индекса совпадений, см. p11_index.gridKeys.
+
+        Parameters
+        ----------
+        values: dict
+          Столбцы объектов.
+
+        Returns
+        -------
+        keys, probes: numpy.ndarray
+        """
+
+    def isNew(self, **values):
+        """
+        Какие из объектов (заданных столбцами) геометрически не совпадают
+        ни с объектами хранилища, ни с предыдущими объектами из values.
+
+        Returns
+        -------
+        numpy.ndarray
+          Булев массив.
+        """
+        return self.dedupe.isNew(*self.dedupeKeys(values))
+
+    def rowsOf(self, ids):
+        """
+        Номера строк по id. Id должны присутствовать в хранилище.
+        """
+        return np.searchsorted(self.ids, ids)
+
+    def contains(self, ids):
+        """
+        Какие из id есть в хранилище.
+
+        Returns
+        -------
+        numpy.ndarray
+          Булев массив той же длины, что и ids.
+        """
+        return sortedContains(self.ids, ids)
+
+    def take(self, mask):
+        """
+        Вынуть строки, отмеченные в mask, за один проход по столбцам.
+        Если отмечены все строки, столбцы отдаются целиком, без копирования.
+
+        Returns
+        -------
+        dict
+          Столбцы вынутых строк (включая id и выделение), годятся для restore.
+        """
+        mask = np.asarray(mask, dtype=np.bool_)
+        if mask.all():
+            block = {name: col[:self.count] for name, col in self._data.items()}
+            self._data = self._emptyColumns()
+            self.count = 0
+            self.dedupe.clear()
+            return block
+        block = {name: col[:self.count][mask] for name, col in self._data.items()}
+        self.dedupe.discard(self.dedupeKeys(block)[0])
+        keep = ~mask
+        n = int(keep.sum())
+        for col in self._data.values():
+            col[:n] = col[:self.count][keep]
+        self.count = n
+        return block
+
+    def takeIds(self, ids):
+        """
+        Вынуть строки с данными id (по возрастанию, все есть в хранилище).
+        Строки до первой вынутой не трогаются, а следующие за ней сдвигаются на
+        месте, без новых столбцов, так что строки в конце хранилища (например,
+        только что добавленные) вынимаются за время, пропорциональное их числу.
+
+        Returns
+        -------
+        dict
+          Столбцы вынутых строк, см. take.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        n = len(ids)
+        lo = self.count - n
+        if n == 0:
+            return self.block(slice(0, 0))
+        if n < self.count and np.array_equal(self.ids[lo:], ids):
+            block = self.block(slice(lo, self.count))
+            self.dedupe.discard(self.dedupeKeys(block)[0])
+            self.count = lo
+            return block
+        if n <= self.shiftRows:
+            # немного строк: остальные сдвигаются на место вынутых, без новых столбцов
+            rows = self.rowsOf(ids)
+            block = self.block(rows)
+            self.dedupe.discard(self.dedupeKeys(block)[0])
+            ends = np.append(rows[1:], self.count)
+            for col in self._data.values():
+                for shift, (row, end) in enumerate(zip(rows, ends)):
+                    col[row - shift:end - shift - 1] = col[row + 1:end]
+            self.count -= n
+            return block
+        # много строк: оставшиеся строки после первой вынутой сдвигаются маской
+        rows = self.rowsOf(ids)
+        block = self.block(rows)
+        self.dedupe.discard(self.dedupeKeys(block)[0])
+        first = rows[0]
+        keep = np.ones(self.count - first, np.bool_)
+        keep[rows - first] = False
+        for col in self._data.values():
+            col[first:self.count - n] = col[first:self.count][keep]
+        self.count -= n
+        return block
+
+    def block(self, rows):
+        """
+        Копия строк rows со всеми столбцами, в том же виде, в каком их отдаёт take.
+        """
+        return {name: col[:self.count][rows].copy() for name, col in self._data.items()}
+
+    def update(self, rows, **values):
+        """
+        Заменить значения объектов в строках rows (id и выделение не меняются).
+
+        Parameters
+        ----------
+        rows: numpy.ndarray
+          Номера строк.
+        values
+          Массивы той же длины, что и rows, для всех столбцов из columns.
+        """
+        rows = np.asarray(rows, dtype=np.intp)
+        self.dedupe.discard(self.dedupeKeys({name: self.column(name)[rows] for name in self.columns})[0])
+        for name in self.columns:
+            self._data[name][rows] = values[name]
+        self.dedupe.add(self.dedupeKeys(values)[0])
+
+    def remove(self, mask):
+        """
+        Удалить строки, отмеченные в mask.
+
+        Returns
+        -------
+        numpy.ndarray
+          Id удалённых строк.
+        """
+        return self.take(mask)['id']
+
+    def clear(self):
+        """
+        Удалить все строки.
+
+        Returns
+        -------
+        numpy.ndarray
+          Id удалённых строк.
+        """
+        return self.take(np.ones(self.count, np.bool_))['id']
+
+    def restore(self, block):
+        """
+        Вернуть строки, вынутые take, на их прежние места (по порядку id).
+        Как и в takeIds, сдвигаются на месте только строки после первой
+        возвращённой. Сам block не меняется и может быть использован повторно.
+        """
+        n = len(block['id'])
+        if n == 0:
+            return
+        if self.count == 0:
+            self._data = {name: col.copy() for name, col in block.items()}
+        elif block['id'][0] > self.ids[-1]:
+            # строки после всех имеющихся (например, повтор добавления) дописываются в конец
+            self._reserve(n)
+            for name, col in self._data.items():
+                col[self.count:self.count + n] = block[name]
+        elif n <= self.shiftRows:
+            # немного строк: остальные сдвигаются, освобождая им места, с конца
+            self._reserve(n)
+            rows = np.searchsorted(self.ids, block['id'])
+            ends = np.append(rows[1:], self.count)
+            for name, col in self._data.items():
+                for shift in range(n - 1, -1, -1):
+                    row, end = rows[shift], ends[shift]
+                    _shiftRows(col, row, end, shift + 1)
+                    col[row + shift] = block[name][shift]
+        else:
+            # много строк: строки после первой возвращённой раздвигаются маской
+            rows = np.searchsorted(self.ids, block['id'])
+            first = rows[0]
+            placed = rows - first + np.arange(n)
+            old = np.ones(self.count + n - first, np.bool_)
+            old[placed] = False
+            self._reserve(n)
+            for name, col in self._data.items():
+                tail = col[first:self.count + n]
+                tail[old] = col[first:self.count].copy()
+                tail[placed] = block[name]
+        self.count += n
+        self.dedupe.add(self.dedupeKeys(block)[0])
+
+    def state(self):
+        """
+        Всё состояние хранилища в виде плоских массивов numpy, без копирования:
+        занятые строки всех столбцов, счётчик id и таблица индекса совпадений.
+
+        Returns
+        -------
+        dict
+          Имя -> массив, годится для setState.
+        """
+        state = {name: self.column(name) for name in self._data}
+        state['nextId'] = np.array([self.nextId], np.int64)
+        state.update({'dedupe.' + name: array for name, array in self.dedupe.state().items()})
+        return state
+
+    def setState(self, state):
+        """
+        Заменить содержимое хранилища состоянием, полученным от state.
+        Массивы берутся без копирования, так что могут быть отображены в
+        память (см. loadScene): в память читается лишь то, к чему обращаются.
+        Копируются они только при первом добавлении строк, когда растёт ёмкость.
+        """
+        self._data = {name: state[name] for name in self._emptyColumns(0)}
+        self.count = len(self._data['id'])
+        self.nextId = int(state['nextId'][0])
+        self.dedupe = HypDedupeIndex()
+        self.dedupe.setState({name[len('dedupe.'):]: array for name, array in state.items()
+                              if name.startswith('dedupe.')})
+
+    def setSelected(self, rows, value):
+        """
+        Выделить строки или снять с них выделение.
+
+        Returns
+        -------
+        numpy.ndarray
+          Id строк, у которых выделение действительно поменялось.
+        """
+        rows = np.asarray(rows, dtype=np.intp)
+        rows = rows[self.selected[rows] != value]
+        self.selected[rows] = value
+        return self.ids[rows]
+
+    def selectedRows(self):
+        return np.flatnonzero(self.selected)
+
+    @abc.abstractmethod
+    def object(self, row):
+        """
+        Объект строки в виде HypPoint или HypLine.
+        """
+
+    def text(self, row):
+        return str(self.object(row))
+
+
+class HypPointStore(HypObjectStore):
+    """
+    Хранилище точек: координаты в своей модели (z), метка модели (m) и координаты
+    в модели Бельтрами-Клейна (bk), на которых работают все построения.
+    """
+    columns = {'z': np.complex128, 'm': np.int8, 'bk': np.complex128}
+
+    @staticmethod
+    def columnsOf(points):
+        """
+        Столбцы хранилища для последовательности HypPoint или для HypPointArray.
+        """
+        if isinstance(points, HypPointArray):
+            return {'z': points.z, 'm': np.full(len(points), points.m.value, np.int8),
+                    'bk': points.toModel(HypModel.BeltramiKlein).z}
+        points = list(points)
+        return {'z': np.array([p.z for p in points], np.complex128),
+                'm': np.array([p.m.value for p in points], np.int8),
+                'bk': np.array([p.toModel(HypModel.BeltramiKlein).z for p in points], np.complex128)}
+
+    def dedupeKeys(self, values):
+        # точки совпадают, если близки их координаты в модели БК
+        return gridKeys(values['bk'].real, values['bk'].imag)
+
+    def points(self, rows=slice(None)):
+        """
+        Точки строк rows в модели Бельтрами-Клейна.
+
+        Returns
+        -------
+        HypPointArray
+        """
+        return HypPointArray(self.column('bk')[rows])
+
+    def object(self, row):
+        m = _MODELS[int(self.column('m')[row])]
+        z = complex(self.column('z')[row])
+        # координаты в модели БК уже известны, пересчитывать их не придётся
+        other = complex(self.column('bk')[row]) if m is HypModel.Poincare else None
+        return HypPoint(z, m, other)
+
+
+class HypLineStore(HypObjectStore):
+    """
+    Хранилище прямых: нормированные коэффициенты a, b, c в модели Бельтрами-Клейна.
+    """
+    columns = {'a': np.float64, 'b': np.float64, 'c': np.float64}
+
+    @staticmethod
+    def columnsOf(lines):
+        """
+        Столбцы хранилища для последовательности HypLine или для HypLineArray.
+        """
+        if not isinstance(lines, HypLineArray):
+            lines = HypLineArray.fromLines(lines)
+        return {'a': lines.a, 'b': lines.b, 'c': lines.c}
+
+    def dedupeKeys(self, values):
+        # Прямая a x + b y + c = 0 с a**2 + b**2 = 1 задаётся углом нормали и c, а
+        # тройки (a, b, c) и (-a, -b, -c) -- одна и та же прямая. Поэтому угол приводится
+        # к [0, pi) со сменой знака c и переводится в u из [-1, 1). Прямые с углом около
+        # 0 и около pi тоже совпадают, для них проверяется и ячейка (u -/+ 2, -c).
+        a, b, c = values['a'], values['b'], values['c']
+        theta = np.arctan2(b, a)
+        flip = theta < 0
+        theta = np.where(flip, theta + np.pi, theta)
+        c = np.where(flip, -c, c)
+        flip = theta >= np.pi
+        theta = np.where(flip, theta - np.pi, theta)
+        c = np.where(flip, -c, c)
+        u = theta * (2 / np.pi) - 1
+        keys, probes = gridKeys(u, c)
+
+        wrap = np.flatnonzero((u < -1 + GRID_TOLERANCE) | (u > 1 - GRID_TOLERANCE))
+        if len(wrap):
+            uw = u[wrap]
+            wrapKeys, wrapProbes = gridKeys(np.where(uw < 0, uw + 2, uw - 2), -c[wrap])
+            extra = np.full((len(u), 4), -1, np.int64)
+            extra[wrap, 0] = wrapKeys
+            extra[wrap, 1:] = wrapProbes
+            probes = np.concatenate([probes, extra], axis=1)
+        return keys, probes
+
+    def lines(self, rows=slice(None)):
+        """
+        Прямые строк rows.
+
+        Returns
+        -------
+        HypLineArray
+        """
+        return HypLineArray(self.column('a')[rows], self.column('b')[rows], self.column('c')[rows], normalized=True)
+
+    def object(self, row):
+        return HypLine._fromNormalized(float(self.column('a')[row]), float(self.column('b')[row]),
+                                       float(self.column('c')[row]))
+
+
+def _parallelsBatch(lines, points, slots):
+    # параллельные через первые (slots == 0) или через вторые идеальные точки прямых
+    first, second = drawParallelsBatch(lines, points)
+    slots = np.asarray(slots) == 1
+    return HypLineArray(*(np.where(slots, getattr(second, name), getattr(first, name)) for name in 'abc'),
+                        normalized=True)
+
+
+# номера родов объектов в ключах вершин графа построений
+_NODE_KINDS = {'points': 0, 'lines': 1}
+
+
+def _nodeKeys(kind, ids):
+    # ключ вершины -- 2 id + номер рода, так что ключи одного рода идут в порядке id
+    return np.asarray(ids, dtype=np.int64) * 2 + _NODE_KINDS[kind]
+
+
+def _nodeIds(keys):
+    # id точек и id прямых по ключам вершин
+    keys = np.asarray(keys, dtype=np.int64)
+    kinds = keys % 2
+    return keys[kinds == 0] // 2, keys[kinds == 1] // 2
+
+
+def _expandRanges(lo, hi):
+    # все номера из отрезков [lo[i], hi[i]) одним массивом
+    counts = hi - lo
+    starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+    return starts + np.arange(counts.sum())
+
+
+class HypConstructionGraph:
+    """
+    Граф зависимостей построенных объектов. Вершины -- точки и прямые хранилищ,
+    у каждого построенного объекта есть запись: какое это построение, какой из
+    его результатов (у параллельных их два) и из каких двух объектов оно сделано.
+    У исходных объектов записей нет. Записи лежат столбцами numpy.
+
+    Когда исходные объекты меняются, пересчитывается только то, что от них
+    зависит: записи их потомков слоями в топологическом порядке, по одному
+    векторному построению на род построения в слое. Для этого записи
+    упорядочиваются по родителям при первом запросе после изменения графа,
+    так что пересчёт k потомков стоит O(k log n), а не O(n).
+    """
+    # построения: имя -> (род результата, роды двух родителей, функция от родителей
+    # и номеров результатов). Номер построения в записях -- место в этом словаре.
+    operations = {
+        'lineThroughPoints': ('lines', ('points', 'points'), lambda p, q, slots: drawLineThroughPointsBatch(p, q)),
+        'intersection': ('points', ('lines', 'lines'), lambda l1, l2, slots: intersectLinesBatch(l1, l2)),
+        'perpendicular': ('lines', ('lines', 'points'), lambda l, p, slots: drawPerpendicularBatch(l, p)),
+        'parallel': ('lines', ('lines', 'points'), _parallelsBatch),
+    }
+
+    def __init__(self):
+        # ключ построенного объекта, номер построения, номер результата и ключи родителей;
+        # столбцы с запасом, как в HypObjectStore, заняты первые count записей
+        self._data = self._emptyColumns()
+        self.count = 0
+        # упорядочение ключей родителей (None -- граф изменился) и оно само,
+        # ключи построенных объектов по возрастанию (None -- граф изменился)
+        self._parentOrder = None
+        self._sortedParents = None
+        self._sortedChildren = None
+
+    @staticmethod
+    def _emptyColumns(capacity=0):
+        return {'child': np.zeros(capacity, np.int64), 'op': np.zeros(capacity, np.int8),
+                'slot': np.zeros(capacity, np.int8), 'parents': np.zeros((capacity, 2), np.int64)}
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def child(self):
+        return self._data['child'][:self.count]
+
+    @property
+    def op(self):
+        return self._data['op'][:self.count]
+
+    @property
+    def slot(self):
+        return self._data['slot'][:self.count]
+
+    @property
+    def parents(self):
+        return self._data['parents'][:self.count]
+
+    def _columns(self):
+        return {name: column[:self.count] for name, column in self._data.items()}
+
+    def _append(self, columns):
+        # дописать записи в конец, ёмкость растёт вдвое
+        n = len(columns['child'])
+        capacity = len(self._data['child'])
+        if self.count + n > capacity:
+            grown = self._emptyColumns(max(2 * capacity, self.count + n, 16))
+            for name, column in grown.items():
+                column[:self.count] = self._data[name][:self.count]
+            self._data = grown
+        for name, column in self._data.items():
+            column[self.count:self.count + n] = columns[name]
+        self.count += n
+        self._parentOrder = self._sortedChildren = None
+
+    def add(self, kind, ids, op, parents, slots=0):
+        """
+        Записать построенные объекты.
+
+        Parameters
+        ----------
+        kind: str
+          Род построенных объектов, 'points' или 'lines'.
+        ids: numpy.ndarray
+          Их id.
+        op: str
+          Построение, ключ operations.
+        parents: array_like
+          Id родителей, массив (len(ids), 2); их роды -- из operations.
+        slots: array_like
+          Номера результатов построения (у параллельных -- 0 или 1).
+
+        Returns
+        -------
+        dict
+          Столбцы новых записей, годятся для restore.
+        """
+        result, parentKinds, _ = self.operations[op]
+        if kind != result:
+            raise ValueError('{} makes {}, not {}'.format(op, result, kind))
+        ids = np.asarray(ids, dtype=np.int64)
+        parents = np.asarray(parents, dtype=np.int64).reshape(-1, 2)
+        parents = np.stack([_nodeKeys(parentKinds[0], parents[:, 0]), _nodeKeys(parentKinds[1], parents[:, 1])], -1)
+        block = {'child': _nodeKeys(kind, ids), 'op': np.full(len(ids), list(self.operations).index(op), np.int8),
+                 'slot': np.broadcast_to(np.asarray(slots, np.int8), len(ids)).copy(), 'parents': parents}
+        self._append(block)
+        return block
+
+    def isDerived(self, kind, ids):
+        """
+        Какие из объектов рода kind с id ids построены (есть в графе с родителями).
+        """
+        if self._sortedChildren is None:
+            self._sortedChildren = np.sort(self.child)
+        return sortedContains(self._sortedChildren, _nodeKeys(kind, ids))
+
+    def _childRows(self, keys):
+        # номера записей, у которых среди родителей есть вершины keys (по записи на родителя)
+        if self._parentOrder is None:
+            self._parentOrder = np.argsort(self.parents.reshape(-1), kind='stable')
+            self._sortedParents = self.parents.reshape(-1)[self._parentOrder]
+        lo = np.searchsorted(self._sortedParents, keys, 'left')
+        hi = np.searchsorted(self._sortedParents, keys, 'right')
+        return self._parentOrder[_expandRanges(lo, hi)] // 2
+
+    def _cone(self, keys):
+        # номера записей всех потомков вершин keys, по возрастанию
+        found = np.zeros(0, np.intp)
+        frontier = np.unique(keys)
+        while len(frontier):
+            rows = np.unique(self._childRows(frontier))
+            rows = rows[~sortedContains(found, rows)]
+            found = np.union1d(found, rows)
+            frontier = self.child[rows]
+        return found
+
+    def _layers(self, keys):
+        # Записи потомков вершин keys слоями: родители записей слоя -- это keys,
+        # объекты вне потомков или объекты прежних слоёв.
+        cone = self._cone(keys)
+        # сколько родителей каждой записи ещё не пересчитано
+        waiting = sortedContains(np.sort(self.child[cone]), self.parents[cone]).sum(1)
+        layer = cone[waiting == 0]
+        while len(layer):
+            yield layer
+            rows = np.searchsorted(cone, self._childRows(self.child[layer]))
+            np.subtract.at(waiting, rows, 1)
+            rows = np.unique(rows)
+            layer = cone[rows[waiting[rows] == 0]]
+
+    def descendants(self, pointIds, lineIds):
+        """
+        Все объекты, построенные (прямо или через другие) из данных точек и прямых.
+
+        Returns
+        -------
+        points, lines: numpy.ndarray
+          Id построенных точек и прямых, по возрастанию.
+        """
+        keys = np.concatenate([_nodeKeys('points', pointIds), _nodeKeys('lines', lineIds)])
+        return _nodeIds(np.sort(self.child[self._cone(keys)]))
+
+    def recompute(self, points, lines, pointIds, lineIds):
+        """
+        Пересчитать всё, что построено из изменившихся объектов, и записать
+        новые значения в хранилища. Объекты, которые перестали существовать
+        (например, прямые разошлись и точки пересечения не стало), пересчитанными
+        не считаются, как и всё, что построено из них.
+
+        Parameters
+        ----------
+        points: HypPointStore
+        lines: HypLineStore
+          Хранилища, в которых лежат объекты графа.
+        pointIds, lineIds: numpy.ndarray
+          Id изменившихся точек и прямых.
+
+        Returns
+        -------
+        changed: dict
+          Род -> id пересчитанных объектов.
+        lost: dict
+          Род -> id объектов, которые больше не существуют; в хранилищах они не тронуты.
+        """
+        stores = {'points': points, 'lines': lines}
+        operations = list(self.operations.values())
+        changed = {'points': [np.zeros(0, np.int64)], 'lines': [np.zeros(0, np.int64)]}
+        lost = np.zeros(0, np.int64)
+        keys = np.concatenate([_nodeKeys('points', pointIds), _nodeKeys('lines', lineIds)])
+        for layer in self._layers(keys):
+            # построенное из того, чего больше нет, тоже не существует
+            gone = sortedContains(lost, self.parents[layer]).any(1)
+            lost = np.union1d(lost, self.child[layer[gone]])
+            layer = layer[~gone]
+            for op in np.unique(self.op[layer]):
+                rows = layer[self.op[layer] == op]
+                result, parentKinds, compute = operations[op]
+                args = []
+                for kind, parentKeys in zip(parentKinds, self.parents[rows].T):
+                    store = stores[kind]
+                    rowsOf = store.rowsOf(parentKeys // 2)
+                    args.append(store.points(rowsOf) if kind == 'points' else store.lines(rowsOf))
+                objects = compute(*args, self.slot[rows])
+                valid = objects.isValid()
+                lost = np.union1d(lost, self.child[rows[~valid]])
+                ids = self.child[rows[valid]] // 2
+                store = stores[result]
+                store.update(store.rowsOf(ids), **store.columnsOf(objects[valid]))
+                changed[result].append(ids)
+        changed = {kind: np.sort(np.concatenate(ids)) for kind, ids in changed.items()}
+        return changed, dict(zip(['points', 'lines'], _nodeIds(lost)))
+
+    def take(self, pointIds, lineIds):
+        """
+        Вынуть записи о построении данных объектов (например, удалённых).
+        Последние записи графа (например, только что построенное) вынимаются
+        без прохода по остальным.
+
+        Returns
+        -------
+        dict
+          Столбцы вынутых записей, годятся для restore.
+        """
+        keys = np.sort(np.concatenate([_nodeKeys('points', pointIds), _nodeKeys('lines', lineIds)]))
+        lo = self.count - len(keys)
+        if len(keys) and lo >= 0 and np.array_equal(np.sort(self.child[lo:]), keys):
+            block = {name: column[lo:].copy() for name, column in self._columns().items()}
+            self.count = lo
+            self._parentOrder = self._sortedChildren = None
+            return block
+        mask = sortedContains(keys, self.child)
+        block = {name: column[mask] for name, column in self._columns().items()}
+        if mask.any():
+            keep = ~mask
+            n = int(keep.sum())
+            for column in self._data.values():
+                column[:n] = column[:self.count][keep]
+            self.count = n
+            self._parentOrder = self._sortedChildren = None
+        return block
+
+    def restore(self, block):
+        """
+        Вернуть записи, вынутые take. Сам block не меняется.
+        """
+        if len(block['child']):
+            self._append(block)
+
+    def clear(self):
+        """
+        Вынуть все записи.
+        """
+        block = self._columns()
+        self.__init__()
+        return block
+
+    def state(self):
+        """
+        Записи графа в виде массивов numpy, см. setState.
+        """
+        return self._columns()
+
+    def setState(self, state):
+        """
+        Заменить записи графа полученными от state.
+        """
+        self._data = {name: state[name] for name in self._emptyColumns()}
+        self.count = len(self._data['child'])
+        self._parentOrder = self._sortedChildren = None
+
+
+def _joinBlocks(first, second, key=None):
+    # столбцы двух блоков строк одним блоком, по возрастанию столбца key
+    if first is None or second is None:
+        return second if first is None else first
+    block = {name: np.concatenate([column, second[name]]) for name, column in first.items()}
+    if key is not None:
+        order = np.argsort(block[key], kind='stable')
+        block = {name: column[order] for name, column in block.items()}
+    return block
+
+
+class HypEdit:
+    """
+    Правка хранилищ точек и прямых и графа построений, которую можно отменить
+    и повторить. Правка помнит только то, что она изменила: добавленные и
+    вынутые строки (столбцами, как их отдаёт HypObjectStore.take), прежние и
+    новые значения изменённых строк и записи графа. Так что память на правку
+    пропорциональна её размеру, а не размеру сцены.
+
+    Добавленные строки и записи графа лежат в конце хранилищ и графа (id
+    выдаются по возрастанию), поэтому отмена и повтор добавления и построения
+    стоят O(размер правки). Возврат строк в середину хранилища и их повторное
+    удаление -- один векторный сдвиг столбцов, без копий в истории.
+
+    Parameters
+    ----------
+    added, removed: dict
+      Род ('points' или 'lines') -> столбцы добавленных или вынутых строк.
+    moved: dict
+      Род -> (id по возрастанию, столбцы прежних значений, столбцы новых
+      значений) строк, значения которых изменились.
+    graphAdded, graphRemoved: dict
+      Столбцы добавленных и вынутых записей графа построений.
+    """
+    def __init__(self, added=None, removed=None, moved=None, graphAdded=None, graphRemoved=None):
+        self.added = dict(added or {})
+        self.removed = dict(removed or {})
+        self.moved = dict(moved or {})
+        self.graphAdded = graphAdded
+        self.graphRemoved = graphRemoved
+
+    def __len__(self):
+        # сколько строк и записей затронуто
+        blocks = [*self.added.values(), *self.removed.values(), self.graphAdded, self.graphRemoved]
+        return (sum(len(next(iter(block.values()))) for block in blocks if block is not None)
+                + sum(len(ids) for ids, _, _ in self.moved.values()))
+
+    def touches(self, kind):
+        """
+        Меняет ли правка хранилище рода kind.
+        """
+        return kind in self.added or kind in self.removed or kind in self.moved
+
+    def merge(self, later):
+        """
+        Правка, равносильная этой и следующей за ней правке later (например,
+        очередной части того же построения или того же перетаскивания точки).
+        """
+        moved = dict(self.moved)
+        for kind, (ids, old, new) in later.moved.items():
+            if kind in moved:
+                earlierIds, earlierOld, earlierNew = moved[kind]
+                ids = np.concatenate([earlierIds, ids])
+                # прежнее значение -- из первого изменения строки, новое -- из последнего
+                first = np.unique(ids, return_index=True)[1]
+                last = len(ids) - 1 - np.unique(ids[::-1], return_index=True)[1]
+                old = {name: np.concatenate([column, old[name]])[first] for name, column in earlierOld.items()}
+                new = {name: np.concatenate([column, new[name]])[last] for name, column in earlierNew.items()}
+                ids = ids[first]
+            moved[kind] = ids, old, new
+        added = {kind: _joinBlocks(self.added.get(kind), later.added.get(kind), 'id')
+                 for kind in set(self.added) | set(later.added)}
+        removed = {kind: _joinBlocks(self.removed.get(kind), later.removed.get(kind), 'id')
+                   for kind in set(self.removed) | set(later.removed)}
+        return HypEdit(added, removed, moved, _joinBlocks(self.graphAdded, later.graphAdded),
+                       _joinBlocks(self.graphRemoved, later.graphRemoved))
+
+    def applyStore(self, kind, store, undo=False):
+        """
+        Сделать (undo=False) или отменить (undo=True) правку в хранилище рода kind.
+
+        Returns
+        -------
+        appeared, disappeared: dict or None
+          Столбцы строк, вернувшихся в хранилище, и строк, вынутых из него.
+        moved: numpy.ndarray
+          Id оставшихся в хранилище строк, значения которых изменились.
+        """
+        appeared, disappeared = self.added.get(kind), self.removed.get(kind)
+        if undo:
+            appeared, disappeared = disappeared, appeared
+        ids, old, new = self.moved.get(kind, (np.zeros(0, np.int64), None, None))
+        # значения меняются до удаления строк, а возвращаются после их возврата:
+        # строка могла измениться, а потом перестать существовать
+        if len(ids) and not undo:
+            store.update(store.rowsOf(ids), **new)
+        if disappeared is not None:
+            # строки вынимаются заново, с тем выделением, что у них сейчас
+            disappeared = store.takeIds(disappeared['id'])
+            (self.added if undo else self.removed)[kind] = disappeared
+        if appeared is not None:
+            store.restore(appeared)
+        if len(ids) and undo:
+            store.update(store.rowsOf(ids), **old)
+        return appeared, disappeared, ids[store.contains(ids)]
+
+    def applyGraph(self, graph, undo=False):
+        """
+        Сделать (undo=False) или отменить (undo=True) правку в графе построений.
+        """
+        appeared, disappeared = self.graphAdded, self.graphRemoved
+        if undo:
+            appeared, disappeared = disappeared, appeared
+        if disappeared is not None:
+            graph.take(*_nodeIds(disappeared['child']))
+        if appeared is not None:
+            graph.restore(appeared)
+
+
+class HypHistory:
+    """
+    История правок (HypEdit) для отмены и повтора. Новая правка забывает
+    отменённые; когда правок больше limit, забываются самые старые.
+
+    Parameters
+    ----------
+    limit: int
+      Сколько последних правок можно отменить.
+    """
+    def __init__(self, limit=64):
+        self.done = deque(maxlen=limit)
+        self.undone = []
+        # группа последней записанной правки, см. record
+        self._group = None
+
+    def record(self, edit, group=None):
+        """
+        Записать сделанную правку. Идущие подряд правки одной группы (group --
+        любой объект, сравнивается по тождеству; например, части одного
+        построения) объединяются в одну.
+        """
+        if not len(edit):
+            return
+        self.undone.clear()
+        if group is not None and group is self._group and self.done:
+            self.done[-1] = self.done[-1].merge(edit)
+        else:
+            self.done.append(edit)
+        self._group = group
+
+    def undo(self):
+        """
+        Правка, которую надо отменить (последняя сделанная), или None.
+        """
+        if not self.done:
+            return None
+        self._group = None
+        self.undone.append(self.done.pop())
+        return self.undone[-1]
+
+    def redo(self):
+        """
+        Правка, которую надо сделать снова (последняя отменённая), или None.
+        """
+        if not self.undone:
+            return None
+        self._group = None
+        self.done.append(self.undone.pop())
+        return self.done[-1]
+
+    def canUndo(self):
+        return bool(self.done)
+
+    def canRedo(self):
+        return bool(self.undone)
+
+    def clear(self):
+        self.done.clear()
+        self.undone.clear()
+        self._group = None
+
+
+class HypTiling:
+    """
+    Правильное разбиение {p, q} плоскости Лобачевского: p-угольники, по q в каждой
+    вершине, (p - 2)(q - 2) > 4. Центральный многоугольник -- с центром в начале
+    координат и вершиной на положительной полуоси, остальные -- его образы под
+    действием self.transforms.
+
+    Преобразования находит groupOrbit из поворотов на pi вокруг середин сторон
+    центрального многоугольника: это переходы к соседям через стороны, а
+    многоугольники различаются центрами.
+
+    Parameters
+    ----------
+    p, q: int
+    radius: float
+      Гиперболический радиус круга с центром в начале координат, в котором лежат
+      центры многоугольников.
+    limit: int
+      Наибольшее число многоугольников, по умолчанию без ограничения.
+    """
+    def __init__(self, p, q, radius=5.0, limit=None):
+        if (p - 2) * (q - 2) <= 4:
+            raise ValueError('{{{}, {}}} is not a hyperbolic tiling'.format(p, q))
+        self.p, self.q = p, q
+        # расстояние от центра до вершины: cosh R = ctg(pi / p) ctg(pi / q)
+        R = np.arccosh(1 / (np.tan(np.pi / p) * np.tan(np.pi / q)))
+        # вершины центрального многоугольника в модели Пуанкаре
+        self.vertices = np.tanh(R / 2) * np.exp(2j * np.pi * np.arange(p) / p)
+        # середины сторон в модели Пуанкаре -- середины хорд в модели БК
+        klein = HypPointArray(self.vertices, HypModel.Poincare).toModel(HypModel.BeltramiKlein).z
+        middles = HypPointArray((klein + np.roll(klein, -1)) / 2)
+        self.middles = middles.toModel(HypModel.Poincare).z
+        center = HypPointArray(np.zeros(p, np.complex128))
+        # поворот на pi вокруг середины: перенос её в центр, z -> -z и перенос обратно
+        self.generators = (HypTransformArray.pToQ(center, middles) * HypTransform(1j, 0j)
+                           * HypTransformArray.pToQ(middles, center))
+        self.transforms = groupOrbit(self.generators, radius, limit=limit)
+
+    def __len__(self):
+        return len(self.transforms)
+
+    def centers(self):
+        """
+        Центры многоугольников.
+
+        Returns
+        -------
+        HypPointArray
+        """
+        return HypPointArray(self.transforms.apply(np.zeros(len(self), np.complex128)), HypModel.Poincare)
+
+    def corners(self):
+        """
+        Вершины многоугольников в модели Пуанкаре, по обходу против часовой стрелки.
+
+        Returns
+        -------
+        numpy.ndarray
+          Комплексный массив формы (число многоугольников, p).
+        """
+        return self.transforms.apply(self.vertices[None, :])
+
+    def edges(self):
+        """
+        Прямые, на которых лежат стороны многоугольников, без повторов. Общие
+        стороны соседей отсеиваются заранее, по их серединам, а стороны на одной
+        прямой (их много: прямая через сторону -- ось симметрии разбиения) --
+        как в HypLineStore. Все прямые проводятся одним векторным вызовом.
+
+        Returns
+        -------
+        HypLineArray
+        """
+        corners = self.corners()
+        middles = self.transforms.apply(self.middles[None, :]).reshape(-1)
+        sides = np.flatnonzero(HypDedupeIndex().isNew(*gridKeys(middles.real, middles.imag)))
+        lines = drawLineThroughPointsBatch(HypPointArray(corners.reshape(-1)[sides], HypModel.Poincare),
+                                           HypPointArray(np.roll(corners, -1, axis=1).reshape(-1)[sides],
+                                                         HypModel.Poincare))
+        keys, probes = HypLineStore().dedupeKeys(HypLineStore.columnsOf(lines))
+        return lines[HypDedupeIndex().isNew(keys, probes)]
+
+
+class HypScene:
+    """
+    Сцена для сохранения и открытия: хранилища объектов и вид плоскости.
+
+    Parameters
+    ----------
+    points: HypPointStore
+    lines: HypLineStore
+      Хранилища объектов, сохраняются целиком: координаты, метки моделей,
+      выделение, счётчики id и индексы совпадений.
+    transform: HypTransform
+      Преобразование плоскости, по умолчанию тождественное.
+    model: HypModel
+      Модель, в которой рисуется плоскость.
+    index: p11_index.HypIncrementalIndex
+      Пространственный индекс объектов, если он уже построен. Сохранённый
+      вместе со сценой, он открывается без перестройки.
+    graph: HypConstructionGraph
+      Из чего построены объекты, по умолчанию -- все объекты исходные.
+    """
+    def __init__(self, points=None, lines=None, transform=None, model=HypModel.BeltramiKlein, index=None,
+                 graph=None):
+        self.points = HypPointStore() if points is None else points
+        self.lines = HypLineStore() if lines is None else lines
+        self.transform = HypTransform.identity() if transform is None else transform
+        self.model = model
+        self.index = index
+        self.graph = HypConstructionGraph() if graph is None else graph
+
+
+# Формат файла сцены: сигнатура, версия и длина заголовка, затем заголовок в JSON
+# (модель отрисовки и список столбцов: имя, dtype, форма, смещение) и сами столбцы,
+# каждый с границы SCENE_ALIGN байт, в порядке байтов, записанном в их dtype.
+SCENE_MAGIC = b'HYPSCENE'
+SCENE_VERSION = 1
+SCENE_ALIGN = 64
+_SCENE_PREFIX = struct.Struct('<8sII')
+
+
+def _aligned(n):
+    return -(-n // SCENE_ALIGN) * SCENE_ALIGN
+
+
+def saveScene(path, scene):
+    """
+    Сохранить сцену в столбцовый двоичный файл, который loadScene отображает в
+    память. Файл пишется рядом и подменяет прежний одним переименованием, так что
+    сохранять можно и поверх сцены, открытой через loadScene.
+
+    Parameters
+    ----------
+    path: str
+      Имя файла.
+    scene: HypScene
+    """
+    arrays = {'points.' + name: array for name, array in scene.points.state().items()}
+    arrays.update({'lines.' + name: array for name, array in scene.lines.state().items()})
+    arrays['transform'] = np.array([scene.transform.a, scene.transform.b], np.complex128)
+    arrays.update({'graph.' + name: array for name, array in scene.graph.state().items()})
+    if scene.index is not None:
+        arrays.update({'index.' + name: array for name, array in scene.index.state().items()})
+
+    columns = []
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        arrays[name] = array
+        columns.append({'name': name, 'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset})
+        offset += _aligned(array.nbytes)
+    header = json.dumps({'model': scene.model.name, 'columns': columns}).encode()
+    # данные начинаются с границы выравнивания, смещения в заголовке -- от их начала
+    start = _aligned(_SCENE_PREFIX.size + len(header))
+
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(_SCENE_PREFIX.pack(SCENE_MAGIC, SCENE_VERSION, len(header)))
+        f.write(header)
+        for column in columns:
+            f.seek(start + column['offset'])
+            arrays[column['name']].tofile(f)
+        f.truncate(start + offset)
+    os.replace(temporary, path)
+
+
+def loadScene(path):
+    """
+    Открыть сцену, сохранённую saveScene. Файл отображается в память, а столбцы
+    хранилищ и индекса -- это окна в отображение, поэтому открытие не зависит
+    от размера сцены: данные читаются с диска, только когда к ним обращаются
+    (например, при отрисовке). Отображение -- с копированием при записи:
+    изменения хранилищ в файл не попадают.
+
+    Returns
+    -------
+    HypScene
+
+    Raises
+    ------
+    ValueError
+      Файл -- не сцена, сцена другой версии, заголовок испорчен или файл обрезан.
+    """
+    with open(path, 'rb') as f:
+        prefix = f.read(_SCENE_PREFIX.size)
+        if len(prefix) < _SCENE_PREFIX.size or prefix[:len(SCENE_MAGIC)] != SCENE_MAGIC:
+            raise ValueError('{}: not a scene file'.format(path))
+        _, version, headerSize = _SCENE_PREFIX.unpack(prefix)
+        if version != SCENE_VERSION:
+            raise ValueError('{}: unsupported scene version {}'.format(path, version))
+        try:
+            header = json.loads(f.read(headerSize).decode())
+        except ValueError:
+            raise ValueError('{}: corrupt scene header'.format(path))
+    start = _aligned(_SCENE_PREFIX.size + headerSize)
+
+    # обычный ndarray поверх отображения: у подкласса memmap медленные поэлементные операции
+    raw = np.asarray(np.memmap(path, np.uint8, 'c'))
+    arrays = {}
+    for column in header['columns']:
+        dtype = np.dtype(column['dtype'])
+        lo = start + column['offset']
+        hi = lo + dtype.itemsize * int(np.prod(column['shape'], dtype=np.int64))
+        if hi > len(raw):
+            raise ValueError('{}: truncated scene file'.format(path))
+        arrays[column['name']] = raw[lo:hi].view(dtype).reshape(column['shape'])
+
+    def part(prefix):
+        return {name[len(prefix):]: array for name, array in arrays.items() if name.startswith(prefix)}
+
+    # параметры преобразования сохранены нормированными: конструктор нормировал бы
+    # их заново, и вид сдвигался бы на ошибку округления при каждом открытии
+    transform = HypTransform.identity()
+    transform.a, transform.b = (complex(v) for v in arrays['transform'])
+    scene = HypScene(transform=transform, model=HypModel[header['model']])
+    scene.points.setState(part('points.'))
+    scene.lines.setState(part('lines.'))
+    # в сценах, сохранённых до появления графа построений, все объекты исходные
+    if 'graph.child' in arrays:
+        scene.graph.setState(part('graph.'))
+    if 'index.levels' in arrays:
+        scene.index = HypIncrementalIndex()
+        scene.index.setState(part('index.'))
+    return scene
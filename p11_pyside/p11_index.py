@@ -0,0 +1,800 @@
+"""
+Пространственный индекс объектов плоскости Лобачевского в модели Бельтрами-Клейна.
+
+Индекс -- статические деревья ограничивающих параллелепипедов, запросы --
+"все объекты на гиперболическом расстоянии не больше rho от точки u".
+Точки индексируются по координатам в модели БК: гиперболический шар в ней --
+эллипс, и дерево отсекает узлы по описанному вокруг него кругу. Прямые
+индексируются по их нормалям в модели гиперболоида, где условие "прямая
+проходит не дальше rho от u" линейно. Точная проверка делается для листьев,
+векторно. Поиск k ближайших точек сводится к одному такому запросу.
+
+Модуль зависит только от numpy: координаты передаются массивами.
+"""
+import numpy as np
+
+
+def bkBall(u, rho):
+    """
+    Круг в модели Бельтрами-Клейна, описанный вокруг гиперболического шара.
+
+    Шар радиуса rho с центром в точке u на расстоянии D = artanh|u| от центра диска --
+    эллипс, симметричный относительно луча 0u. Вдоль луча он занимает отрезок
+    [tanh(D - rho), tanh(D + rho)], а его полуось поперёк луча равна
+    tanh(rho) sqrt(1 - |u|**2) / sqrt(1 - |u|**2 tanh(rho)**2).
+
+    Parameters
+    ----------
+    u: complex
+      Центр шара, координаты в модели БК.
+    rho: float
+      Гиперболический радиус шара.
+
+    Returns
+    -------
+    center: complex
+      Центр описанного круга.
+    radius: float
+      Его евклидов радиус.
+    """
+    k = abs(u)
+    t = np.tanh(rho)
+    if k == 0:
+        return 0j, float(t)
+    d = np.arctanh(k)
+    r1, r2 = np.tanh(d - rho), np.tanh(d + rho)
+    across = t * ((1 - k ** 2) / (1 - (k * t) ** 2)) ** 0.5
+    return u / k * (r1 + r2) / 2, float(max((r2 - r1) / 2, across))
+
+
+def bkDistance(u, z):
+    """
+    Гиперболические расстояния между точками u и z модели Бельтрами-Клейна
+    (поэлементно, с broadcasting numpy).
+
+    В модели БК cosh d = (1 - <u, z>) / (su sz), где su = sqrt(1 - |u|**2), и так же sz.
+    Вычитание единицы переписано без сокращения близких чисел:
+      cosh d - 1 = (|u - z|**2 - (u x (z - u))**2) / ((1 - <u, z> + su sz) su sz),
+    а d = 2 arsinh(sqrt((cosh d - 1) / 2)), так что и малые расстояния
+    считаются с полной относительной точностью. Скалярное произведение и
+    векторное (u x (z - u)) -- это вещественная и мнимая части u^* (z - u).
+
+    Parameters
+    ----------
+    u, z: complex или numpy.ndarray
+      Комплексные координаты точек.
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+    # одиночная точка u остаётся числом python: так меньше векторных операций
+    u = complex(u) if np.ndim(u) == 0 else np.asarray(u)
+    z = np.asarray(z)
+    dz = z - u
+    w = np.conj(u) * dz
+    su2 = 1 - (u.real ** 2 + u.imag ** 2)
+    s = np.sqrt(su2 * (1 - (z.real ** 2 + z.imag ** 2)))
+    # 1 - <u, z> = 1 - |u|**2 - <u, z - u>
+    x = np.maximum(dz.real ** 2 + dz.imag ** 2 - w.imag ** 2, 0) / ((su2 - w.real + s) * s)
+    return 2 * np.arcsinh(np.sqrt(x / 2))
+
+
+class _BoxTree:
+    """
+    Статическое дерево ограничивающих параллелепипедов над точками
+    d-мерного пространства. Листья содержат не более leafSize точек,
+    внутренние узлы делят точки пополам по медиане вдоль самой длинной стороны.
+
+    Parameters
+    ----------
+    coords: numpy.ndarray
+      Массив формы (n, d) с координатами точек.
+    """
+    def __init__(self, coords, leafSize=64):
+        self.coords = coords
+        self.leafSize = leafSize
+        self.order = np.arange(len(coords))
+        # узлы: границы (обычные float: обход дерева идёт в чистом python),
+        # диапазон в self.order и пара детей (None у листьев)
+        self.lows = []
+        self.highs = []
+        self.ranges = []
+        self.children = []
+        # узлы в виде массивов (см. setState), ещё не переведённые в списки
+        self._packed = None
+        if len(coords):
+            self._build()
+
+    def _build(self):
+        stack = [(self._newNode(0, len(self.order)), 0, len(self.order))]
+        while stack:
+            node, lo, hi = stack.pop()
+            if hi - lo <= self.leafSize:
+                continue
+            idx = self.order[lo:hi]
+            axis = int(np.argmax(np.subtract(self.highs[node], self.lows[node])))
+            mid = (hi - lo) // 2
+            self.order[lo:hi] = idx[np.argpartition(self.coords[idx, axis], mid)]
+            left = self._newNode(lo, lo + mid)
+            right = self._newNode(lo + mid, hi)
+            self.children[node] = (left, right)
+            stack.append((left, lo, lo + mid))
+            stack.append((right, lo + mid, hi))
+
+    def _newNode(self, lo, hi):
+        c = self.coords[self.order[lo:hi]]
+        self.lows.append(c.min(axis=0).tolist())
+        self.highs.append(c.max(axis=0).tolist())
+        self.ranges.append((lo, hi))
+        self.children.append(None)
+        return len(self.lows) - 1
+
+    def state(self):
+        """
+        Дерево в виде массивов numpy, см. setState.
+        """
+        if self._packed is not None:
+            return dict(self._packed, coords=self.coords, order=self.order)
+        d = self.coords.shape[1]
+        children = [(-1, -1) if c is None else c for c in self.children]
+        return {'coords': self.coords, 'order': self.order,
+                'lows': np.array(self.lows, np.float64).reshape(-1, d),
+                'highs': np.array(self.highs, np.float64).reshape(-1, d),
+                'ranges': np.array(self.ranges, np.int64).reshape(-1, 2),
+                'children': np.array(children, np.int64).reshape(-1, 2)}
+
+    def setState(self, state):
+        """
+        Принять дерево, полученное от state, без перестройки. Координаты и
+        порядок точек берутся без копирования и могут быть отображены в память,
+        а узлы переводятся в списки только при первом запросе.
+        """
+        self.coords, self.order = state['coords'], state['order']
+        self._packed = {name: state[name] for name in ('lows', 'highs', 'ranges', 'children')}
+
+    def _unpack(self):
+        packed, self._packed = self._packed, None
+        self.lows = packed['lows'].tolist()
+        self.highs = packed['highs'].tolist()
+        self.ranges = [tuple(r) for r in packed['ranges'].tolist()]
+        self.children = [None if c[0] < 0 else tuple(c) for c in packed['children'].tolist()]
+
+    def near(self, x, size):
+        """
+        Точки узла рядом с x, в котором не меньше size точек: спуск от корня,
+        пока у ближайшего (по евклидову расстоянию до параллелепипеда) ребёнка
+        хватает точек.
+
+        Returns
+        -------
+        numpy.ndarray
+          Номера точек узла.
+        """
+        if self._packed is not None:
+            self._unpack()
+        node = 0
+        while self.children[node] is not None:
+            best = None
+            for child in self.children[node]:
+                lo, hi = self.ranges[child]
+                if hi - lo < size:
+                    continue
+                gap = sum(max(l - xi, 0, xi - h) ** 2 for xi, l, h in zip(x, self.lows[child], self.highs[child]))
+                if best is None or gap < best[0]:
+                    best = gap, child
+            if best is None:
+                break
+            node = best[1]
+        lo, hi = self.ranges[node]
+        return self.order[lo:hi]
+
+    def query(self, boxTest, pointTest):
+        """
+        Обход дерева с отсечением узлов.
+
+        Parameters
+        ----------
+        boxTest
+          boxTest(lows, highs) -> False, если в параллелепипеде точно нет нужных точек,
+          True, если там все точки нужные, и None, если надо смотреть глубже.
+        pointTest
+          pointTest(coords) -> булев массив для точек листа.
+
+        Returns
+        -------
+        numpy.ndarray
+          Номера найденных точек, не отсортированы.
+        """
+        if self._packed is not None:
+            self._unpack()
+        found = []
+        stack = [0] if self.lows else []
+        while stack:
+            node = stack.pop()
+            inside = boxTest(self.lows[node], self.highs[node])
+            if inside is False:
+                continue
+            lo, hi = self.ranges[node]
+            if inside:
+                found.append(self.order[lo:hi])
+            elif self.children[node] is None:
+                idx = self.order[lo:hi]
+                found.append(idx[pointTest(self.coords[idx])])
+            else:
+                stack.extend(self.children[node])
+        return np.concatenate(found) if found else np.zeros(0, dtype=np.intp)
+
+
+def _withPrefix(prefix, state):
+    # вложенное состояние (см. методы state) под именами с приставкой
+    return {prefix + name: array for name, array in state.items()}
+
+
+def _withoutPrefix(prefix, state):
+    # вложенное состояние с приставкой prefix обратно под своими именами
+    return {name[len(prefix):]: array for name, array in state.items() if name.startswith(prefix)}
+
+
+def _diskTest(center, radius):
+    # проверки для запроса "точки внутри круга"
+    cx, cy, r2 = float(center.real), float(center.imag), float(radius) ** 2
+
+    def boxTest(lows, highs):
+        (x0, y0), (x1, y1) = lows, highs
+        dx = max(x0 - cx, 0, cx - x1)
+        dy = max(y0 - cy, 0, cy - y1)
+        if dx * dx + dy * dy > r2:
+            return False
+        fx = max(cx - x0, x1 - cx)
+        fy = max(cy - y0, y1 - cy)
+        return True if fx * fx + fy * fy <= r2 else None
+
+    def pointTest(coords):
+        return (coords[:, 0] - cx) ** 2 + (coords[:, 1] - cy) ** 2 <= r2
+
+    return boxTest, pointTest
+
+
+def _slabTest(w, s):
+    # проверки для запроса "точки в слое |w . x| <= s"
+    w = [float(x) for x in w]
+
+    def boxTest(lows, highs):
+        vmin = vmax = 0.0
+        for wi, lo, hi in zip(w, lows, highs):
+            a, b = wi * lo, wi * hi
+            vmin += min(a, b)
+            vmax += max(a, b)
+        if vmin > s or vmax < -s:
+            return False
+        return True if -s <= vmin and vmax <= s else None
+
+    def pointTest(coords):
+        return np.abs(coords @ w) <= s
+
+    return boxTest, pointTest
+
+
+class HypSpatialIndex:
+    """
+    Индекс точек и прямых плоскости Лобачевского.
+
+    Parameters
+    ----------
+    points: numpy.ndarray
+      Комплексные координаты точек в модели Бельтрами-Клейна.
+    a, b, c: numpy.ndarray
+      Нормированные коэффициенты прямых a x + b y + c = 0 в модели Бельтрами-Клейна.
+      Прямые, не пересекающие абсолют, в индекс не попадают.
+    leafSize: int
+      Размер листьев дерева.
+    """
+    def __init__(self, points=(), a=(), b=(), c=(), leafSize=64):
+        self.points = np.asarray(points, dtype=np.complex128).reshape(-1)
+        self.a = np.asarray(a, dtype=np.float64).reshape(-1)
+        self.b = np.asarray(b, dtype=np.float64).reshape(-1)
+        self.c = np.asarray(c, dtype=np.float64).reshape(-1)
+
+        self.pointTree = _BoxTree(np.stack([self.points.real, self.points.imag], -1), leafSize)
+
+        # Прямая с |c| < 1 -- это единичный пространственноподобный вектор
+        # N = (a, b, -c) / sqrt(1 - c**2) в модели гиперболоида, а расстояние от
+        # точки X гиперболоида до неё: sinh d = |<X, N>|. Поэтому прямые индексируются
+        # как точки N в R^3, и запрос "прямые около u" -- это запрос точек в слое.
+        self.lineIds = np.flatnonzero(np.abs(self.c) < 1)
+        a, b, c = self.a[self.lineIds], self.b[self.lineIds], self.c[self.lineIds]
+        self.lineTree = _BoxTree(np.stack([a, b, -c], -1) / np.sqrt(1 - c ** 2)[:, None], leafSize)
+
+    def __len__(self):
+        return len(self.points) + len(self.lineIds)
+
+    def state(self):
+        """
+        Индекс в виде массивов numpy, см. setState.
+        """
+        state = {'points': self.points, 'a': self.a, 'b': self.b, 'c': self.c, 'lineIds': self.lineIds}
+        state.update(_withPrefix('pointTree.', self.pointTree.state()))
+        state.update(_withPrefix('lineTree.', self.lineTree.state()))
+        return state
+
+    def setState(self, state):
+        """
+        Принять индекс, полученный от state, без перестройки деревьев.
+        """
+        self.points, self.a, self.b, self.c = state['points'], state['a'], state['b'], state['c']
+        self.lineIds = state['lineIds']
+        self.pointTree.setState(_withoutPrefix('pointTree.', state))
+        self.lineTree.setState(_withoutPrefix('lineTree.', state))
+
+    def pointsWithin(self, u, rho):
+        """
+        Точки на гиперболическом расстоянии не больше rho от точки u.
+
+        Parameters
+        ----------
+        u: complex
+          Точка в модели Бельтрами-Клейна.
+        rho: float
+          Гиперболический радиус, может быть бесконечным.
+
+        Returns
+        -------
+        numpy.ndarray
+          Номера точек.
+        """
+        idx = self.pointTree.query(*_diskTest(*bkBall(u, rho)))
+        return idx[bkDistance(u, self.points[idx]) <= rho]
+
+    def nearestPoints(self, u, k):
+        """
+        k ближайших к точке u точек (все, если точек меньше k).
+
+        Расстояние до k-ой ближайшей оценивается сверху по точкам узла дерева
+        рядом с u, в котором не меньше k точек, а затем ближайшие выбираются
+        из точек шара этого радиуса, как в pointsWithin.
+
+        Parameters
+        ----------
+        u: complex
+          Точка в модели Бельтрами-Клейна.
+        k: int
+
+        Returns
+        -------
+        rows: numpy.ndarray
+          Номера точек по возрастанию расстояния.
+        distances: numpy.ndarray
+          Гиперболические расстояния до них.
+        """
+        k = min(k, len(self.points))
+        if k <= 0:
+            return np.zeros(0, np.intp), np.zeros(0)
+        near = self.pointTree.near((u.real, u.imag), k)
+        rho = np.partition(bkDistance(u, self.points[near]), k - 1)[k - 1]
+        # шар с запасом на округление в описанном вокруг него круге
+        idx = self.pointTree.query(*_diskTest(*bkBall(u, rho * (1 + 1e-9) + 1e-12)))
+        distances = bkDistance(u, self.points[idx])
+        if len(idx) > k:
+            nearest = np.argpartition(distances, k - 1)[:k]
+            idx, distances = idx[nearest], distances[nearest]
+        # при равных расстояниях раньше идёт меньшая строка
+        nearest = np.lexsort((idx, distances))
+        return idx[nearest], distances[nearest]
+
+    def linesWithin(self, u, rho):
+        """
+        Прямые, проходящие на гиперболическом расстоянии не больше rho от точки u.
+
+        Returns
+        -------
+        numpy.ndarray
+          Номера прямых.
+        """
+        # точка u на гиперболоиде, со знаком у последней координаты,
+        # превращающим форму Минковского в обычное скалярное произведение
+        x = np.array([u.real, u.imag, -1]) / (1 - abs(u) ** 2) ** 0.5
+        return self.lineIds[self.lineTree.query(*_slabTest(x, np.sinh(rho)))]
+
+
+def sortedContains(sortedIds, ids):
+    """
+    Какие из ids есть в отсортированном массиве sortedIds.
+
+    Returns
+    -------
+    numpy.ndarray
+      Булев массив той же формы, что и ids.
+    """
+    ids = np.asarray(ids)
+    if len(sortedIds) == 0:
+        return np.zeros(ids.shape, np.bool_)
+    rows = np.minimum(np.searchsorted(sortedIds, ids), len(sortedIds) - 1)
+    return sortedIds[rows] == ids
+
+
+class HypIncrementalIndex:
+    """
+    Пополняемый индекс точек и прямых с id. Состоит из уровней -- статических
+    HypSpatialIndex, каждый следующий хотя бы вдвое меньше предыдущего: новые
+    объекты образуют новый уровень, а соседние уровни сравнимого размера
+    сливаются. Так каждый объект перестраивается O(log n) раз, а запрос
+    обходит O(log n) уровней.
+
+    Удаление не поддерживается: объекты, удалённые у владельца индекса,
+    отсеиваются им самим по id.
+    """
+    def __init__(self, leafSize=64):
+        self.leafSize = leafSize
+        # уровни: (индекс, id точек, id прямых), id внутри уровня отсортированы
+        self.levels = []
+
+    def __len__(self):
+        return sum(len(pointIds) + len(lineIds) for _, pointIds, lineIds in self.levels)
+
+    def add(self, pointIds, points, lineIds, a, b, c):
+        """
+        Добавить объекты.
+
+        Parameters
+        ----------
+        pointIds, lineIds: numpy.ndarray
+          Id точек и прямых, которых ещё нет в индексе.
+        points: numpy.ndarray
+          Комплексные координаты точек в модели Бельтрами-Клейна.
+        a, b, c: numpy.ndarray
+          Нормированные коэффициенты прямых.
+        """
+        if len(pointIds) + len(lineIds) == 0:
+            return
+        self.levels.append(self._level(pointIds, points, lineIds, a, b, c))
+        while len(self.levels) > 1:
+            (index1, points1, lines1), (index2, points2, lines2) = self.levels[-2:]
+            if len(points1) + len(lines1) > 2 * (len(points2) + len(lines2)):
+                break
+            del self.levels[-2:]
+            self.levels.append(self._level(np.concatenate([points1, points2]),
+                                           np.concatenate([index1.points, index2.points]),
+                                           np.concatenate([lines1, lines2]),
+                                           np.concatenate([index1.a, index2.a]),
+                                           np.concatenate([index1.b, index2.b]),
+                                           np.concatenate([index1.c, index2.c])))
+
+    def state(self):
+        """
+        Все уровни индекса в виде массивов numpy, см. setState.
+        """
+        state = {'levels': np.array([len(self.levels)], np.int64)}
+        for i, (index, pointIds, lineIds) in enumerate(self.levels):
+            prefix = 'level{}.'.format(i)
+            state[prefix + 'pointIds'] = pointIds
+            state[prefix + 'lineIds'] = lineIds
+            state.update(_withPrefix(prefix + 'index.', index.state()))
+        return state
+
+    def setState(self, state):
+        """
+        Заменить уровни индекса полученными от state. Массивы берутся без
+        копирования, так что индекс, сохранённый вместе со сценой, открывается
+        без перестройки.
+        """
+        self.levels = []
+        for i in range(int(state['levels'][0])):
+            level = _withoutPrefix('level{}.'.format(i), state)
+            index = HypSpatialIndex(leafSize=self.leafSize)
+            index.setState(_withoutPrefix('index.', level))
+            self.levels.append((index, level['pointIds'], level['lineIds']))
+
+    def _level(self, pointIds, points, lineIds, a, b, c):
+        pointOrder = np.argsort(pointIds, kind='stable')
+        lineOrder = np.argsort(lineIds, kind='stable')
+        index = HypSpatialIndex(np.asarray(points)[pointOrder], np.asarray(a)[lineOrder],
+                                np.asarray(b)[lineOrder], np.asarray(c)[lineOrder], self.leafSize)
+        return index, np.asarray(pointIds)[pointOrder], np.asarray(lineIds)[lineOrder]
+
+    def containsPoints(self, ids):
+        """
+        Какие из id точек уже есть в индексе.
+        """
+        found = np.zeros(np.shape(ids), np.bool_)
+        for _, pointIds, _ in self.levels:
+            found |= sortedContains(pointIds, ids)
+        return found
+
+    def containsLines(self, ids):
+        """
+        Какие из id прямых уже есть в индексе.
+        """
+        found = np.zeros(np.shape(ids), np.bool_)
+        for _, _, lineIds in self.levels:
+            found |= sortedContains(lineIds, ids)
+        return found
+
+    def pointsWithin(self, u, rho):
+        """
+        Id точек на гиперболическом расстоянии не больше rho от точки u, см. HypSpatialIndex.
+        """
+        return np.concatenate([np.zeros(0, np.int64)] + [pointIds[index.pointsWithin(u, rho)]
+                                                        for index, pointIds, _ in self.levels])
+
+    def nearestPoints(self, u, k):
+        """
+        Id k ближайших к точке u точек и расстояния до них, см. HypSpatialIndex.nearestPoints.
+        """
+        ids, distances = [np.zeros(0, np.int64)], [np.zeros(0)]
+        for index, pointIds, _ in self.levels:
+            rows, d = index.nearestPoints(u, k)
+            ids.append(pointIds[rows])
+            distances.append(d)
+        ids, distances = np.concatenate(ids), np.concatenate(distances)
+        nearest = np.argsort(distances, kind='stable')[:k]
+        return ids[nearest], distances[nearest]
+
+    def linesWithin(self, u, rho):
+        """
+        Id прямых, проходящих на гиперболическом расстоянии не больше rho от точки u.
+        """
+        return np.concatenate([np.zeros(0, np.int64)] + [lineIds[index.linesWithin(u, rho)]
+                                                        for index, _, lineIds in self.levels])
+
+
+# шаг сетки ключей и точность, с которой совпадают объекты
+GRID_STEP = 2.0 ** -30
+GRID_TOLERANCE = 1e-10
+# смещение, делающее номера ячеек сетки неотрицательными (с запасом на соседей),
+# и число номеров по одной оси. Номера -- от 0 до 2**31 + 8, и пара упаковывается
+# умножением: сдвиг на 32 бита переполнял бы int64 на краю квадрата.
+_GRID_OFFSET = (1 << 30) + 4
+_GRID_WIDTH = 2 * _GRID_OFFSET
+
+
+def gridKeys(u, v, step=GRID_STEP, tolerance=GRID_TOLERANCE):
+    """
+    Ключи ячеек квадратной сетки для точек (u, v) квадрата [-1, 1] x [-1, 1].
+
+    Ячейка -- это округление координат до кратных step, её номера упаковываются
+    в одно неотрицательное int64. Кроме того, для каждой точки даются ключи соседних
+    ячеек, до границы с которыми от неё ближе tolerance: совпадающие с точностью
+    до tolerance точки по разные стороны границы ячеек находятся по ним.
+
+    Returns
+    -------
+    keys: numpy.ndarray
+      Ключи ячеек точек.
+    probes: numpy.ndarray
+      Массив формы (n, 3) с ключами соседних ячеек, -1 -- если соседа нет.
+    """
+    fu, fv = np.asarray(u) / step, np.asarray(v) / step
+    iu, iv = np.round(fu).astype(np.int64), np.round(fv).astype(np.int64)
+    t = 0.5 - tolerance / step
+    su = np.where(fu - iu > t, 1, np.where(fu - iu < -t, -1, 0))
+    sv = np.where(fv - iv > t, 1, np.where(fv - iv < -t, -1, 0))
+
+    def pack(i, j):
+        return (i + _GRID_OFFSET) * _GRID_WIDTH + (j + _GRID_OFFSET)
+
+    probes = np.stack([np.where(su != 0, pack(iu + su, iv), -1),
+                       np.where(sv != 0, pack(iu, iv + sv), -1),
+                       np.where((su != 0) & (sv != 0), pack(iu + su, iv + sv), -1)], -1)
+    return pack(iu, iv), probes
+
+
+class HypDedupeIndex:
+    """
+    Хэш-индекс для отбрасывания совпадающих объектов. Объект представлен ключом
+    (см. gridKeys) и ключами для проверки; совпадающими считаются объекты, ключ
+    одного из которых равен ключу или одному из ключей для проверки другого.
+
+    Это хэш-таблица с открытой адресацией и линейным пробированием, в которой все
+    операции выполняются сразу над массивом ключей: проверка и регистрация
+    объекта -- O(1) в среднем, без цикла python по объектам. Таблица считает,
+    сколько зарегистрировано объектов с каждым ключом, так что снятие
+    с регистрации одного из совпадающих объектов не теряет остальные.
+    """
+    # пустая ячейка и ячейка удалённого ключа (ключи неотрицательны)
+    EMPTY = -1
+    DELETED = -2
+
+    def __init__(self, capacity=1024):
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.keys = np.full(capacity, self.EMPTY, np.int64)
+        self.counts = np.zeros(capacity, np.int64)
+        # занятые ячейки, включая удалённые, и живые ключи
+        self.used = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _hash(self, keys):
+        # мультипликативное хэширование (Фибоначчи), старшие биты произведения
+        bits = len(self.keys).bit_length() - 1
+        with np.errstate(over='ignore'):
+            h = keys.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+        return (h >> np.uint64(64 - bits)).astype(np.intp)
+
+    def _find(self, keys):
+        # ячейки ключей, -1 -- для отсутствующих
+        slots = self._hash(keys)
+        found = np.full(len(keys), -1, np.intp)
+        pending = np.arange(len(keys))
+        mask = len(self.keys) - 1
+        while len(pending):
+            current = self.keys[slots]
+            hit = current == keys[pending]
+            found[pending[hit]] = slots[hit]
+            more = ~hit & (current != self.EMPTY)
+            pending, slots = pending[more], (slots[more] + 1) & mask
+        return found
+
+    def _insert(self, keys, counts):
+        # вставка ключей, которых в таблице нет (все keys различны)
+        if 2 * (self.used + len(keys)) > len(self.keys):
+            self._rehash(self.used + len(keys))
+        slots = self._hash(keys)
+        mask = len(self.keys) - 1
+        while len(keys):
+            # претенденты на свободные ячейки записывают в них свои ключи,
+            # ячейку получает тот, чей ключ в ней остался
+            free = np.flatnonzero(self.keys[slots] == self.EMPTY)
+            self.keys[slots[free]] = keys[free]
+            won = np.zeros(len(keys), np.bool_)
+            won[free] = self.keys[slots[free]] == keys[free]
+            self.counts[slots[won]] = counts[won]
+            rest = ~won
+            keys, counts, slots = keys[rest], counts[rest], (slots[rest] + 1) & mask
+
+    def _rehash(self, needed):
+        live = self.keys >= 0
+        keys, counts = self.keys[live], self.counts[live]
+        capacity = len(self.keys)
+        while 2 * needed > capacity:
+            capacity *= 2
+        self._allocate(capacity)
+        self._place(keys, counts)
+
+    def _place(self, keys, counts):
+        self._insert(keys, counts)
+        self.used += len(keys)
+        self.size += len(keys)
+
+    def add(self, keys):
+        """
+        Зарегистрировать объекты с ключами keys.
+        """
+        keys, n = np.unique(np.asarray(keys, dtype=np.int64), return_counts=True)
+        slots = self._find(keys)
+        known = slots >= 0
+        self.counts[slots[known]] += n[known]
+        if not known.all():
+            self._place(keys[~known], n[~known])
+
+    def discard(self, keys):
+        """
+        Снять объекты с ключами keys с регистрации.
+        """
+        keys, n = np.unique(np.asarray(keys, dtype=np.int64), return_counts=True)
+        slots = self._find(keys)
+        slots, n = slots[slots >= 0], n[slots >= 0]
+        self.counts[slots] -= n
+        gone = slots[self.counts[slots] <= 0]
+        self.keys[gone] = self.DELETED
+        self.counts[gone] = 0
+        self.size -= len(gone)
+
+    def clear(self):
+        self._allocate(1024)
+
+    def state(self):
+        """
+        Состояние таблицы в виде массивов numpy, см. setState.
+        """
+        return {'keys': self.keys, 'counts': self.counts, 'sizes': np.array([self.used, self.size], np.int64)}
+
+    def setState(self, state):
+        """
+        Принять состояние, полученное от state. Массивы берутся без копирования,
+        так что годятся и отображённые в память: из них читаются только ячейки,
+        которые затрагивают запросы.
+        """
+        self.keys, self.counts = state['keys'], state['counts']
+        self.used, self.size = (int(v) for v in state['sizes'])
+
+    def isNew(self, keys, probes):
+        """
+        Какие из объектов не совпадают ни с зарегистрированными, ни с предыдущими
+        объектами из того же набора. Сами объекты не регистрируются.
+
+        Returns
+        -------
+        numpy.ndarray
+          Булев массив той же длины, что и keys.
+        """
+        keys = np.asarray(keys, dtype=np.int64)
+        if len(keys) == 0:
+            return np.zeros(0, np.bool_)
+        probed = probes >= 0
+
+        # совпадения с зарегистрированными
+        new = self._find(keys) < 0
+        rows, cols = np.nonzero(probed)
+        new[rows[self._find(probes[rows, cols]) >= 0]] = False
+
+        # совпадения внутри набора: ключ или ключ для проверки равен ключу
+        # одного из предыдущих объектов
+        unique, first = np.unique(keys, return_index=True)
+        new[np.setdiff1d(np.arange(len(keys)), first, assume_unique=True)] = False
+        at = np.minimum(np.searchsorted(unique, probes[rows, cols]), len(unique) - 1)
+        earlier = (unique[at] == probes[rows, cols]) & (first[at] < rows)
+        new[rows[earlier]] = False
+        return new
+
+
+class HypChordSweep:
+    """
+    Поиск пересекающихся хорд единичного круга, т.е. прямых модели Бельтрами-Клейна.
+
+    Хорды пересекаются внутри круга тогда и только тогда, когда их концы чередуются
+    вдоль окружности. Если хорду задать дугой [s, e] между углами её концов, то хорда j,
+    начинающаяся позже хорды i, пересекает её, если s_i < s_j < e_i < e_j. В порядке
+    обхода по s такие j идут подряд сразу за i (пока s_j < e_i), и из них нужны те,
+    у кого e_j > e_i. Их находит спуск по дереву отрезков с максимумами e, отсекающий
+    поддеревья с максимумом не больше e_i: на хорду уходит O((1 + k_i) log n), где
+    k_i -- число найденных пар, а всего -- O((n + k) log n). Спуск идёт сразу для
+    многих хорд, по уровням дерева.
+
+    Parameters
+    ----------
+    t1, t2: numpy.ndarray
+      Углы концов хорд.
+    """
+    def __init__(self, t1, t2):
+        s, e = np.minimum(t1, t2), np.maximum(t1, t2)
+        self.order = np.lexsort((e, s))
+        self.opens = s[self.order]
+        self.closes = e[self.order]
+        # хорды, начинающиеся строго позже i-й, но раньше её конца, -- строки
+        # starts[i] .. ends[i] - 1; хорды с общим концом не пересекаются
+        self.starts = np.searchsorted(self.opens, self.opens, 'right')
+        self.ends = np.searchsorted(self.opens, self.closes, 'left')
+
+        n = len(self.order)
+        self.size = 1 << max(n - 1, 0).bit_length()
+        tree = np.full(2 * self.size, -np.inf)
+        tree[self.size:self.size + n] = self.closes
+        level = self.size
+        while level > 1:
+            tree[level // 2:level] = np.maximum(tree[level:2 * level:2], tree[level + 1:2 * level:2])
+            level //= 2
+        self.tree = tree
+
+    def __len__(self):
+        return len(self.order)
+
+    def crossings(self, lo, hi):
+        """
+        Пары пересекающихся хорд (i, j), где хорда i -- из строк lo..hi-1 порядка
+        обхода, а j начинается позже неё. Каждая пара пересекающихся хорд находится
+        ровно для одной из строк.
+
+        Returns
+        -------
+        i, j: numpy.ndarray
+          Номера хорд в исходной нумерации.
+        """
+        rows = np.arange(lo, hi)
+        rows = rows[self.starts[rows] < self.ends[rows]]
+        nodes = np.ones(len(rows), np.int64)
+        width = self.size
+        while width > 1:
+            width //= 2
+            rows = np.concatenate([rows, rows])
+            nodes = np.concatenate([2 * nodes, 2 * nodes + 1])
+            # первая строка, покрываемая узлом: узлы уровня нумеруются с size // width
+            start = (nodes - self.size // width) * width
+            keep = ((start < self.ends[rows]) & (start + width > self.starts[rows])
+                    & (self.tree[nodes] > self.closes[rows]))
+            rows, nodes = rows[keep], nodes[keep]
+        return self.order[rows], self.order[nodes - self.size]
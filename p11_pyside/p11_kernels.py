@@ -0,0 +1,325 @@
+"""
+Вычислительные ядра массивов геометрии плоскости Лобачевского с выбором
+реализации (бэкенда) во время работы: пересчёт координат между моделями,
+идеальные точки прямых, пересечение прямых, применение преобразований к
+точкам и переносы, переводящие одни точки в другие.
+
+Через ядра идут только массивы (HypPointArray, HypLineArray,
+HypTransformArray, применение HypTransform к массиву). Одиночные HypPoint,
+HypLine и HypTransform считают своими формулами на обычных числах, и выбор
+бэкенда на них не влияет; test_p11_kernels сверяет их с эталоном.
+
+Бэкенды:
+  numpy -- векторные выражения numpy; эталон, с которым сверяются остальные,
+    и реализация по умолчанию;
+  python -- циклы по элементам на обычной арифметике Python, те же формулы,
+    что у одиночных HypPoint, HypLine и HypTransform;
+  numba -- те же циклы, скомпилированные numba.njit. Numba -- необязательная
+    зависимость и загружается, только когда этот бэкенд выбран.
+
+Бэкенд выбирается переменной окружения HYP_BACKEND при загрузке модуля (с
+неизвестным именем -- предупреждение и эталон) или функцией setBackend, для
+всех ядер сразу или для некоторых. Ядра бэкенда,
+который недоступен (не установлена numba), берутся из эталона.
+
+Сверка всех доступных бэкендов с эталоном (недоступные пропускаются):
+  python -m pytest test_p11_kernels.py
+"""
+import os
+import math
+import warnings
+import importlib.util
+
+import numpy as np
+
+# ядра по порядку; у каждого -- одноимённая функция модуля, которая вызывает выбранную реализацию
+KERNELS = ('toPoincare', 'toKlein', 'idealPoints', 'intersect', 'moebius', 'pToQ')
+REFERENCE = 'numpy'
+
+
+def _toPoincareNumpy(z):
+    r2 = z.real ** 2 + z.imag ** 2
+    # точки вне абсолюта превращаются в nan, а не в комплексный корень
+    with np.errstate(invalid='ignore'):
+        return z / (1 + np.sqrt(1 - r2))
+
+
+def _toKleinNumpy(z):
+    return 2 * z / (1 + z.real ** 2 + z.imag ** 2)
+
+
+def _idealPointsNumpy(a, b, c):
+    with np.errstate(invalid='ignore'):
+        nc = np.sqrt(1 - c ** 2)
+    return (-a * c - b * nc) + 1j * (-b * c + a * nc), (-a * c + b * nc) + 1j * (-b * c - a * nc)
+
+
+def _intersectNumpy(a1, b1, c1, a2, b2, c2):
+    d = a1 * b2 - b1 * a2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x = (b1 * c2 - b2 * c1) / d
+        y = (a2 * c1 - a1 * c2) / d
+    return x + 1j * y
+
+
+def _moebiusNumpy(a, b, z):
+    return (a * z + b) / (np.conjugate(b) * z + np.conjugate(a))
+
+
+def _pToQNumpy(p, q):
+    p2 = p.real ** 2 + p.imag ** 2
+    q2 = q.real ** 2 + q.imag ** 2
+    return 1 - 2 * p.conjugate() * q + p2 * q2, (1 + p2) * q - (1 + q2) * p
+
+
+# Циклы по элементам. Один и тот же код исполняется Python (элементы -- списки
+# обычных чисел) и компилируется numba (элементы -- массивы), поэтому в нём
+# только то, что понимают оба: индексы, арифметика, math и np.empty. Где
+# numpy получил бы inf или nan делением на ноль или корнем из отрицательного,
+# цикл сразу даёт nan: вне плоскости бэкенды согласны в том, что результат
+# не конечен, но не обязательно в самом значении.
+
+
+def _toPoincareLoop(z):
+    out = np.empty(len(z), np.complex128)
+    for i in range(len(z)):
+        w = z[i]
+        s = 1 - (w.real ** 2 + w.imag ** 2)
+        out[i] = w / (1 + math.sqrt(s)) if s >= 0 else complex(math.nan, math.nan)
+    return out
+
+
+def _toKleinLoop(z):
+    out = np.empty(len(z), np.complex128)
+    for i in range(len(z)):
+        w = z[i]
+        out[i] = 2 * w / (1 + w.real ** 2 + w.imag ** 2)
+    return out
+
+
+def _idealPointsLoop(a, b, c):
+    p = np.empty(len(a), np.complex128)
+    q = np.empty(len(a), np.complex128)
+    for i in range(len(a)):
+        x, y, w = a[i], b[i], c[i]
+        s = 1 - w ** 2
+        nc = math.sqrt(s) if s >= 0 else math.nan
+        p[i] = complex(-x * w - y * nc, -y * w + x * nc)
+        q[i] = complex(-x * w + y * nc, -y * w - x * nc)
+    return p, q
+
+
+def _intersectLoop(a1, b1, c1, a2, b2, c2):
+    out = np.empty(len(a1), np.complex128)
+    for i in range(len(a1)):
+        d = a1[i] * b2[i] - b1[i] * a2[i]
+        if d != 0:
+            out[i] = complex((b1[i] * c2[i] - b2[i] * c1[i]) / d, (a2[i] * c1[i] - a1[i] * c2[i]) / d)
+        else:
+            out[i] = complex(math.nan, math.nan)
+    return out
+
+
+def _moebiusLoop(a, b, z):
+    out = np.empty(len(z), np.complex128)
+    for i in range(len(z)):
+        d = b[i].conjugate() * z[i] + a[i].conjugate()
+        out[i] = (a[i] * z[i] + b[i]) / d if d != 0 else complex(math.nan, math.nan)
+    return out
+
+
+def _pToQLoop(p, q):
+    a = np.empty(len(p), np.complex128)
+    b = np.empty(len(p), np.complex128)
+    for i in range(len(p)):
+        u, v = p[i], q[i]
+        u2 = u.real ** 2 + u.imag ** 2
+        v2 = v.real ** 2 + v.imag ** 2
+        a[i] = 1 - 2 * u.conjugate() * v + u2 * v2
+        b[i] = (1 + u2) * v - (1 + v2) * u
+    return a, b
+
+
+# типы аргументов ядер: к ним приводятся аргументы циклов
+_ARGUMENTS = {'toPoincare': (np.complex128,), 'toKlein': (np.complex128,),
+              'idealPoints': (np.float64,) * 3, 'intersect': (np.float64,) * 6,
+              'moebius': (np.complex128,) * 3, 'pToQ': (np.complex128,) * 2}
+_NUMPY = {'toPoincare': _toPoincareNumpy, 'toKlein': _toKleinNumpy, 'idealPoints': _idealPointsNumpy,
+          'intersect': _intersectNumpy, 'moebius': _moebiusNumpy, 'pToQ': _pToQNumpy}
+_LOOPS = {'toPoincare': _toPoincareLoop, 'toKlein': _toKleinLoop, 'idealPoints': _idealPointsLoop,
+          'intersect': _intersectLoop, 'moebius': _moebiusLoop, 'pToQ': _pToQLoop}
+
+
+def _elementwise(loop, types, toList):
+    # Ядро из цикла: аргументы приводятся к типам types и к общей форме (по
+    # правилам broadcasting numpy), вытягиваются в строку, а результаты цикла
+    # получают эту форму обратно. Для Python элементы передаются списком.
+    def kernel(*args):
+        args = np.broadcast_arrays(*(np.asarray(x, t) for x, t in zip(args, types)))
+        shape = args[0].shape
+        flat = [x.ravel().tolist() if toList else np.ascontiguousarray(x).ravel() for x in args]
+        out = loop(*flat)
+        if isinstance(out, tuple):
+            return tuple(x.reshape(shape) for x in out)
+        return out.reshape(shape)
+    kernel.__name__ = loop.__name__
+    return kernel
+
+
+def _numbaKernels():
+    try:
+        import numba
+    except ImportError:
+        return None
+    # деление на ноль -- как в numpy, без исключений
+    return {name: _elementwise(numba.njit(error_model='numpy')(loop), _ARGUMENTS[name], False)
+            for name, loop in _LOOPS.items()}
+
+
+# бэкенды: имя -> функция, которая строит словарь ядер (или None, если бэкенд недоступен)
+BACKENDS = {
+    'numpy': lambda: _NUMPY,
+    'python': lambda: {name: _elementwise(loop, _ARGUMENTS[name], True) for name, loop in _LOOPS.items()},
+    'numba': _numbaKernels,
+}
+# построенные ядра бэкендов
+_loaded = {}
+# выбранные реализации: ядро -> (бэкенд, функция)
+_active = {}
+
+
+def _load(name):
+    if name not in _loaded:
+        _loaded[name] = BACKENDS[name]()
+    return _loaded[name]
+
+
+def available():
+    """
+    Доступные бэкенды: те, зависимости которых установлены. Сами зависимости
+    при этом не загружаются.
+
+    Returns
+    -------
+    list of str
+    """
+    return [name for name in BACKENDS if name != 'numba' or importlib.util.find_spec('numba') is not None]
+
+
+def setBackend(name, kernels=KERNELS):
+    """
+    Выбрать бэкенд для ядер kernels. Ядра, которых у бэкенда нет, и все ядра
+    недоступного бэкенда берутся из эталона REFERENCE.
+
+    Parameters
+    ----------
+    name: str
+      Имя бэкенда, см. BACKENDS.
+    kernels: sequence of str
+      Имена ядер, см. KERNELS.
+
+    Returns
+    -------
+    dict
+      Для каждого из kernels -- бэкенд, который для него теперь выбран.
+    """
+    if name not in BACKENDS:
+        raise ValueError('unknown compute backend {!r}, expected one of {}'.format(name, ', '.join(BACKENDS)))
+    unknown = set(kernels) - set(KERNELS)
+    if unknown:
+        raise ValueError('unknown kernels: {}'.format(', '.join(sorted(unknown))))
+    implementations = _load(name) or {}
+    for kernel in kernels:
+        if kernel in implementations:
+            _active[kernel] = name, implementations[kernel]
+        else:
+            _active[kernel] = REFERENCE, _load(REFERENCE)[kernel]
+    return {kernel: _active[kernel][0] for kernel in kernels}
+
+
+def backend(kernel=None):
+    """
+    Бэкенд, выбранный для ядра kernel, или, без аргумента, словарь бэкендов всех ядер.
+    """
+    if kernel is None:
+        return {kernel: name for kernel, (name, _) in _active.items()}
+    return _active[kernel][0]
+
+
+def implementation(kernel, name):
+    """
+    Реализация ядра kernel в бэкенде name, не выбирая её (например, для сверки
+    и замеров), или None, если бэкенд недоступен.
+    """
+    implementations = _load(name)
+    return None if implementations is None else implementations.get(kernel)
+
+
+def toPoincare(z):
+    """
+    Координаты точек модели Бельтрами-Клейна (комплексный массив) в модели
+    Пуанкаре. Точки вне абсолюта дают nan.
+    """
+    return _active['toPoincare'][1](z)
+
+
+def toKlein(z):
+    """
+    Координаты точек модели Пуанкаре в модели Бельтрами-Клейна.
+    """
+    return _active['toKlein'][1](z)
+
+
+def idealPoints(a, b, c):
+    """
+    Идеальные точки прямых a x + b y + c = 0 модели Бельтрами-Клейна с
+    a**2 + b**2 = 1, см. HypLine.idealPoints.
+
+    Returns
+    -------
+    p, q: numpy.ndarray
+      Координаты первых и вторых идеальных точек.
+    """
+    return _active['idealPoints'][1](a, b, c)
+
+
+def intersect(a1, b1, c1, a2, b2, c2):
+    """
+    Точки пересечения пар прямых a1 x + b1 y + c1 = 0 и a2 x + b2 y + c2 = 0,
+    координаты в модели Бельтрами-Клейна. Для параллельных в модели прямых не конечны.
+    """
+    return _active['intersect'][1](a1, b1, c1, a2, b2, c2)
+
+
+def moebius(a, b, z):
+    """
+    Образы точек z модели Пуанкаре при преобразованиях z -> (a z + b) / (b^* z + a^*).
+    """
+    return _active['moebius'][1](a, b, z)
+
+
+def pToQ(p, q):
+    """
+    Параметры (не нормированные) переносов, переводящих точки p в точки q
+    модели Пуанкаре, см. HypTransform.pToQ.
+
+    Returns
+    -------
+    a, b: numpy.ndarray
+    """
+    return _active['pToQ'][1](p, q)
+
+
+def _environmentBackend():
+    # бэкенд из HYP_BACKEND; опечатка в переменной окружения не должна мешать
+    # запуску, поэтому вместо исключения -- предупреждение и эталон
+    name = os.environ.get('HYP_BACKEND', REFERENCE)
+    if name not in BACKENDS:
+        warnings.warn('unknown compute backend {!r} in HYP_BACKEND, using {}'.format(name, REFERENCE),
+                      RuntimeWarning)
+        return REFERENCE
+    return name
+
+
+setBackend(_environmentBackend())
+
@@ -0,0 +1,225 @@
+"""
+Замер времени кадров отрисовки плоскости Лобачевского: сколько занимает
+каждая фаза кадра (отбор видимых объектов, преобразование, построение
+примитивов, растеризация, вывод на экран), сколько объектов нарисовано и
+отброшено и сколько проходит от движения мыши до кадра, в котором это
+движение видно.
+
+Выключенный профилировщик ничего не записывает: замеры в коде отрисовки
+стоят одного вызова метода на фазу кадра. Записанное выгружается в формате
+Trace Event (JSON), который открывают chrome://tracing и Perfetto.
+
+Модуль не зависит от Qt: время берётся из time.perf_counter.
+"""
+import os
+import json
+import time
+import threading
+from collections import deque
+
+import numpy as np
+
+
+class _HypSpan:
+    # замер одной фазы: with profiler.span('name'): ...
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter())
+
+
+class _HypNoSpan:
+    # замер выключенного профилировщика: не делает ничего
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NO_SPAN = _HypNoSpan()
+
+
+class HypFrameProfiler:
+    """
+    Профилировщик кадров. Фазы кадра замеряются через span, значения
+    счётчиков задаются через count, конец кадра отмечает endFrame: всё,
+    что записано между двумя endFrame, относится к одному кадру, в том числе
+    фазы из других потоков (растеризация).
+
+    Задержка ввода -- время от первого ещё не показанного движения мыши
+    (input) до вывода на экран кадра, заказанного после него (shown).
+
+    Parameters
+    ----------
+    frames: int
+      Сколько последних кадров хранить для сводки.
+    events: int
+      Сколько последних записей хранить для выгрузки трассы.
+    """
+    def __init__(self, frames=120, events=200000):
+        self.enabled = False
+        self.origin = time.perf_counter()
+        # записи трассы: (род, имя, начало, длительность, поток, значения)
+        self.events = deque(maxlen=events)
+        # по кадрам: время конца, длительности фаз (с), значения счётчиков
+        self.frames = deque(maxlen=frames)
+        self.latencies = deque(maxlen=frames)
+        # фазы текущего кадра пишутся и из других потоков (растеризация, построения)
+        self._lock = threading.Lock()
+        self._phases = {}
+        self._counters = {}
+        self._input = None
+
+    def setEnabled(self, enabled):
+        """
+        Включить или выключить запись. При включении прежние записи стираются,
+        при выключении забывается ещё не показанный ввод.
+        """
+        if enabled and not self.enabled:
+            self.clear()
+        elif not enabled:
+            self._input = None
+        self.enabled = bool(enabled)
+
+    def clear(self):
+        self.events.clear()
+        self.frames.clear()
+        self.latencies.clear()
+        with self._lock:
+            self._phases = {}
+        self._counters = {}
+        self._input = None
+
+    def span(self, name):
+        """
+        Замер фазы name: with profiler.span(name): ...
+        """
+        if not self.enabled:
+            return _NO_SPAN
+        return _HypSpan(self, name)
+
+    def record(self, name, start, stop):
+        """
+        Записать фазу name, длившуюся от start до stop (по time.perf_counter).
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._phases[name] = self._phases.get(name, 0) + stop - start
+        self.events.append(('X', name, start, stop - start, threading.get_ident(), None))
+
+    def count(self, **values):
+        """
+        Задать значения счётчиков текущего кадра, например count(points=10).
+        """
+        if not self.enabled:
+            return
+        self._counters.update(values)
+
+    def now(self):
+        return time.perf_counter()
+
+    def input(self):
+        """
+        Отметить событие ввода, результат которого ещё не показан.
+        """
+        if self.enabled and self._input is None:
+            self._input = time.perf_counter()
+
+    def shown(self, requested):
+        """
+        На экран выведен кадр, заказанный в момент requested: все события
+        ввода до этого момента теперь видны.
+        """
+        if not self.enabled or self._input is None or requested is None or self._input > requested:
+            return
+        now = time.perf_counter()
+        self.latencies.append(now - self._input)
+        self.events.append(('X', 'input latency', self._input, now - self._input,
+                            threading.get_ident(), None))
+        self._input = None
+
+    def endFrame(self):
+        """
+        Отметить конец кадра.
+        """
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        with self._lock:
+            phases, self._phases = self._phases, {}
+        self.frames.append((now, phases, dict(self._counters)))
+        if self._counters:
+            self.events.append(('C', 'objects', now, 0, threading.get_ident(), dict(self._counters)))
+
+    def summary(self):
+        """
+        Returns
+        -------
+        dict
+          fps -- число кадров за последнюю секунду, phases -- средние по
+          сохранённым кадрам длительности фаз (мс), counters -- значения
+          счётчиков последнего кадра, latency -- медиана и 95-й процентиль
+          задержки ввода (мс) или None, если ввода не было.
+        """
+        if not self.frames:
+            return {'fps': 0, 'phases': {}, 'counters': {}, 'latency': None}
+        last = self.frames[-1][0]
+        phases = {}
+        for _, frame, _ in self.frames:
+            for name, seconds in frame.items():
+                phases[name] = phases.get(name, 0) + seconds
+        latency = None
+        if self.latencies:
+            latency = tuple(np.percentile(np.array(self.latencies) * 1000, [50, 95]))
+        return {'fps': sum(1 for t, _, _ in self.frames if t > last - 1),
+                'phases': {name: seconds / len(self.frames) * 1000 for name, seconds in phases.items()},
+                'counters': self.frames[-1][2], 'latency': latency}
+
+    def lines(self):
+        """
+        Сводка (см. summary) строками текста для вывода поверх отрисовки.
+        """
+        summary = self.summary()
+        lines = ['{} fps'.format(summary['fps'])]
+        if summary['latency'] is not None:
+            lines.append('input latency: {:.1f} ms median, {:.1f} ms p95'.format(*summary['latency']))
+        for name, ms in sorted(summary['phases'].items(), key=lambda item: -item[1]):
+            lines.append('{}: {:.2f} ms'.format(name, ms))
+        for name, value in summary['counters'].items():
+            lines.append('{}: {}'.format(name, value))
+        return lines
+
+    def trace(self):
+        """
+        Записи в формате Trace Event: список словарей, время -- в мкс от создания профилировщика.
+        """
+        threads = {}
+        events = []
+        for kind, name, start, duration, thread, values in list(self.events):
+            tid = threads.setdefault(thread, len(threads))
+            event = {'name': name, 'ph': kind, 'ts': (start - self.origin) * 1e6, 'pid': os.getpid(), 'tid': tid}
+            if kind == 'X':
+                event['dur'] = duration * 1e6
+            else:
+                event['args'] = values
+            events.append(event)
+        return events
+
+    def exportTrace(self, path):
+        """
+        Записать трассу (см. trace) в JSON-файл path.
+        """
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.trace(), 'displayTimeUnit': 'ms'}, f)
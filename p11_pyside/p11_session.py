@@ -0,0 +1,358 @@
+"""
+Запись и воспроизведение сеансов работы с плоскостью Лобачевского: события
+мыши над HypArea (координаты, кнопки, время) и действия в HypControls
+(построения и правки кнопками, выбор модели, параметры разбиения, выделение
+в списках) пишутся в файл сеанса, а сцена, с которой сеанс начался, --
+рядом с ним.
+
+Воспроизведение открывает эту сцену в HypWindow, даёт плоскости записанный
+размер и подаёт события виджетам в записанном темпе или так быстро, как
+возможно, замеряя задержку каждого события: от его подачи до кадра, в котором
+виден его результат. Так записанный сеанс становится повторяемым замером,
+см. p11_benchmark --session.
+
+Файл сеанса -- JSON, сцена -- в файле с тем же именем и расширением .hyps
+(см. p11_geometry.saveScene).
+"""
+import os
+import json
+import math
+import time
+
+import numpy as np
+from PySide2 import QtCore, QtGui, QtWidgets
+
+from p11_geometry import saveScene, loadScene
+
+SESSION_VERSION = 1
+
+# события мыши над плоскостью, которые пишутся в сеанс, и их имена в файле
+MOUSE_EVENTS = {QtCore.QEvent.MouseButtonPress: 'press', QtCore.QEvent.MouseButtonRelease: 'release',
+                QtCore.QEvent.MouseButtonDblClick: 'doubleClick', QtCore.QEvent.MouseMove: 'move'}
+_MOUSE_TYPES = {name: kind for kind, name in MOUSE_EVENTS.items()}
+# ввод, к которому относятся действия в HypControls (см. HypSessionRecorder)
+INPUT_EVENTS = {QtCore.QEvent.MouseButtonPress, QtCore.QEvent.MouseButtonRelease, QtCore.QEvent.KeyPress}
+# Кнопки HypControls, нажатия которых пишутся в сеанс. Кнопки, открывающие
+# диалог выбора файла, не пишутся: без человека их не повторить.
+BUTTONS = ['linesThroughPointsButton', 'intersectionsOfLinesButton', 'perpendicularLinesButton',
+           'parallelLinesButton', 'tilingButton', 'cancelJobButton', 'deleteObjectsButton', 'clearObjectsButton',
+           'undoButton', 'redoButton']
+# поля ввода HypControls, значения которых пишутся в сеанс
+VALUES = ['tilingP', 'tilingQ', 'tilingRadius']
+
+
+def scenePath(path):
+    """
+    Файл сцены, с которой начинается сеанс из файла path.
+    """
+    return os.path.splitext(path)[0] + '.hyps'
+
+
+class HypSession:
+    """
+    Записанный сеанс.
+
+    Parameters
+    ----------
+    size: (int, int)
+      Размер HypArea в пикселях: координаты событий мыши -- в пикселях виджета.
+    values: dict
+      Значения полей ввода HypControls (см. VALUES) в начале сеанса.
+    events: list of dict
+      События по порядку: time -- секунды от начала записи, type -- род
+      события, остальное зависит от рода:
+        press, release, doubleClick, move -- x, y (координаты в виджете), button,
+        buttons и modifiers (значения флагов Qt);
+        click -- name, имя кнопки HypControls;
+        value -- name и value, поле ввода и его новое значение;
+        model -- name, модель в выпадающем меню;
+        toggle -- kind ('points' или 'lines') и row, строка списка.
+    scene: str
+      Файл сцены, с которой сеанс начался.
+    """
+    def __init__(self, size, values=None, events=None, scene=None):
+        self.size = tuple(size)
+        self.values = {} if values is None else values
+        self.events = [] if events is None else events
+        self.scene = scene
+
+    def __len__(self):
+        return len(self.events)
+
+    def groups(self):
+        """
+        Returns
+        -------
+        list of str
+          Для каждого события -- под каким именем сводить его задержку:
+          нажатия кнопок -- по имени кнопки, остальное -- по роду события.
+        """
+        return [event['name'] if event['type'] == 'click' else event['type'] for event in self.events]
+
+
+def saveSession(path, session):
+    """
+    Записать события сеанса в JSON-файл path. Сцена сеанса записывается
+    отдельно, в начале записи (см. HypSessionRecorder.start).
+    """
+    with open(path, 'w') as f:
+        json.dump({'version': SESSION_VERSION, 'size': session.size, 'values': session.values,
+                   'scene': os.path.basename(session.scene), 'events': session.events}, f)
+
+
+def loadSession(path):
+    """
+    Прочитать сеанс, записанный saveSession.
+
+    Returns
+    -------
+    HypSession
+    """
+    with open(path) as f:
+        data = json.load(f)
+    if data.get('version') != SESSION_VERSION:
+        raise ValueError('{}: unsupported session version {}'.format(path, data.get('version')))
+    # сцена лежит рядом с файлом сеанса
+    scene = os.path.join(os.path.dirname(os.path.abspath(path)), data['scene'])
+    return HypSession(data['size'], data['values'], data['events'], scene)
+
+
+class HypSessionRecorder(QtCore.QObject):
+    """
+    Запись сеанса работы с окном HypWindow: start сохраняет сцену и начинает
+    запись, stop заканчивает её и пишет файл сеанса.
+
+    События мыши над плоскостью пишутся фильтром событий приложения до того,
+    как их получит плоскость. Действия в HypControls приходят сигналами уже
+    после того, как выполнены, поэтому их время -- время ввода (нажатия
+    кнопки мыши или клавиши), которым они вызваны.
+    """
+    def __init__(self, window, parent=None):
+        super(HypSessionRecorder, self).__init__(parent)
+        self.window = window
+        self.path = None
+        self.session = None
+        self._start = None
+        self._inputTime = None
+
+        controls = window.controls
+        for name in BUTTONS:
+            getattr(controls, name).clicked.connect(lambda *args, name=name: self._action('click', name=name))
+        for name in VALUES:
+            getattr(controls, name).valueChanged.connect(
+                lambda *args, name=name: self._action('value', name=name, value=getattr(controls, name).value()))
+        controls.modelsBox.currentTextChanged.connect(lambda text: self._action('model', name=text))
+        controls.points.clicked.connect(lambda index: self._action('toggle', kind='points', row=index.row()))
+        controls.lines.clicked.connect(lambda index: self._action('toggle', kind='lines', row=index.row()))
+
+    def isRecording(self):
+        return self.path is not None
+
+    def start(self, path):
+        """
+        Начать запись сеанса в файл path. Сцена, с которой сеанс начинается,
+        сразу сохраняется в scenePath(path).
+        """
+        window = self.window
+        scene = scenePath(path)
+        saveScene(scene, window.currentScene())
+        area, controls = window.drawing, window.controls
+        self.session = HypSession((area.width(), area.height()),
+                                  {name: getattr(controls, name).value() for name in VALUES}, scene=scene)
+        self.path = path
+        self._start = self._inputTime = time.perf_counter()
+        QtWidgets.QApplication.instance().installEventFilter(self)
+
+    def stop(self):
+        """
+        Закончить запись и записать файл сеанса.
+
+        Returns
+        -------
+        HypSession
+          Записанный сеанс или None, если запись не шла.
+        """
+        if self.path is None:
+            return None
+        QtWidgets.QApplication.instance().removeEventFilter(self)
+        path, session = self.path, self.session
+        self.path = self.session = None
+        saveSession(path, session)
+        return session
+
+    def eventFilter(self, watched, event):
+        kind = event.type()
+        if kind in INPUT_EVENTS:
+            self._inputTime = time.perf_counter()
+        if watched is self.window.drawing and kind in MOUSE_EVENTS:
+            position = event.localPos()
+            self._record(time.perf_counter(), MOUSE_EVENTS[kind], x=position.x(), y=position.y(),
+                         button=int(event.button()), buttons=int(event.buttons()), modifiers=int(event.modifiers()))
+        return False
+
+    def _action(self, action, **values):
+        if self.path is not None:
+            self._record(self._inputTime, action, **values)
+
+    def _record(self, when, action, **values):
+        event = {'time': when - self._start, 'type': action}
+        event.update(values)
+        self.session.events.append(event)
+
+
+def _busy(window):
+    # заказан кадр, растеризуется слой объектов или идёт долгое построение
+    area = window.drawing
+    return area.scheduler.timer.isActive() or area._renderer.isBusy() or window.controls.job is not None
+
+
+class HypSessionPlayer:
+    """
+    Воспроизведение сеанса в окне HypWindow.
+
+    Задержка события -- время от его подачи до того, как окно успокоилось:
+    все заказанные кадры нарисованы, слои растеризованы, долгие построения
+    закончены. Без темпа следующее событие подаётся, когда успокоилось
+    предыдущее. В записанном темпе события подаются по своим временам, и
+    всё, что подано до ближайшего кадра, в нём и видно -- перетаскивание
+    сливается в кадры так же, как у пользователя.
+
+    Parameters
+    ----------
+    window: p11_widgets.HypWindow
+    session: HypSession
+    """
+    def __init__(self, window, session):
+        self.window = window
+        self.session = session
+
+    def reset(self):
+        """
+        Вернуть окно к началу сеанса: открыть его сцену заново, задать размер
+        плоскости и значения полей ввода.
+        """
+        window, session = self.window, self.session
+        window.setScene(loadScene(session.scene))
+        for name, value in session.values.items():
+            getattr(window.controls, name).setValue(value)
+        window.drawing.setFixedSize(*session.size)
+        window.show()
+        self._settle()
+
+    def play(self, speed=None):
+        """
+        Воспроизвести сеанс с начала.
+
+        Parameters
+        ----------
+        speed: float
+          Во сколько раз быстрее записи подавать события; None -- не ждать
+          записанных времён.
+
+        Returns
+        -------
+        np.ndarray
+          Задержки событий в секундах, по порядку событий сеанса.
+        """
+        self.reset()
+        events = self.session.events
+        latencies = np.zeros(len(events))
+        # поданные события, результат которых ещё не виден: (номер, время подачи)
+        pending = []
+        start = time.perf_counter()
+        for i, event in enumerate(events):
+            if speed is not None:
+                self._wait(start + event['time'] / speed, pending, latencies)
+            pending.append((i, time.perf_counter()))
+            self.dispatch(event)
+            if speed is None:
+                self._settle()
+                self._done(pending, latencies)
+        self._settle()
+        self._done(pending, latencies)
+        return latencies
+
+    def dispatch(self, event):
+        """
+        Подать виджетам окна одно событие сеанса.
+        """
+        area, controls = self.window.drawing, self.window.controls
+        kind = event['type']
+        if kind == 'click':
+            getattr(controls, event['name']).click()
+        elif kind == 'value':
+            getattr(controls, event['name']).setValue(event['value'])
+        elif kind == 'model':
+            controls.modelsBox.setCurrentText(event['name'])
+        elif kind == 'toggle':
+            model = controls.pointModel if event['kind'] == 'points' else controls.lineModel
+            model.toggle(model.index(event['row']))
+        elif kind in _MOUSE_TYPES:
+            QtWidgets.QApplication.sendEvent(area, QtGui.QMouseEvent(
+                _MOUSE_TYPES[kind], QtCore.QPointF(event['x'], event['y']), QtCore.Qt.MouseButton(event['button']),
+                QtCore.Qt.MouseButtons(event['buttons']), QtCore.Qt.KeyboardModifiers(event['modifiers'])))
+        else:
+            raise ValueError('unknown session event {!r}'.format(kind))
+
+    def _settle(self):
+        app = QtWidgets.QApplication.instance()
+        while _busy(self.window):
+            app.processEvents(QtCore.QEventLoop.AllEvents, 5)
+        app.processEvents()
+
+    def _wait(self, due, pending, latencies):
+        # обрабатывать события до времени due, отмечая, когда окно успокаивается
+        app = QtWidgets.QApplication.instance()
+        # таймер будит ожидание событий не позже due
+        timer = QtCore.QTimer()
+        timer.setSingleShot(True)
+        timer.setTimerType(QtCore.Qt.PreciseTimer)
+        while True:
+            if pending and not _busy(self.window):
+                # кадр, заказанный последним, ещё надо нарисовать
+                app.processEvents()
+                if not _busy(self.window):
+                    self._done(pending, latencies)
+            left = due - time.perf_counter()
+            if left <= 0:
+                break
+            timer.start(math.ceil(left * 1000))
+            app.processEvents(QtCore.QEventLoop.WaitForMoreEvents)
+
+    @staticmethod
+    def _done(pending, latencies):
+        now = time.perf_counter()
+        for i, dispatched in pending:
+            latencies[i] = now - dispatched
+        pending.clear()
+
+
+def latencySummary(groups, latencies, percentiles=(50, 90, 99)):
+    """
+    Процентили задержек по группам событий.
+
+    Parameters
+    ----------
+    groups: list of str
+      Группа каждого события, см. HypSession.groups.
+    latencies: np.ndarray
+      Задержки событий в секундах.
+
+    Returns
+    -------
+    dict
+      Для каждой группы и для всех событий вместе ('all') -- словарь из числа
+      событий n, процентилей p50, p90, ... и наибольшей задержки max, в секундах.
+    """
+    names = list(dict.fromkeys(groups))
+    groups = np.array(groups, object)
+    summary = {}
+    for name in names + ['all']:
+        values = latencies if name == 'all' else latencies[groups == name]
+        if not len(values):
+            continue
+        row = {'n': len(values)}
+        row.update(('p{}'.format(p), value) for p, value in zip(percentiles, np.percentile(values, percentiles)))
+        row['max'] = values.max()
+        summary[name] = row
+    return summary
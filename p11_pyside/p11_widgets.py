@@ -0,0 +1,1968 @@
+"""
+Виджеты плоскости Лобачевского: отрисовка, списки объектов, построения
+в фоне и окно приложения. Геометрия -- в p11_geometry.
+
+Запуск приложения:
+  python p11_widgets.py
+"""
+from PySide2 import QtCore, QtWidgets, QtGui
+import shiboken2
+import os
+import sys
+import ctypes
+import atexit
+import threading
+import weakref
+from collections import deque
+from functools import partial
+import numpy as np
+
+from p11_index import HypIncrementalIndex, sortedContains
+from p11_profile import HypFrameProfiler
+from p11_export import vectorWriter
+from p11_session import HypSessionRecorder
+from p11_geometry import (HypModel, HypPoint, HypPointArray, HypLineArray, HypTransform, HypTransformArray,
+                          HypObjectStore, HypPointStore, HypLineStore, _trilIndices,
+                          HypConstructionGraph, HypEdit, HypHistory, drawLineThroughPointsBatch, intersectLinesBatch,
+                          intersectAllLinePairs, drawPerpendicularBatch, drawParallelsBatch, HypTiling, HypScene,
+                          saveScene, loadScene)
+
+
+def _chunked(total, compute, chunkSize):
+    # части построения из total элементарных для HypConstructionJob
+    for lo in range(0, total, chunkSize):
+        hi = min(lo + chunkSize, total)
+        yield compute(lo, hi), hi / total
+
+
+class HypObjectModel(QtCore.QAbstractListModel):
+    """
+    Qt-модель списка над HypObjectStore. Текст строки формируется только тогда,
+    когда виджет её показывает. Выделение хранится в хранилище, а виджету
+    показывается цветом строк; изменения выделения рассылаются сигналом
+    selectionChanged в виде разностей.
+    """
+    def __init__(self, store, parent=None):
+        super(HypObjectModel, self).__init__(parent)
+        self.store = store
+        palette = QtGui.QPalette()
+        self.highlight = palette.highlight()
+        self.highlightedText = palette.highlightedText()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.store)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        if role == QtCore.Qt.DisplayRole:
+            return self.store.text(row)
+        elif role == QtCore.Qt.BackgroundRole and self.store.selected[row]:
+            return self.highlight
+        elif role == QtCore.Qt.ForegroundRole and self.store.selected[row]:
+            return self.highlightedText
+        return None
+
+    def append(self, **values):
+        """
+        Добавить строки в конец, см. HypObjectStore.append.
+        """
+        n = len(next(iter(values.values())))
+        if n == 0:
+            return np.zeros(0, np.int64)
+        self.beginInsertRows(QtCore.QModelIndex(), len(self.store), len(self.store) + n - 1)
+        ids = self.store.append(**values)
+        self.endInsertRows()
+        return ids
+
+    def take(self, mask):
+        """
+        Вынуть отмеченные строки, см. HypObjectStore.take. Виджет получает
+        одно уведомление о сбросе модели.
+
+        Returns
+        -------
+        dict или None
+          Столбцы вынутых строк, None -- если ничего не отмечено.
+        """
+        # маска может быть столбцом самого хранилища, который удаление перезапишет
+        mask = np.array(mask, dtype=np.bool_)
+        if not mask.any():
+            return None
+        deselected = self.store.ids[self.store.selected & mask]
+        self.beginResetModel()
+        block = self.store.take(mask)
+        self.endResetModel()
+        if len(deselected):
+            self.selectionChanged.emit(np.zeros(0, np.int64), deselected)
+        return block
+
+    def clear(self):
+        """
+        Вынуть все строки.
+        """
+        return self.take(np.ones(len(self.store), np.bool_))
+
+    def restore(self, block):
+        """
+        Вернуть строки, вынутые take.
+        """
+        if block is None:
+            return
+        self.beginResetModel()
+        self.store.restore(block)
+        self.endResetModel()
+        selected = block['id'][block['selected']]
+        if len(selected):
+            self.selectionChanged.emit(selected, np.zeros(0, np.int64))
+
+    def applyEdit(self, edit, kind, undo=False):
+        """
+        Сделать или отменить правку в хранилище, см. HypEdit.applyStore. Виджет
+        получает одно уведомление о сбросе модели.
+
+        Returns
+        -------
+        numpy.ndarray
+          Id строк, значения которых изменились.
+        """
+        if not edit.touches(kind):
+            return np.zeros(0, np.int64)
+        self.beginResetModel()
+        appeared, disappeared, moved = edit.applyStore(kind, self.store, undo)
+        self.endResetModel()
+        empty = np.zeros(0, np.int64)
+        selected = empty if appeared is None else appeared['id'][appeared['selected']]
+        deselected = empty if disappeared is None else disappeared['id'][disappeared['selected']]
+        if len(selected) + len(deselected):
+            self.selectionChanged.emit(selected, deselected)
+        return moved
+
+    def refresh(self, ids):
+        """
+        Объекты с id ids изменились в хранилище (например, пересчитаны).
+        """
+        if len(ids):
+            rows = self.store.rowsOf(ids)
+            self.dataChanged.emit(self.index(int(rows.min())), self.index(int(rows.max())), [QtCore.Qt.DisplayRole])
+
+    def setStore(self, store):
+        """
+        Показывать другое хранилище.
+        """
+        self.beginResetModel()
+        self.store = store
+        self.endResetModel()
+
+    def setSelected(self, rows, value):
+        """
+        Выделить строки rows (value=True) или снять с них выделение.
+        """
+        changed = self.store.setSelected(rows, value)
+        if len(changed):
+            rows = self.store.rowsOf(changed)
+            self.dataChanged.emit(self.index(int(rows.min())), self.index(int(rows.max())),
+                                  [QtCore.Qt.BackgroundRole, QtCore.Qt.ForegroundRole])
+            empty = np.zeros(0, np.int64)
+            if value:
+                self.selectionChanged.emit(changed, empty)
+            else:
+                self.selectionChanged.emit(empty, changed)
+
+    @QtCore.Slot(QtCore.QModelIndex)
+    def toggle(self, index):
+        """
+        Переключить выделение одной строки.
+        """
+        row = index.row()
+        self.setSelected([row], not self.store.selected[row])
+
+    # id строк, которые стали выделенными, и id строк, с которых выделение снято
+    selectionChanged = QtCore.Signal(object, object)
+
+
+class _HypJobRunner(QtCore.QRunnable):
+    # обёртка для запуска задания в пуле потоков
+    def __init__(self, job):
+        super(_HypJobRunner, self).__init__()
+        self.job = job
+
+    def run(self):
+        self.job.run()
+
+
+class HypConstructionJob(QtCore.QObject):
+    """
+    Построение, которое считается частями в пуле потоков. Части результата по мере
+    готовности приходят сигналом chunkReady в поток, где создано задание; рабочий
+    поток опережает их обработку не больше чем на несколько частей.
+
+    Parameters
+    ----------
+    chunks
+      Итератор пар (часть, доля выполненного), где часть -- HypPointArray или
+      HypLineArray (или пара из него и записи о построении, см. HypControls._addChunk),
+      например, генератор. Перебирается в рабочем потоке, поэтому
+      должен пользоваться только своими данными.
+    """
+    # число построений в одной части
+    chunkSize = 1 << 15
+
+    def __init__(self, chunks, parent=None):
+        super(HypConstructionJob, self).__init__(parent)
+        self.chunks = chunks
+        self._cancelled = False
+        # сколько ещё частей можно отправить, не дожидаясь обработки
+        self._inFlight = QtCore.QSemaphore(4)
+        self.chunkReady.connect(self._chunkHandled)
+
+    def start(self, pool=None):
+        """
+        Запустить задание в пуле потоков (по умолчанию -- в глобальном).
+        """
+        (pool or QtCore.QThreadPool.globalInstance()).start(_HypJobRunner(self))
+
+    def cancel(self):
+        """
+        Остановить задание. Части, посчитанные до остановки, ещё могут прийти,
+        их следует отбрасывать, проверяя isCancelled.
+        """
+        self._cancelled = True
+
+    def isCancelled(self):
+        return self._cancelled
+
+    def run(self):
+        """
+        Посчитать задание в текущем потоке.
+        """
+        try:
+            chunks = iter(self.chunks)
+            while True:
+                while not self._inFlight.tryAcquire(1, 50):
+                    if self._cancelled:
+                        return
+                if self._cancelled:
+                    return
+                chunk, fraction = next(chunks, (None, None))
+                if chunk is None:
+                    return
+                self.chunkReady.emit(chunk)
+                self.progress.emit(fraction)
+        finally:
+            self.finished.emit()
+
+    @QtCore.Slot(object)
+    def _chunkHandled(self, chunk):
+        self._inFlight.release()
+
+    # очередная часть результата
+    chunkReady = QtCore.Signal(object)
+    # доля выполненных построений
+    progress = QtCore.Signal(float)
+    # задание завершено или остановлено
+    finished = QtCore.Signal()
+
+
+class HypFrameScheduler(QtCore.QObject):
+    """
+    Планировщик перерисовок с ограничением частоты кадров. Все запросы
+    кадра, пришедшие до того, как подошло время очередного кадра, сливаются
+    в один: промежуточные кадры не рисуются и не копятся в очереди событий.
+
+    Parameters
+    ----------
+    callback
+      Что вызывать на каждом кадре.
+    fps: float
+      Целевая частота кадров.
+    """
+    def __init__(self, callback, fps=60, parent=None):
+        super(HypFrameScheduler, self).__init__(parent)
+        self.callback = callback
+        self.targetFps = fps
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self._frame)
+        self.clock = QtCore.QElapsedTimer()
+        self.clock.start()
+        # время последнего кадра в мс и времена кадров за последнюю секунду
+        self.lastFrame = None
+        self.frameTimes = deque()
+        # сколько всего нарисовано кадров и сколько запросов слито с уже ожидающими
+        self.frames = 0
+        self.merged = 0
+        self.lastReport = 0
+
+    def setTargetFps(self, fps):
+        self.targetFps = fps
+
+    def request(self):
+        """
+        Запросить кадр. Если кадр уже запланирован, запрос сливается с ним.
+        """
+        if self.timer.isActive():
+            self.merged += 1
+            return
+
+        interval = 1000 / self.targetFps
+        if self.lastFrame is None:
+            wait = 0
+        else:
+            wait = max(0, int(self.lastFrame + interval - self.clock.elapsed()))
+        self.timer.start(wait)
+
+    def flush(self):
+        """
+        Нарисовать запланированный кадр немедленно.
+        """
+        if self.timer.isActive():
+            self.timer.stop()
+            self._frame()
+
+    def _frame(self):
+        now = self.clock.elapsed()
+        self.lastFrame = now
+        self.frames += 1
+        self.frameTimes.append(now)
+        while self.frameTimes[0] <= now - 1000:
+            self.frameTimes.popleft()
+        self.callback()
+        if now - self.lastReport >= 1000:
+            self.lastReport = now
+            self.statsChanged.emit(self.stats())
+
+    def achievedFps(self):
+        """
+        Сколько кадров было нарисовано за последнюю секунду.
+        """
+        now = self.clock.elapsed()
+        return sum(1 for t in self.frameTimes if t > now - 1000)
+
+    def stats(self):
+        """
+        Returns
+        -------
+        dict
+          target и achieved -- целевая и достигнутая за последнюю секунду частота кадров,
+          frames -- число нарисованных кадров, merged -- число запросов, слитых с другими.
+        """
+        return {'target': self.targetFps, 'achieved': self.achievedFps(),
+                'frames': self.frames, 'merged': self.merged}
+
+    statsChanged = QtCore.Signal(dict)
+
+
+# диаметр точки на отрисовке в координатах единичного диска
+POINT_SIZE = 0.03
+
+
+def _polygon(xy):
+    # QPolygonF из массива координат (n, 2) одним копированием памяти, без
+    # создания QPointF на каждую точку: QPointF -- это пара qreal, т.е. double
+    xy = np.ascontiguousarray(xy, dtype=np.float64)
+    polygon = QtGui.QPolygonF(len(xy))
+    if len(xy):
+        address = shiboken2.getCppPointer(polygon.data())[0]
+        ctypes.memmove(address, xy.ctypes.data, xy.nbytes)
+    return polygon
+
+
+def _paintLayer(painter, layer, color):
+    # Отрисовать слой одним цветом. Слой -- это (координаты точек (n, 2),
+    # отрезки (m, 4), прочие примитивы (метод QPainter, аргументы)). Все точки и
+    # все отрезки рисуются одним вызовом, карандаши ставятся по разу на слой.
+    points, segments, curves = layer
+    painter.setPen(QtGui.QPen(color, 0))
+    painter.setBrush(QtCore.Qt.NoBrush)
+    if len(segments):
+        painter.drawLines(_polygon(segments.reshape(-1, 2)))
+    for draw, args in curves:
+        draw(painter, *args)
+
+    if len(points):
+        # Точка -- это круглый конец толстого карандаша. При сильном масштабе Qt
+        # растягивает такие точки на несколько пикселей, поэтому они рисуются
+        # в координатах устройства.
+        t = painter.transform()
+        matrix = np.array([[t.m11(), t.m12()], [t.m21(), t.m22()]])
+        painter.save()
+        painter.resetTransform()
+        painter.setPen(QtGui.QPen(QtGui.QBrush(color), POINT_SIZE * abs(np.linalg.det(matrix)) ** 0.5,
+                                  QtCore.Qt.SolidLine, QtCore.Qt.RoundCap))
+        painter.drawPoints(_polygon(points @ matrix + [t.dx(), t.dy()]))
+        painter.restore()
+
+
+def _drawArcs(painter, cx, cy, r, start, span):
+    # все дуги одним путём: так Qt рисует их быстрее, чем по одной, а углы,
+    # в отличие от QPainter.drawArc, не округляются до 1/16 градуса
+    path = QtGui.QPainterPath()
+    for x, y, radius, a, b in zip(cx.tolist(), cy.tolist(), r.tolist(), start.tolist(), span.tolist()):
+        rect = QtCore.QRectF(x - radius, y - radius, 2 * radius, 2 * radius)
+        path.arcMoveTo(rect, a)
+        path.arcTo(rect, a, b)
+    painter.drawPath(path)
+
+
+def _layerImage(size, ratio, center, radius, layers):
+    """
+    Растеризовать слои в прозрачный QImage. QPainter на QImage можно использовать
+    в любом потоке, поэтому функция годится и для рабочих потоков.
+
+    Parameters
+    ----------
+    size: QtCore.QSize
+      Размер изображения в логических пикселях виджета.
+    ratio: float
+      Отношение физических пикселей к логическим.
+    center: QtCore.QPointF
+      Центр диска в логических пикселях.
+    radius: float
+      Радиус диска в них же.
+    layers: list
+      Пары (слой, цвет) в порядке отрисовки, см. _paintLayer. Массивы слоёв
+      не должны меняться, пока изображение не готово.
+    """
+    image = QtGui.QImage(size * ratio, QtGui.QImage.Format_ARGB32_Premultiplied)
+    image.setDevicePixelRatio(ratio)
+    image.fill(QtCore.Qt.transparent)
+    painter = QtGui.QPainter(image)
+    painter.translate(center)
+    painter.scale(radius, radius)
+    for layer, color in layers:
+        _paintLayer(painter, layer, color)
+    painter.end()
+    return image
+
+
+class HypLayerRenderer(QtCore.QObject):
+    """
+    Растеризация слоёв в QImage в пуле потоков. Одновременно рисуется не больше
+    одного заказа: заказ, пришедший во время отрисовки, ждёт её конца, а из
+    нескольких ждущих рисуется только последний. Готовое изображение приходит
+    сигналом rendered в поток, где создан растеризатор.
+
+    Растеризатор нельзя удалять, пока рисуется заказ: рабочий поток сообщает
+    о конце через сам растеризатор. Поэтому перед выходом из приложения
+    (aboutToQuit) и из интерпретатора текущей отрисовки дожидаются, см. wait.
+    """
+    def __init__(self, parent=None):
+        super(HypLayerRenderer, self).__init__(parent)
+        self._task = None
+        self._pending = None
+        # нет растеризации в рабочем потоке
+        self._idle = threading.Event()
+        self._idle.set()
+        _renderers.add(self)
+        app = QtCore.QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.wait)
+        # куда записывать время растеризации
+        self.profiler = HypFrameProfiler()
+        self._done.connect(self._finish)
+
+    def render(self, tag, size, ratio, center, radius, layers):
+        """
+        Заказать растеризацию, см. _layerImage.
+
+        Parameters
+        ----------
+        tag
+          Что угодно; приходит вместе с изображением в сигнале rendered.
+        """
+        self._pending = (tag, size, ratio, center, radius, layers)
+        if self._task is None:
+            self._startPending()
+
+    def isBusy(self):
+        return self._task is not None
+
+    @QtCore.Slot()
+    def wait(self, timeout=None):
+        """
+        Дождаться конца растеризации, идущей в рабочем потоке (готовое
+        изображение придёт, как обычно, сигналом rendered).
+
+        Returns
+        -------
+        bool
+          False, если растеризация не кончилась за timeout секунд.
+        """
+        return self._idle.wait(timeout)
+
+    def _startPending(self):
+        self._task, self._pending = self._pending, None
+        self._idle.clear()
+        QtCore.QThreadPool.globalInstance().start(_HypJobRunner(self))
+
+    def run(self):
+        # вызывается в рабочем потоке
+        try:
+            tag, *args = self._task
+            with self.profiler.span('rasterize'):
+                image = _layerImage(*args)
+            self._done.emit(tag, image)
+        finally:
+            self._idle.set()
+
+    @QtCore.Slot(object, object)
+    def _finish(self, tag, image):
+        self._task = None
+        if self._pending is not None:
+            self._startPending()
+        self.rendered.emit(tag, image)
+
+    # метка заказа и готовое изображение
+    rendered = QtCore.Signal(object, object)
+    # то же из рабочего потока
+    _done = QtCore.Signal(object, object)
+
+
+# живые растеризаторы: их отрисовки дожидаются при выходе из интерпретатора,
+# до того как shiboken удалит объекты Qt
+_renderers = weakref.WeakSet()
+
+
+@atexit.register
+def _waitRenderers():
+    for renderer in list(_renderers):
+        renderer.wait()
+
+
+class _HypViewCache:
+    # Координаты отрисовки объектов при одном виде: id по возрастанию и столбцы
+    # комплексных координат. Досчитываются только объекты, которых ещё нет.
+    def __init__(self, columns):
+        self.ids = np.empty(0, np.int64)
+        self.columns = [np.empty(0, np.complex128) for _ in range(columns)]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def contains(self, ids):
+        return sortedContains(self.ids, ids)
+
+    def add(self, ids, *columns):
+        ids = np.concatenate([self.ids, ids])
+        order = np.argsort(ids, kind='stable')
+        self.ids = ids[order]
+        self.columns = [np.concatenate([old, new])[order] for old, new in zip(self.columns, columns)]
+
+    def get(self, ids):
+        # столбцы для ids, которые все есть в кэше
+        rows = np.searchsorted(self.ids, ids)
+        return [column[rows] for column in self.columns]
+
+    def drop(self, ids):
+        # кэш без ids (по возрастанию)
+        cache = _HypViewCache(0)
+        keep = ~sortedContains(ids, self.ids)
+        cache.ids = self.ids[keep]
+        cache.columns = [column[keep] for column in self.columns]
+        return cache
+
+    def keep(self, ids):
+        # кэш только для тех из ids (по возрастанию), что в нём есть
+        cache = _HypViewCache(0)
+        keep = sortedContains(ids, self.ids)
+        cache.ids = self.ids[keep]
+        cache.columns = [column[keep] for column in self.columns]
+        return cache
+
+
+class HypArea(QtWidgets.QWidget):
+    """
+    Виджет "плоскость Лобачевского" для отрисовки всего и вся.
+    """
+    # Детализация дуг модели Пуанкаре: допустимое отклонение ломаной от дуги
+    # и ближе скольких пикселей к абсолюту дуга с ним сливается (в пикселях),
+    # из скольких звеньев ломаной дуга рисуется самое большее, а иначе -- дугой
+    arcTolerance = 0.25
+    arcMinDepth = 1.0
+    maxArcSegments = 2
+
+    def __init__(self, parent=None):
+        super(HypArea, self).__init__(parent)
+        # qt-шные настройки виджета
+        self.setBackgroundRole(QtGui.QPalette.Base)
+        self.setAutoFillBackground(True)
+        # центр диска в координатах виджета
+        self.center = QtCore.QPointF(0, 0)
+        # радиус диска в них же
+        self.radius = 1
+        # хранилища объектов для отрисовки (задаются через setStores)
+        self.pointStore = HypPointStore()
+        self.lineStore = HypLineStore()
+        # id объектов для выделения красным, поддерживаются по разностям выделения
+        self.selectedPoints = set()
+        self.selectedLines = set()
+        # актуальная отрисованная модель
+        self.model = HypModel.BeltramiKlein
+        # текущая точка, за которую схватил пользователь для движения плоскостью
+        # задаётся в координатах отрисовки
+        self.grabPoint = HypPoint(0)
+        # актуальное преобразование плоскости для отрисовки
+        self.transform = HypTransform.identity()
+        # кэши координат отрисовки точек и идеальных точек прямых
+        # и вид (преобразование, модель), для которого они посчитаны
+        self._pointCache = _HypViewCache(1)
+        self._lineCache = _HypViewCache(2)
+        self._cacheKey = None
+        # примитивы слоя всех объектов (None -- если изменились объекты или вид)
+        # и сколько раз этот слой пересчитывался
+        self._objectLayer = None
+        self._objectVersion = 0
+        # Отрисовка слоями: абсолют рисуется в изображение раз на размер виджета,
+        # слой всех объектов растеризуется в рабочем потоке, а слой выделенных --
+        # в своё изображение поверх. Пока новый слой объектов не готов, показывается
+        # прежний, а выделенные рисуются примитивами того вида, в котором он растеризован.
+        self._absoluteImage = None
+        # замеры фаз кадра, счётчики объектов и задержка ввода (выключены, см. setProfiling)
+        self.profiler = HypFrameProfiler()
+        # без родителя: растеризатор должен пережить виджет, пока рабочий поток его держит
+        self._renderer = HypLayerRenderer()
+        self._renderer.profiler = self.profiler
+        self._renderer.rendered.connect(self._sceneRendered)
+        self._sceneRequested = None
+        self._sceneImage = None
+        # когда заказан показанный слой объектов (для задержки ввода)
+        self._sceneTime = None
+        # кэши примитивов того вида, в котором растеризован показанный слой объектов
+        self._sceneCaches = (_HypViewCache(1), _HypViewCache(2))
+        self._overlayImage = None
+        # пространственный индекс объектов; устарел ли он (изменились хранилища)
+        self._index = HypIncrementalIndex()
+        self._indexStale = True
+        # тащил ли пользователь плоскость после нажатия кнопки мыши
+        self._dragged = False
+        # перемещения плоскости (откуда, куда), ещё не применённые к self.transform
+        self._pendingMoves = []
+        # точка, которую пользователь тащит с Shift (id, перетаскивание), и её ещё
+        # не отправленное перемещение (id, перетаскивание, положение)
+        self._movingPoint = None
+        self._pendingPoint = None
+        # все перерисовки идут через планировщик кадров
+        self.scheduler = HypFrameScheduler(self._frame, parent=self)
+
+    def minimumSizeHint(self):
+        return QtCore.QSize(300, 300)
+
+    def resizeEvent(self, event):
+        self.center = QtCore.QPointF(self.width() / 2, self.height() / 2)
+        self.radius = min(self.width(), self.height()) / 2 * 0.98
+        self._absoluteImage = None
+        self._overlayImage = None
+        # от размера пикселя зависят и видимость объектов, и детализация дуг
+        self._objectLayer = None
+
+    def _project(self, points, lines):
+        # Перевод объектов в координаты отрисовки: по одному векторному
+        # применению преобразования на все точки и на все идеальные точки прямых.
+        # Идеальные точки сразу помечены моделью Пуанкаре: на абсолюте координаты
+        # в обеих моделях совпадают, а пересчёт лишь накопил бы ошибку округления.
+        pp, qq = lines.idealPoints(HypModel.Poincare)
+        return self.transform(points).toModel(self.model).z, self.transform(pp).z, self.transform(qq).z
+
+    def _layer(self, z, zp, zq):
+        # слой отрисовки (см. _paintLayer) для точек z и прямых с идеальными точками zp, zq
+        points = np.stack([z.real, z.imag], -1)
+        if self.model == HypModel.BeltramiKlein:
+            # в модели БК прямая -- это просто отрезок между двумя идеальными точками
+            return points, np.stack([zp.real, zp.imag, zq.real, zq.imag], -1), []
+        elif self.model == HypModel.Poincare:
+            return (points, *self._arcPrimitives(zp, zq))
+        else:
+            raise ValueError('unknown model {}'.format(self.model))
+
+    def _arcPrimitives(self, zp, zq):
+        # В модели Пуанкаре прямая -- это дуга окружности, ортогональной абсолюту.
+        # Дуги, которые всюду ближе arcMinDepth пикселей к абсолюту, сливаются с ним
+        # и не рисуются. Дуги, которые на отрисовке почти прямые (ломаная не больше
+        # чем из maxArcSegments звеньев отклоняется от них меньше чем на arcTolerance
+        # пикселей), рисуются ломаными среди отрезков слоя, остальные -- одним путём.
+        # Returns: отрезки (m, 4) и прочие примитивы слоя.
+        pixel = 1 / self.radius
+        # |m| -- расстояние от центра до середины хорды pq; ближайшая к центру точка
+        # дуги отстоит от абсолюта на 1 - |m| / (1 + sqrt(1 - |m|^2))
+        mid = (zp + zq) / 2
+        m = np.minimum(np.abs(mid), 1)
+        root = np.sqrt(1 - m ** 2)
+        keep = 1 - m / (1 + root) >= self.arcMinDepth * pixel
+        zp, zq, mid, m, root = zp[keep], zq[keep], mid[keep], m[keep], root[keep]
+
+        # стрелка дуги над хордой pq при радиусе окружности r = sqrt(1 - |m|^2) / |m|;
+        # ломаная из n звеньев отклоняется от дуги примерно на стрелку / n^2
+        half = np.abs(zq - zp) / 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r = root / m
+            sagitta = np.nan_to_num(half ** 2 / (r + np.sqrt(np.maximum(r ** 2 - half ** 2, 0))))
+        n = np.ceil(np.sqrt(sagitta / (self.arcTolerance * pixel)))
+        flat = n <= self.maxArcSegments
+        segments = self._polylineSegments(zp[flat], zq[flat], np.maximum(n[flat], 1).astype(np.int64))
+
+        # параметры дуг для QPainterPath.arcTo: центр окружности -- инверсия
+        # середины хорды, углы -- в градусах против часовой стрелки, а так как
+        # плоскость на отрисовке зазеркалена, знаки углов обратные
+        zp, zq, mid, r = zp[~flat], zq[~flat], mid[~flat], r[~flat]
+        c = mid / np.abs(mid) ** 2
+        start = -np.degrees(np.angle(zp - c))
+        span = -np.degrees(np.angle((zq - c) / (zp - c)))
+        curves = [(_drawArcs, (c.real, c.imag, r, start, span))] if len(c) else []
+        return segments, curves
+
+    @staticmethod
+    def _polylineSegments(zp, zq, n):
+        # Звенья ломаных из n вершин, приближающих дуги с концами zp, zq. Вершины
+        # берутся на хорде pq, т.е. на той же прямой в модели БК, и переводятся в
+        # модель Пуанкаре, так что дуги-диаметры не вырождаются. К концам хорды
+        # вершины сгущаются, иначе у абсолюта звенья выходят длинными.
+        arc = np.repeat(np.arange(len(n)), n + 1)
+        k = np.arange(len(arc)) - np.repeat(np.cumsum(n + 1) - (n + 1), n + 1)
+        t = (1 - np.cos(np.pi * k / n[arc])) / 2
+        w = zp[arc] + t * (zq - zp)[arc]
+        w = w / (1 + np.sqrt(np.maximum(1 - np.abs(w) ** 2, 0)))
+        first = k < n[arc]
+        last = np.roll(first, 1)
+        return np.stack([w[first].real, w[first].imag, w[last].real, w[last].imag], -1)
+
+    def _viewKey(self):
+        # всё, от чего зависят примитивы отрисовки (размер виджета не входит:
+        # примитивы задаются в координатах единичного диска)
+        return self.transform.a, self.transform.b, self.model
+
+    def spatialIndex(self):
+        """
+        Пространственный индекс всех объектов (HypIncrementalIndex).
+
+        Индекс только пополняется объектами, которых в нём ещё нет: удалённые
+        объекты отсеиваются при запросах, так что удаление, очистка и их отмена
+        обходятся без перестройки. Если удалённых набралось много, индекс
+        строится заново при следующем пополнении.
+        """
+        if self._indexStale:
+            self._indexStale = False
+            points, lines = self.pointStore, self.lineStore
+            newPoints = np.flatnonzero(~self._index.containsPoints(points.ids))
+            newLines = np.flatnonzero(~self._index.containsLines(lines.ids))
+            if len(newPoints) + len(newLines) and len(self._index) > 2 * (len(points) + len(lines)) + 1024:
+                self._index = HypIncrementalIndex()
+                newPoints, newLines = np.arange(len(points)), np.arange(len(lines))
+            self._index.add(points.ids[newPoints], points.column('bk')[newPoints], lines.ids[newLines],
+                            lines.column('a')[newLines], lines.column('b')[newLines], lines.column('c')[newLines])
+        return self._index
+
+    def _viewCenter(self):
+        # какая точка плоскости (в модели БК) сейчас отрисована в центре диска
+        return self.transform.inv(HypPoint(0j, HypModel.Poincare)).toModel(HypModel.BeltramiKlein).z
+
+    def visibleObjects(self, pixel=None):
+        """
+        Объекты, заметные на отрисовке крупнее пикселя при текущих преобразовании и модели.
+
+        Прямая на гиперболическом расстоянии d от центра отрисовки видна хордой
+        длины 2 / cosh(d) (в обеих моделях), поэтому видны прямые с d <= arcosh(2 / pixel).
+        Точка видна, если отстоит от абсолюта хотя бы на пиксель: это d <= artanh(1 - pixel)
+        в модели БК и d <= 2 artanh(1 - pixel) в модели Пуанкаре.
+
+        Parameters
+        ----------
+        pixel: float
+          Размер пикселя в координатах единичного диска. По умолчанию -- для текущего размера виджета.
+
+        Returns
+        -------
+        points: numpy.ndarray
+          Id видимых точек.
+        lines: numpy.ndarray
+          Id видимых прямых.
+        """
+        pixel = 1 / self.radius if pixel is None else pixel
+        index = self.spatialIndex()
+        center = self._viewCenter()
+        rho = np.arctanh(1 - pixel) * (2 if self.model == HypModel.Poincare else 1)
+        # id по возрастанию: поиск их строк в хранилищах и в кэшах идёт подряд,
+        # а не вразброс (что заметно и на больших сценах, отображённых в память)
+        # (перемещённые объекты могут встретиться в индексе дважды, см. moveObjects)
+        pointIds = np.unique(index.pointsWithin(center, rho))
+        lineIds = np.unique(index.linesWithin(center, np.arccosh(max(2 / pixel, 1))))
+        # в индексе могут остаться уже удалённые объекты
+        return pointIds[self.pointStore.contains(pointIds)], lineIds[self.lineStore.contains(lineIds)]
+
+    def _geodesicScreenDistance(self, z, zp, zq):
+        # расстояние на отрисовке от z до прямых с идеальными точками zp, zq (уже преобразованными)
+        if self.model == HypModel.Poincare:
+            m = (zp + zq) / 2
+            arc = np.abs(m) > 1e-9
+            c = m[arc] / np.abs(m[arc]) ** 2
+            distance = np.empty(len(m))
+            distance[arc] = np.abs(np.abs(z - c) - np.sqrt(np.abs(c) ** 2 - 1))
+            zp, zq, rest = zp[~arc], zq[~arc], ~arc
+        else:
+            distance = np.empty(len(zp))
+            rest = slice(None)
+        # отрезок между идеальными точками
+        d = zq - zp
+        t = np.clip(((z - zp) * d.conjugate()).real / np.abs(d) ** 2, 0, 1)
+        distance[rest] = np.abs(z - (zp + t * d))
+        return distance
+
+    def objectAt(self, z, tolerance):
+        """
+        Ближайший к точке отрисовки объект, если он не дальше tolerance. Точки
+        выбираются в первую очередь, прямые -- если поблизости нет точек.
+
+        Parameters
+        ----------
+        z: complex
+          Координаты на отрисовке (в единичном диске текущей модели).
+        tolerance: float
+          Допустимое расстояние в тех же координатах.
+
+        Returns
+        -------
+        tuple или None
+          Пара (род объекта, id), род -- 'points' или 'lines'.
+        """
+        index = self.spatialIndex()
+        u = self.transform.inv(HypPoint(z, self.model)).toModel(HypModel.BeltramiKlein).z
+        # гиперболический радиус, в который заведомо попадает евклидов круг радиуса
+        # tolerance на отрисовке: метрика модели БК не больше |dz| / (1 - |z|^2),
+        # модели Пуанкаре -- не больше 2 |dz| / (1 - |z|^2)
+        rmax = min(abs(z) + tolerance, 1 - 1e-9)
+        rho = tolerance / (1 - rmax ** 2) * (2 if self.model == HypModel.Poincare else 1)
+
+        points = index.pointsWithin(u, rho)
+        points = points[self.pointStore.contains(points)]
+        if len(points):
+            zs = self.transform(self.pointStore.points(self.pointStore.rowsOf(points))).toModel(self.model).z
+            distance = np.abs(zs - z)
+            i = np.argmin(distance)
+            if distance[i] <= tolerance:
+                return 'points', int(points[i])
+
+        lines = index.linesWithin(u, rho)
+        lines = lines[self.lineStore.contains(lines)]
+        if len(lines):
+            pp, qq = self.lineStore.lines(self.lineStore.rowsOf(lines)).idealPoints(HypModel.Poincare)
+            distance = self._geodesicScreenDistance(z, self.transform(pp).z, self.transform(qq).z)
+            i = np.argmin(distance)
+            if distance[i] <= tolerance:
+                return 'lines', int(lines[i])
+        return None
+
+    def _objectPrimitives(self):
+        # Слой всех объектов. Кэши координат отрисовки сбрасываются только
+        # при смене преобразования или модели, а при изменении хранилищ
+        # досчитываются лишь новые объекты.
+        # Объекты, которые при текущем виде мельче пикселя, не рисуются вовсе.
+        key = self._viewKey()
+        if key != self._cacheKey:
+            self._pointCache = _HypViewCache(1)
+            self._lineCache = _HypViewCache(2)
+            self._cacheKey = key
+            self._objectLayer = None
+
+        pointCache, lineCache = self._pointCache, self._lineCache
+        if self._objectLayer is None:
+            profiler = self.profiler
+            with profiler.span('visible'):
+                pointIds, lineIds = self.visibleObjects()
+                missingPoints = pointIds[~pointCache.contains(pointIds)]
+                missingLines = lineIds[~lineCache.contains(lineIds)]
+
+            with profiler.span('project'):
+                z, zp, zq = self._project(self.pointStore.points(self.pointStore.rowsOf(missingPoints)),
+                                          self.lineStore.lines(self.lineStore.rowsOf(missingLines)))
+                pointCache.add(missingPoints, z)
+                lineCache.add(missingLines, zp, zq)
+
+            with profiler.span('primitives'):
+                self._objectLayer = self._layer(*pointCache.get(pointIds), *lineCache.get(lineIds))
+            self._objectVersion += 1
+            # нарисованные и отброшенные объекты, пересчитанные координаты и
+            # примитивы слоя: отрезки (и звенья ломаных) и дуги
+            _, segments, curves = self._objectLayer
+            profiler.count(points=len(pointIds), lines=len(lineIds),
+                           pointsCulled=len(self.pointStore) - len(pointIds),
+                           linesCulled=len(self.lineStore) - len(lineIds),
+                           projected=len(missingPoints) + len(missingLines),
+                           segments=len(segments), arcs=sum(len(args[0]) for _, args in curves))
+        return self._objectLayer
+
+    def _selectionPrimitives(self):
+        # слой выделенных объектов в том виде, в котором растеризован
+        # показанный слой объектов; в кэшах вида лежат только видимые объекты
+        pointCache, lineCache = self._sceneCaches
+        pointIds = np.fromiter(self.selectedPoints, np.int64, len(self.selectedPoints))
+        lineIds = np.fromiter(self.selectedLines, np.int64, len(self.selectedLines))
+        return self._layer(*pointCache.get(pointIds[pointCache.contains(pointIds)]),
+                           *lineCache.get(lineIds[lineCache.contains(lineIds)]))
+
+    def _pixelSize(self):
+        return self.size(), self.devicePixelRatioF()
+
+    def _requestScene(self):
+        # заказать растеризацию слоя объектов, если он изменился с прошлого заказа
+        layer = self._objectPrimitives()
+        size, ratio = self._pixelSize()
+        tag = (self._objectVersion, size, ratio)
+        if tag != self._sceneRequested:
+            self._sceneRequested = tag
+            caches = self._pointCache, self._lineCache
+            self._renderer.render((tag, caches, self.profiler.now()), size, ratio, QtCore.QPointF(self.center),
+                                  self.radius, [(layer, QtGui.QColor(QtCore.Qt.black))])
+
+    @QtCore.Slot(object, object)
+    def _sceneRendered(self, tag, image):
+        _, self._sceneCaches, self._sceneTime = tag
+        self._sceneImage = image
+        self._overlayImage = None
+        self.update()
+
+    def paintEvent(self, event):
+        profiler = self.profiler
+        start = profiler.now()
+        self._requestScene()
+        size, ratio = self._pixelSize()
+        if self._absoluteImage is None:
+            absolute = np.empty((0, 2)), np.empty((0, 4)), [(QtGui.QPainter.drawEllipse, (QtCore.QRectF(-1, -1, 2, 2),))]
+            self._absoluteImage = _layerImage(size, ratio, self.center, self.radius,
+                                              [(absolute, QtGui.QColor(QtCore.Qt.black))])
+        if self._overlayImage is None:
+            with profiler.span('selection'):
+                self._overlayImage = _layerImage(size, ratio, self.center, self.radius,
+                                                 [(self._selectionPrimitives(), QtGui.QColor(QtCore.Qt.red))])
+
+        with profiler.span('compose'):
+            painter = QtGui.QPainter(self)
+            painter.drawImage(0, 0, self._absoluteImage)
+            # по ходу изменения размера прежний слой объектов не показывается
+            scene = self._sceneImage
+            if scene is not None and scene.size() == self._absoluteImage.size():
+                painter.drawImage(0, 0, scene)
+                profiler.shown(self._sceneTime)
+            painter.drawImage(0, 0, self._overlayImage)
+        if profiler.enabled:
+            self._paintProfile(painter)
+        painter.end()
+        profiler.record('paintEvent', start, profiler.now())
+        profiler.endFrame()
+
+    def _paintProfile(self, painter):
+        # сводка профилировщика поверх отрисовки, в левом верхнем углу
+        lines = self.profiler.lines()
+        metrics = painter.fontMetrics()
+        height = metrics.height()
+        width = max(metrics.horizontalAdvance(line) for line in lines)
+        painter.fillRect(QtCore.QRectF(4, 4, width + 8, height * len(lines) + 8), QtGui.QColor(255, 255, 255, 200))
+        painter.setPen(QtGui.QColor(QtCore.Qt.darkBlue))
+        for i, line in enumerate(lines):
+            painter.drawText(QtCore.QPointF(8, 8 + metrics.ascent() + i * height), line)
+
+    addPoints = QtCore.Signal(list)
+
+    def _event_coords(self, event):
+        x = (event.x() - self.center.x()) / self.radius
+        y = (event.y() - self.center.y()) / self.radius
+        return x + 1j * y
+
+    def mouseDoubleClickEvent(self, event):
+        # двойным кликом -- добавить точку на плоскость.
+        # если кликнули по плоскости, конечно.
+        z = self._event_coords(event)
+        if abs(z) >= 1:
+            return
+
+        self._applyPendingMoves()
+        w = self.transform.inv(HypPoint(z, self.model))
+
+        self.addPoints.emit([w])
+
+    def mousePressEvent(self, event):
+        # фиксируем точку, которую ухватил пользователь
+        z = self._event_coords(event)
+        if abs(z) >= 1:
+            return
+
+        self._applyPendingMoves()
+        self.grabPoint = HypPoint(z, self.model)
+        self._dragged = False
+        # с Shift тащится не плоскость, а точка под курсором
+        self._movingPoint = None
+        if event.modifiers() == QtCore.Qt.ShiftModifier:
+            obj = self.objectAt(z, 5 / self.radius)
+            if obj is not None and obj[0] == 'points':
+                # все перемещения одного перетаскивания отменяются вместе
+                self._movingPoint = obj[1], object()
+
+    def mouseMoveEvent(self, event):
+        # если пользователь тащит плоскость, её надо трансформировать.
+        # Само преобразование копится и применяется раз в кадр.
+        w = self._event_coords(event)
+        if abs(w) >= 1 or (not self.grabPoint.isValid()):
+            return
+
+        if self._movingPoint is not None:
+            # перемещение точки отправляется тоже раз в кадр, последним положением
+            self._dragged = True
+            self.profiler.input()
+            self._pendingPoint = self._movingPoint + (self.transform.inv(HypPoint(w, self.model)),)
+            self.scheduler.request()
+            return
+
+        q = HypPoint(w, self.model)
+        self.profiler.input()
+        self._dragged = True
+        self._pendingMoves.append((self.grabPoint, q))
+        self.grabPoint = q
+        self.scheduler.request()
+
+    def mouseReleaseEvent(self, event):
+        # щелчок без перетаскивания -- выбор объекта под курсором
+        z = self._event_coords(event)
+        self._movingPoint = None
+        if self._dragged or abs(z) >= 1:
+            return
+
+        self._applyPendingMoves()
+        obj = self.objectAt(z, 5 / self.radius)
+        if obj is not None:
+            self.objectPicked.emit(*obj)
+
+    # род объекта ('points' или 'lines') и его id
+    objectPicked = QtCore.Signal(str, object)
+    # id перемещаемых точек, их новые положения (список HypPoint) и перетаскивание,
+    # к которому относится перемещение (объект, один на всё перетаскивание)
+    pointsMoved = QtCore.Signal(object, object, object)
+
+    def _applyPendingMoves(self):
+        # все накопленные перемещения одним векторным pToQ и одной композицией
+        if not self._pendingMoves:
+            return
+        p, q = zip(*self._pendingMoves)
+        self._pendingMoves = []
+        steps = HypTransformArray.pToQ(HypPointArray.fromPoints(p, HypModel.Poincare),
+                                       HypPointArray.fromPoints(q, HypModel.Poincare))
+        # более позднее перемещение применяется после, т.е. стоит в композиции левее
+        self.transform = steps[::-1].prod() * self.transform
+
+    def _frame(self):
+        with self.profiler.span('moves'):
+            self._applyPendingMoves()
+            if self._pendingPoint is not None:
+                (pointId, drag, point), self._pendingPoint = self._pendingPoint, None
+                self.pointsMoved.emit(np.array([pointId], np.int64), [point], drag)
+        self.update()
+
+    def waitRendering(self):
+        """
+        Дождаться растеризации слоёв, идущей в пуле потоков (например, перед
+        закрытием окна).
+        """
+        self._renderer.wait()
+
+    @QtCore.Slot(bool)
+    def setProfiling(self, enabled):
+        """
+        Включить или выключить замеры кадров (см. p11_profile.HypFrameProfiler)
+        и их сводку поверх отрисовки.
+        """
+        self.profiler.setEnabled(enabled)
+        self.update()
+
+    def exportView(self, path, chunkSize=1 << 16):
+        """
+        Записать текущую отрисовку (модель, преобразование, выделение цветом)
+        в векторный файл SVG или PDF, формат -- по расширению path, см.
+        p11_export.vectorWriter. Страница -- размером с виджет.
+
+        Объекты отбираются и переводятся в примитивы тем же кодом, что и для
+        экрана, с тем же отбросом объектов мельче пикселя, но по chunkSize
+        объектов, и каждая часть сразу пишется в файл: ни документ, ни все
+        примитивы в памяти не собираются.
+        """
+        pointIds, lineIds = self.visibleObjects()
+        selectedPoints = np.sort(np.fromiter(self.selectedPoints, np.int64, len(self.selectedPoints)))
+        selectedLines = np.sort(np.fromiter(self.selectedLines, np.int64, len(self.selectedLines)))
+        # выделенное рисуется поверх всего, как на экране
+        layers = [(pointIds, lineIds, QtCore.Qt.black),
+                  (selectedPoints[sortedContains(pointIds, selectedPoints)],
+                   selectedLines[sortedContains(lineIds, selectedLines)], QtCore.Qt.red)]
+        with vectorWriter(path, self.width(), self.height(), (self.center.x(), self.center.y()),
+                          self.radius) as writer:
+            writer.absolute(QtGui.QColor(QtCore.Qt.black).getRgb()[:3])
+            for points, lines, color in layers:
+                color = QtGui.QColor(color).getRgb()[:3]
+                for lo in range(0, max(len(points), len(lines)), chunkSize):
+                    chunkPoints, chunkLines = points[lo:lo + chunkSize], lines[lo:lo + chunkSize]
+                    layer = self._layer(*self._project(self.pointStore.points(self.pointStore.rowsOf(chunkPoints)),
+                                                       self.lineStore.lines(self.lineStore.rowsOf(chunkLines))))
+                    writer.layer(layer[0], layer[1], [args for draw, args in layer[2] if draw is _drawArcs], color,
+                                 POINT_SIZE * self.radius)
+
+    def setStores(self, points, lines, index=None):
+        """
+        Задать хранилища точек и прямых для отрисовки.
+
+        Parameters
+        ----------
+        points: HypPointStore
+        lines: HypLineStore
+        index: HypIncrementalIndex
+          Уже построенный индекс объектов хранилищ (например, открытый вместе
+          со сценой). Без него индекс строится при первой отрисовке.
+        """
+        self.pointStore, self.lineStore = points, lines
+        self.selectedPoints = set(points.ids[points.selected].tolist())
+        self.selectedLines = set(lines.ids[lines.selected].tolist())
+        # id в новых хранилищах могут совпадать с прежними, так что кэши,
+        # индекс и показанный слой объектов прежних хранилищ больше не годятся
+        self._cacheKey = None
+        self._index = HypIncrementalIndex() if index is None else index
+        self._sceneImage = None
+        self._sceneCaches = (_HypViewCache(1), _HypViewCache(2))
+        self._overlayImage = None
+        self.refreshObjects()
+
+    def setTransform(self, transform):
+        """
+        Задать преобразование плоскости для отрисовки. Ещё не применённые
+        перемещения плоскости отбрасываются.
+        """
+        self._pendingMoves = []
+        self.transform = transform
+        self.scheduler.request()
+
+    def currentTransform(self):
+        """
+        Преобразование плоскости с учётом всех перемещений пользователя.
+        """
+        self._applyPendingMoves()
+        return self.transform
+
+    @QtCore.Slot()
+    def refreshObjects(self):
+        # хранилища изменились: слой объектов -- заново, индекс -- пополнить
+        self._objectLayer = None
+        self._indexStale = True
+        self._pruneCache()
+        self.scheduler.request()
+
+    @QtCore.Slot(str, object)
+    def moveObjects(self, kind, ids):
+        """
+        Учесть, что объекты рода kind ('points' или 'lines') с id ids (по
+        возрастанию) изменили положение в хранилище.
+
+        Их координаты отрисовки выбрасываются из кэшей, а в индекс они
+        добавляются заново, с новыми координатами. Прежние записи остаются в
+        индексе и лишь изредка дают лишних кандидатов в видимые, пока индекс
+        не будет перестроен.
+        """
+        if not len(ids):
+            return
+        if kind == 'points':
+            self._pointCache = self._pointCache.drop(ids)
+        else:
+            self._lineCache = self._lineCache.drop(ids)
+        index = self.spatialIndex()
+        empty = np.zeros(0)
+        if len(index) > 2 * (len(self.pointStore) + len(self.lineStore)) + 1024:
+            # прежних положений набралось много: индекс строится заново
+            self._index, self._indexStale = HypIncrementalIndex(), True
+        elif kind == 'points':
+            rows = self.pointStore.rowsOf(ids)
+            index.add(ids, self.pointStore.column('bk')[rows], np.zeros(0, np.int64), empty, empty, empty)
+        else:
+            rows = self.lineStore.rowsOf(ids)
+            index.add(np.zeros(0, np.int64), np.zeros(0, np.complex128), ids, self.lineStore.column('a')[rows],
+                      self.lineStore.column('b')[rows], self.lineStore.column('c')[rows])
+        self._objectLayer = None
+        self.scheduler.request()
+
+    @QtCore.Slot(str, object, object)
+    def changeSelection(self, kind, added, removed):
+        """
+        Учесть изменение выделения: id объектов рода kind ('points' или 'lines'),
+        которые стали выделенными, и id объектов, с которых выделение снято.
+        """
+        selected = self.selectedPoints if kind == 'points' else self.selectedLines
+        selected.difference_update(removed.tolist())
+        selected.update(added.tolist())
+        # перерисовывается только слой выделенных
+        self._overlayImage = None
+        self.scheduler.request()
+
+    def _pruneCache(self):
+        # выбросить из кэшей координаты удалённых объектов, если их набралось много
+        if len(self._pointCache) > 2 * len(self.pointStore) + 1024:
+            self._pointCache = self._pointCache.keep(self.pointStore.ids)
+        if len(self._lineCache) > 2 * len(self.lineStore) + 1024:
+            self._lineCache = self._lineCache.keep(self.lineStore.ids)
+
+    @QtCore.Slot(str)
+    def setModel(self, model):
+        d = {'Beltrami-Klein': HypModel.BeltramiKlein,
+             'Poincare': HypModel.Poincare}
+
+        if model in d:
+            self.model = d[model]
+        else:
+            raise ValueError('unknown model {}'.format(model))
+
+        self.scheduler.request()
+
+
+# фильтр файловых диалогов для сцен (см. saveScene)
+SCENE_FILTER = 'Hyperbolic scenes (*.hyps);;All files (*)'
+# и для трасс замеров кадров (см. HypFrameProfiler.exportTrace)
+TRACE_FILTER = 'Trace files (*.json);;All files (*)'
+# и для векторных снимков отрисовки (см. HypArea.exportView)
+VIEW_FILTER = 'SVG images (*.svg);;PDF documents (*.pdf)'
+# файлы записанных сеансов
+SESSION_FILTER = 'Sessions (*.json);;All files (*)'
+
+
+class HypControls(QtWidgets.QWidget):
+    """
+    Виджеты для управления плоскостью Лобачевского:
+      * ведение списков объектов,
+      * добавление новых объектов,
+      * удаление старых,
+      * отмена и повтор правок,
+      * сохранение и открытие сцены,
+      * замеры кадров отрисовки и запись сеанса.
+    """
+    def __init__(self, parent=None):
+        super(HypControls, self).__init__(parent)
+        expanding = QtWidgets.QSizePolicy.Expanding
+
+        minimum = QtWidgets.QSizePolicy.Minimum
+
+        # хранилища отмеченных точек и прямых плоскости и модели списков над ними
+        self.pointStore = HypPointStore()
+        self.lineStore = HypLineStore()
+        self.pointModel = HypObjectModel(self.pointStore, self)
+        self.lineModel = HypObjectModel(self.lineStore, self)
+        # из чего построены объекты хранилищ
+        self.graph = HypConstructionGraph()
+
+        # списки отмеченных точек и прямых. Это таблицы в один столбец, а не QListView:
+        # тот на каждое изменение данных заново раскладывает все строки.
+        # Выделение переключается щелчком и хранится в модели, а не в виджете.
+        self.points = QtWidgets.QTableView()
+        self.lines = QtWidgets.QTableView()
+        for view, model in ((self.points, self.pointModel), (self.lines, self.lineModel)):
+            view.setModel(model)
+            view.horizontalHeader().hide()
+            view.horizontalHeader().setStretchLastSection(True)
+            view.verticalHeader().hide()
+            view.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
+            view.verticalHeader().setDefaultSectionSize(view.fontMetrics().height() + 2)
+            view.setShowGrid(False)
+            view.setWordWrap(False)
+            view.setSelectionMode(QtWidgets.QAbstractItemView.NoSelection)
+            view.setSizePolicy(minimum, expanding)
+            view.clicked.connect(model.toggle)
+
+        # выпадающее меню с выбором модели плоскости
+        self.modelsBox = QtWidgets.QComboBox()
+        self.modelsBox.addItems(['Beltrami-Klein', 'Poincare'])
+
+        # различные кнопки с добавлением новых объектов
+        buttonsAdd1 = QtWidgets.QHBoxLayout()
+        self.linesThroughPointsButton = QtWidgets.QPushButton('Lines through points')
+        buttonsAdd1.addWidget(self.linesThroughPointsButton)
+        self.intersectionsOfLinesButton = QtWidgets.QPushButton('Intersections')
+        buttonsAdd1.addWidget(self.intersectionsOfLinesButton)
+
+        # ещё кнопок с добавление объектов
+        buttonsAdd2 = QtWidgets.QHBoxLayout()
+        self.perpendicularLinesButton = QtWidgets.QPushButton('Perpendiculars')
+        buttonsAdd2.addWidget(self.perpendicularLinesButton)
+        self.parallelLinesButton = QtWidgets.QPushButton('Parallels')
+        buttonsAdd2.addWidget(self.parallelLinesButton)
+
+        # правильное разбиение {p, q} в круге заданного радиуса
+        tilingRow = QtWidgets.QHBoxLayout()
+        self.tilingP = QtWidgets.QSpinBox()
+        self.tilingP.setRange(3, 64)
+        self.tilingP.setValue(7)
+        self.tilingP.setPrefix('p = ')
+        tilingRow.addWidget(self.tilingP)
+        self.tilingQ = QtWidgets.QSpinBox()
+        self.tilingQ.setRange(3, 64)
+        self.tilingQ.setValue(3)
+        self.tilingQ.setPrefix('q = ')
+        tilingRow.addWidget(self.tilingQ)
+        self.tilingRadius = QtWidgets.QDoubleSpinBox()
+        self.tilingRadius.setRange(0.5, 12)
+        self.tilingRadius.setSingleStep(0.5)
+        self.tilingRadius.setValue(4)
+        self.tilingRadius.setPrefix('r = ')
+        tilingRow.addWidget(self.tilingRadius)
+        self.tilingButton = QtWidgets.QPushButton('Tiling')
+        tilingRow.addWidget(self.tilingButton)
+
+        # ход долгого построения и его остановка, видны только во время построения
+        jobRow = QtWidgets.QHBoxLayout()
+        self.jobProgress = QtWidgets.QProgressBar()
+        self.jobProgress.setRange(0, 1000)
+        jobRow.addWidget(self.jobProgress)
+        self.cancelJobButton = QtWidgets.QPushButton('Cancel')
+        jobRow.addWidget(self.cancelJobButton)
+        self.jobProgress.hide()
+        self.cancelJobButton.hide()
+        # текущее долгое построение
+        self.job = None
+
+        # кнопки с удалением объектов
+        buttonsDel = QtWidgets.QHBoxLayout()
+        self.deleteObjectsButton = QtWidgets.QPushButton('Delete selection')
+        buttonsDel.addWidget(self.deleteObjectsButton)
+        self.clearObjectsButton = QtWidgets.QPushButton('Clear')
+        buttonsDel.addWidget(self.clearObjectsButton)
+        self.undoButton = QtWidgets.QPushButton('Undo')
+        self.undoButton.setShortcut(QtGui.QKeySequence.Undo)
+        buttonsDel.addWidget(self.undoButton)
+        self.redoButton = QtWidgets.QPushButton('Redo')
+        self.redoButton.setShortcut(QtGui.QKeySequence.Redo)
+        buttonsDel.addWidget(self.redoButton)
+
+        # добавления, построения, удаления, очистки и перемещения точек для отмены и повтора
+        self.history = HypHistory()
+        self._updateHistoryButtons()
+
+        # кнопки сохранения и открытия сцены
+        buttonsScene = QtWidgets.QHBoxLayout()
+        self.saveSceneButton = QtWidgets.QPushButton('Save...')
+        self.saveSceneButton.setShortcut(QtGui.QKeySequence.Save)
+        buttonsScene.addWidget(self.saveSceneButton)
+        self.openSceneButton = QtWidgets.QPushButton('Open...')
+        self.openSceneButton.setShortcut(QtGui.QKeySequence.Open)
+        buttonsScene.addWidget(self.openSceneButton)
+        self.exportViewButton = QtWidgets.QPushButton('Export view...')
+        buttonsScene.addWidget(self.exportViewButton)
+
+        # замеры кадров отрисовки: сводка поверх плоскости и выгрузка трассы
+        profileRow = QtWidgets.QHBoxLayout()
+        self.profileBox = QtWidgets.QCheckBox('Frame profile')
+        self.profileBox.setShortcut(QtGui.QKeySequence('F3'))
+        profileRow.addWidget(self.profileBox)
+        self.exportTraceButton = QtWidgets.QPushButton('Export trace...')
+        profileRow.addWidget(self.exportTraceButton)
+        # запись сеанса для воспроизведения без экрана, см. p11_session
+        self.recordSessionButton = QtWidgets.QPushButton('Record session...')
+        self.recordSessionButton.setCheckable(True)
+        profileRow.addWidget(self.recordSessionButton)
+
+        # разложение всего вышеперечисленного в столбик
+        layout = QtWidgets.QVBoxLayout()
+        layout.addWidget(QtWidgets.QLabel('Models'))
+        layout.addWidget(self.modelsBox)
+        layout.addWidget(QtWidgets.QLabel('Add objects'))
+        layout.addLayout(buttonsAdd1)
+        layout.addLayout(buttonsAdd2)
+        layout.addLayout(tilingRow)
+        layout.addLayout(jobRow)
+        layout.addWidget(QtWidgets.QLabel('Remove objects'))
+        layout.addLayout(buttonsDel)
+        layout.addWidget(QtWidgets.QLabel('Scene'))
+        layout.addLayout(buttonsScene)
+        layout.addLayout(profileRow)
+        layout.addWidget(QtWidgets.QLabel('Points:'))
+        layout.addWidget(self.points)
+        layout.addWidget(QtWidgets.QLabel('Lines:'))
+        layout.addWidget(self.lines)
+        self.setLayout(layout)
+
+        # взаимодействие элементов
+        self.pointModel.selectionChanged.connect(partial(self.selectionChanged.emit, 'points'))
+        self.lineModel.selectionChanged.connect(partial(self.selectionChanged.emit, 'lines'))
+        self.modelsBox.currentTextChanged.connect(self.modelChanged)
+        self.deleteObjectsButton.clicked.connect(self.deleteObjects)
+        self.linesThroughPointsButton.clicked.connect(self.addLinesThroughPoints)
+        self.intersectionsOfLinesButton.clicked.connect(self.addIntersectionsOfLines)
+        self.clearObjectsButton.clicked.connect(self.clearObjects)
+        self.undoButton.clicked.connect(self.undo)
+        self.redoButton.clicked.connect(self.redo)
+        self.perpendicularLinesButton.clicked.connect(self.addPerpendiculars)
+        self.parallelLinesButton.clicked.connect(self.addParallels)
+        self.tilingButton.clicked.connect(self.addTiling)
+        self.cancelJobButton.clicked.connect(self.cancelJob)
+        self.saveSceneButton.clicked.connect(self.askSaveScene)
+        self.openSceneButton.clicked.connect(self.askOpenScene)
+        self.exportViewButton.clicked.connect(self.askExportView)
+        self.profileBox.toggled.connect(self.profilingToggled)
+        self.exportTraceButton.clicked.connect(self.askExportTrace)
+        self.recordSessionButton.toggled.connect(self.askRecordSession)
+
+    @QtCore.Slot(list)
+    def addPoints(self, points):
+        """
+        Добавить точки: список HypPoint или HypPointArray. Точки вне плоскости
+        и совпадающие с уже добавленными отбрасываются.
+        """
+        self._addObjects('points', HypPointStore.columnsOf(points))
+
+    @QtCore.Slot(list)
+    def addLines(self, lines):
+        """
+        Добавить прямые: список HypLine или HypLineArray. Прямые вне плоскости
+        и совпадающие с уже добавленными отбрасываются.
+        """
+        self._addObjects('lines', HypLineStore.columnsOf(lines))
+
+    def _addObjects(self, kind, values, derivation=None, group=None):
+        # Добавить объекты рода kind, заданные столбцами, кроме тех, что вне плоскости
+        # или совпадают с уже имеющимися, и записать в граф, из чего построены
+        # добавленные (derivation, см. _addChunk). Построенное из объектов, которых
+        # уже нет в хранилищах, не добавляется. Правка записывается в историю,
+        # правки одной группы -- одной правкой. Returns: id добавленных.
+        if kind == 'points':
+            model, valid = self.pointModel, HypPointArray(values['z']).isValid()
+        else:
+            model = self.lineModel
+            valid = HypLineArray(values['a'], values['b'], values['c'], normalized=True).isValid()
+        if derivation is not None:
+            op, parents, _ = derivation
+            stores = {'points': self.pointStore, 'lines': self.lineStore}
+            for parentKind, parentIds in zip(HypConstructionGraph.operations[op][1], parents.T):
+                valid &= stores[parentKind].contains(parentIds)
+        added = valid.copy()
+        added[valid] = model.store.isNew(**{name: col[valid] for name, col in values.items()})
+        ids = model.append(**{name: col[added] for name, col in values.items()})
+        if not len(ids):
+            return ids
+        graphAdded = None
+        if derivation is not None:
+            op, parents, slots = derivation
+            graphAdded = self.graph.add(kind, ids, op, parents[added], np.broadcast_to(slots, len(added))[added])
+        store = model.store
+        self._record(HypEdit(added={kind: store.block(slice(len(store) - len(ids), len(store)))},
+                             graphAdded=graphAdded), group)
+        self.objectsChanged.emit()
+        return ids
+
+    @QtCore.Slot(str, object)
+    def toggleObject(self, kind, id):
+        """
+        Выделить объект в списке или снять с него выделение.
+
+        Parameters
+        ----------
+        kind: str
+          'points' или 'lines'.
+        id: int
+          Id объекта в хранилище.
+        """
+        model, view = (self.pointModel, self.points) if kind == 'points' else (self.lineModel, self.lines)
+        index = model.index(int(model.store.rowsOf(id)))
+        model.toggle(index)
+        view.scrollTo(index)
+
+    @QtCore.Slot()
+    def deleteObjects(self):
+        # вместе с выделенными удаляется всё, что из них построено;
+        # текущее построение сначала останавливается, как и перед отменой правки
+        self.cancelJob()
+        points, lines = self.pointStore, self.lineStore
+        pointIds, lineIds = self.graph.descendants(points.ids[points.selected], lines.ids[lines.selected])
+        self._takeObjects(self.pointModel.take(points.selected | sortedContains(pointIds, points.ids)),
+                          self.lineModel.take(lines.selected | sortedContains(lineIds, lines.ids)))
+
+    @QtCore.Slot()
+    def clearObjects(self):
+        self.cancelJob()
+        self._takeObjects(self.pointModel.clear(), self.lineModel.clear())
+
+    def _takeObjects(self, points, lines, moved=None, group=None):
+        # Вынуть записи о построении вынутых строк, записать правку в историю
+        # и разослать одно уведомление.
+        if points is None and lines is None:
+            return
+        noIds = np.zeros(0, np.int64)
+        graph = self.graph.take(noIds if points is None else points['id'], noIds if lines is None else lines['id'])
+        removed = {kind: block for kind, block in [('points', points), ('lines', lines)] if block is not None}
+        self._record(HypEdit(removed=removed, moved=moved, graphRemoved=graph), group)
+        self.objectsChanged.emit()
+
+    def _record(self, edit, group=None):
+        self.history.record(edit, group)
+        self._updateHistoryButtons()
+
+    def _updateHistoryButtons(self):
+        self.undoButton.setEnabled(self.history.canUndo())
+        self.redoButton.setEnabled(self.history.canRedo())
+
+    @QtCore.Slot()
+    def undo(self):
+        """
+        Отменить последнюю правку: добавление, построение, удаление, очистку
+        или перемещение точки. Текущее построение сначала останавливается.
+        """
+        self.cancelJob()
+        edit = self.history.undo()
+        if edit is not None:
+            self._applyEdit(edit, True)
+
+    @QtCore.Slot()
+    def redo(self):
+        """
+        Сделать снова последнюю отменённую правку.
+        """
+        self.cancelJob()
+        edit = self.history.redo()
+        if edit is not None:
+            self._applyEdit(edit, False)
+
+    def _applyEdit(self, edit, undo):
+        # правка из истории: хранилища, граф и уведомления об изменившемся
+        moved = {kind: model.applyEdit(edit, kind, undo)
+                 for kind, model in [('points', self.pointModel), ('lines', self.lineModel)]}
+        edit.applyGraph(self.graph, undo)
+        for kind, ids in moved.items():
+            self.objectsMoved.emit(kind, ids)
+        self.objectsChanged.emit()
+        self._updateHistoryButtons()
+
+    @QtCore.Slot(object, object, object)
+    def movePoints(self, ids, points, group=None):
+        """
+        Переместить исходные точки и пересчитать всё, что из них построено
+        (см. HypConstructionGraph.recompute). Построенные точки не перемещаются:
+        их положение задано построением. Построенные объекты, которые перестали
+        существовать, удаляются вместе со всем, что из них построено.
+
+        В историю правок записываются прежние и новые значения изменившихся
+        объектов и удалённые объекты.
+
+        Parameters
+        ----------
+        ids: numpy.ndarray
+          Id точек.
+        points
+          Новые положения: список HypPoint или HypPointArray.
+        group
+          Перетаскивание, к которому относится перемещение: перемещения одного
+          перетаскивания отменяются одной правкой.
+        """
+        # текущее построение останавливается: его части строились из прежних положений
+        self.cancelJob()
+        ids = np.asarray(ids, dtype=np.int64)
+        values = HypPointStore.columnsOf(points)
+        keep = self.pointStore.contains(ids) & ~self.graph.isDerived('points', ids)
+        keep &= HypPointArray(values['z']).isValid()
+        if not keep.any():
+            return
+        ids, order = np.unique(ids[keep], return_index=True)
+        values = {name: col[keep][order] for name, col in values.items()}
+        noIds = np.zeros(0, np.int64)
+        stores = {'points': self.pointStore, 'lines': self.lineStore}
+        # прежние значения всего, что может измениться, -- для отмены
+        descendants = dict(zip(stores, self.graph.descendants(ids, noIds)))
+        descendants['points'] = np.union1d(descendants['points'], ids)
+        old = {kind: {name: store.column(name)[store.rowsOf(descendants[kind])] for name in store.columns}
+               for kind, store in stores.items()}
+        self.pointStore.update(self.pointStore.rowsOf(ids), **values)
+        changed, lost = self.graph.recompute(self.pointStore, self.lineStore, ids, noIds)
+        changed['points'] = np.union1d(changed['points'], ids)
+        moved = {}
+        for kind, model in [('points', self.pointModel), ('lines', self.lineModel)]:
+            model.refresh(changed[kind])
+            self.objectsMoved.emit(kind, changed[kind])
+            if not len(changed[kind]):
+                continue
+            store, rows = stores[kind], sortedContains(changed[kind], descendants[kind])
+            moved[kind] = (changed[kind], {name: column[rows] for name, column in old[kind].items()},
+                           {name: store.column(name)[store.rowsOf(changed[kind])] for name in store.columns})
+        if len(lost['points']) + len(lost['lines']):
+            self._takeObjects(self.pointModel.take(sortedContains(lost['points'], self.pointStore.ids)),
+                              self.lineModel.take(sortedContains(lost['lines'], self.lineStore.ids)), moved, group)
+        else:
+            self._record(HypEdit(moved=moved), group)
+
+    def setStores(self, points, lines, graph=None):
+        """
+        Заменить хранилища точек и прямых (например, открытой сценой) и граф
+        построений их объектов (по умолчанию все объекты исходные).
+        Текущее построение останавливается, история правок забывается.
+        """
+        self.cancelJob()
+        self.history.clear()
+        self._updateHistoryButtons()
+        self.pointStore, self.lineStore = points, lines
+        self.graph = HypConstructionGraph() if graph is None else graph
+        self.pointModel.setStore(points)
+        self.lineModel.setStore(lines)
+
+    def setModel(self, model):
+        """
+        Выбрать модель плоскости (HypModel) в выпадающем меню.
+        """
+        self.modelsBox.setCurrentIndex(model.value)
+
+    @QtCore.Slot()
+    def askSaveScene(self):
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, 'Save scene', '', SCENE_FILTER)
+        if path:
+            self.sceneSaveRequested.emit(path)
+
+    @QtCore.Slot()
+    def askOpenScene(self):
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(self, 'Open scene', '', SCENE_FILTER)
+        if path:
+            self.sceneOpenRequested.emit(path)
+
+    @QtCore.Slot()
+    def askExportView(self):
+        path, selected = QtWidgets.QFileDialog.getSaveFileName(self, 'Export view', '', VIEW_FILTER)
+        if path and not os.path.splitext(path)[1]:
+            # формат без расширения -- по выбранному фильтру
+            path += '.pdf' if 'pdf' in selected else '.svg'
+        if path:
+            self.viewExportRequested.emit(path)
+
+    @QtCore.Slot()
+    def askExportTrace(self):
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, 'Export trace', '', TRACE_FILTER)
+        if path:
+            self.traceExportRequested.emit(path)
+
+    @QtCore.Slot(bool)
+    def askRecordSession(self, checked):
+        if not checked:
+            self.sessionRecordStopped.emit()
+            return
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, 'Record session', '', SESSION_FILTER)
+        if path:
+            self.sessionRecordRequested.emit(path)
+        else:
+            self.setRecording(False)
+
+    def setRecording(self, recording):
+        """
+        Показать, идёт ли запись сеанса, не посылая сигналов.
+        """
+        blocked = self.recordSessionButton.blockSignals(True)
+        self.recordSessionButton.setChecked(recording)
+        self.recordSessionButton.blockSignals(blocked)
+
+    def _constructionButtons(self):
+        return [self.linesThroughPointsButton, self.intersectionsOfLinesButton,
+                self.perpendicularLinesButton, self.parallelLinesButton, self.tilingButton]
+
+    def _construct(self, total, compute):
+        # Построение из total элементарных, compute(lo, hi) считает построения lo..hi-1
+        self._constructChunks(_chunked(total, compute, HypConstructionJob.chunkSize),
+                              total <= HypConstructionJob.chunkSize)
+
+    def _constructChunks(self, chunks, small):
+        # Небольшие построения считаются сразу, долгие -- заданием в пуле потоков,
+        # результаты которого добавляются по частям.
+        if small:
+            group = object()
+            for chunk, _ in chunks:
+                self._addChunk(chunk, group)
+            return
+
+        self.job = job = HypConstructionJob(chunks, parent=self)
+        job.chunkReady.connect(self._jobChunkReady)
+        job.progress.connect(self._jobProgress)
+        job.finished.connect(self._jobFinished)
+        for button in self._constructionButtons():
+            button.setEnabled(False)
+        self.jobProgress.setValue(0)
+        self.jobProgress.show()
+        self.cancelJobButton.show()
+        job.start()
+
+    def _addChunk(self, chunk, group):
+        # Часть -- объекты или пара из объектов и записи о построении (построение,
+        # id родителей, номера результатов), см. HypConstructionGraph.add.
+        # Части одного построения (group) отменяются вместе.
+        objects, derivation = chunk if isinstance(chunk, tuple) else (chunk, None)
+        if isinstance(objects, HypPointArray):
+            kind, values = 'points', HypPointStore.columnsOf(objects)
+        else:
+            kind, values = 'lines', HypLineStore.columnsOf(objects)
+        self._addObjects(kind, values, derivation, group)
+
+    @QtCore.Slot(object)
+    def _jobChunkReady(self, chunk):
+        # части остановленного задания отбрасываются
+        if self.sender() is self.job:
+            self._addChunk(chunk, self.job)
+
+    @QtCore.Slot(float)
+    def _jobProgress(self, fraction):
+        if self.sender() is self.job:
+            self.jobProgress.setValue(int(fraction * 1000))
+
+    @QtCore.Slot()
+    def _jobFinished(self):
+        # задание удаляется только здесь: сигнал finished рабочий поток посылает последним
+        job = self.sender()
+        if job is self.job:
+            self._jobDone()
+        job.deleteLater()
+
+    def _jobDone(self):
+        self.job = None
+        self.jobProgress.hide()
+        self.cancelJobButton.hide()
+        for button in self._constructionButtons():
+            button.setEnabled(True)
+
+    @QtCore.Slot()
+    def cancelJob(self):
+        """
+        Остановить текущее долгое построение. Уже добавленные объекты остаются.
+        """
+        if self.job is not None:
+            self.job.cancel()
+            self._jobDone()
+
+    @QtCore.Slot()
+    def addLinesThroughPoints(self):
+        rows = self.pointStore.selectedRows()
+        selectedPoints, pointIds = self.pointStore.points(rows), self.pointStore.ids[rows]
+        n = len(selectedPoints)
+
+        def compute(lo, hi):
+            # пары (i, j), j < i, в том же порядке, что и двойной цикл
+            i, j = _trilIndices(lo, hi)
+            return (drawLineThroughPointsBatch(selectedPoints[i], selectedPoints[j]),
+                    ('lineThroughPoints', np.stack([pointIds[i], pointIds[j]], -1), 0))
+
+        self._construct(n * (n - 1) // 2, compute)
+
+    @QtCore.Slot()
+    def addIntersectionsOfLines(self):
+        rows = self.lineStore.selectedRows()
+        selectedLines, lineIds = self.lineStore.lines(rows), self.lineStore.ids[rows]
+        n = len(selectedLines)
+
+        def chunks():
+            # пары ищутся заметанием уже в рабочем потоке
+            for i, j, fraction in intersectAllLinePairs(selectedLines, HypConstructionJob.chunkSize):
+                yield (intersectLinesBatch(selectedLines[i], selectedLines[j]),
+                       ('intersection', np.stack([lineIds[i], lineIds[j]], -1), 0)), fraction
+
+        self._constructChunks(chunks(), n * (n - 1) // 2 <= HypConstructionJob.chunkSize)
+
+    @QtCore.Slot()
+    def addPerpendiculars(self):
+        self._addLinesFromPointsAndLines('perpendicular', lambda l, p: [drawPerpendicularBatch(l, p)])
+
+    @QtCore.Slot()
+    def addParallels(self):
+        self._addLinesFromPointsAndLines('parallel', drawParallelsBatch)
+
+    @QtCore.Slot()
+    def addTiling(self):
+        """
+        Добавить прямые сторон правильного разбиения {p, q} (см. HypTiling).
+        Разбиение строится в рабочем потоке, прямые добавляются частями.
+        """
+        p, q, radius = self.tilingP.value(), self.tilingQ.value(), self.tilingRadius.value()
+        if (p - 2) * (q - 2) <= 4:
+            QtWidgets.QMessageBox.warning(self, 'Tiling', '{{{}, {}}} is not a hyperbolic tiling'.format(p, q))
+            return
+
+        def chunks():
+            edges = HypTiling(p, q, radius).edges()
+            yield from _chunked(len(edges), lambda lo, hi: edges[lo:hi], HypConstructionJob.chunkSize)
+
+        self._constructChunks(chunks(), False)
+
+    def _addLinesFromPointsAndLines(self, op, maker):
+        lineRows, pointRows = self.lineStore.selectedRows(), self.pointStore.selectedRows()
+        selectedLines, lineIds = self.lineStore.lines(lineRows), self.lineStore.ids[lineRows]
+        selectedPoints, pointIds = self.pointStore.points(pointRows), self.pointStore.ids[pointRows]
+
+        def compute(lo, hi):
+            # все пары (прямая, точка), прямая -- во внешнем цикле
+            li, pi = np.divmod(np.arange(lo, hi), len(selectedPoints))
+            # прямые, построенные для одной пары, идут подряд
+            results = maker(selectedLines[li], selectedPoints[pi])
+            a, b, c = (np.stack([getattr(r, name) for r in results], -1).reshape(-1) for name in 'abc')
+            parents = np.repeat(np.stack([lineIds[li], pointIds[pi]], -1), len(results), axis=0)
+            slots = np.tile(np.arange(len(results)), len(li))
+            return HypLineArray(a, b, c, normalized=True), (op, parents, slots)
+
+        self._construct(len(selectedLines) * len(selectedPoints), compute)
+
+    # изменились сами хранилища объектов
+    objectsChanged = QtCore.Signal()
+    # объекты рода ('points' или 'lines') с этими id изменили положение
+    objectsMoved = QtCore.Signal(str, object)
+    # изменилось выделение: род объектов ('points' или 'lines'),
+    # id ставших выделенными и id тех, с которых выделение снято
+    selectionChanged = QtCore.Signal(str, object, object)
+    modelChanged = QtCore.Signal(str)
+    # пользователь выбрал файл для сохранения или открытия сцены
+    sceneSaveRequested = QtCore.Signal(str)
+    sceneOpenRequested = QtCore.Signal(str)
+    # пользователь выбрал файл для векторного снимка отрисовки
+    viewExportRequested = QtCore.Signal(str)
+    # включены ли замеры кадров; куда выгрузить их трассу
+    profilingToggled = QtCore.Signal(bool)
+    traceExportRequested = QtCore.Signal(str)
+    # начать запись сеанса в файл; закончить её
+    sessionRecordRequested = QtCore.Signal(str)
+    sessionRecordStopped = QtCore.Signal()
+
+
+class HypWindow(QtWidgets.QWidget):
+    """
+    Сборный виджет для всего приложения.
+    """
+    def __init__(self, parent=None):
+        super(HypWindow, self).__init__(parent)
+
+        self.drawing = HypArea(self)
+        expanding = QtWidgets.QSizePolicy.Expanding
+        policy = QtWidgets.QSizePolicy(expanding, expanding)
+        self.drawing.setSizePolicy(policy)
+
+        self.controls = HypControls(self)
+
+        layout = QtWidgets.QHBoxLayout()
+        layout.addWidget(self.drawing)
+        layout.addWidget(self.controls)
+        self.setLayout(layout)
+
+        self.drawing.addPoints.connect(self.controls.addPoints)
+        self.drawing.objectPicked.connect(self.controls.toggleObject)
+        self.drawing.pointsMoved.connect(self.controls.movePoints)
+        self.controls.objectsMoved.connect(self.drawing.moveObjects)
+        self.drawing.setStores(self.controls.pointStore, self.controls.lineStore)
+        self.controls.objectsChanged.connect(self.drawing.refreshObjects)
+        self.controls.selectionChanged.connect(self.drawing.changeSelection)
+        self.controls.modelChanged.connect(self.drawing.setModel)
+        self.drawing.scheduler.statsChanged.connect(self.showFrameStats)
+        self.controls.sceneSaveRequested.connect(self.saveScene)
+        self.controls.sceneOpenRequested.connect(self.openScene)
+        self.controls.profilingToggled.connect(self.drawing.setProfiling)
+        self.controls.traceExportRequested.connect(self.exportTrace)
+        self.controls.viewExportRequested.connect(self.exportView)
+
+        self.recorder = HypSessionRecorder(self, self)
+        self.controls.sessionRecordRequested.connect(self.startRecording)
+        self.controls.sessionRecordStopped.connect(self.stopRecording)
+
+    def closeEvent(self, event):
+        self.stopRecording()
+        self.controls.cancelJob()
+        self.drawing.waitRendering()
+        super(HypWindow, self).closeEvent(event)
+
+    def currentScene(self):
+        """
+        Объекты, выделение и вид плоскости.
+
+        Returns
+        -------
+        HypScene
+        """
+        # индекс сохраняется вместе со сценой, чтобы не строить его при открытии
+        return HypScene(self.controls.pointStore, self.controls.lineStore, self.drawing.currentTransform(),
+                        self.drawing.model, self.drawing.spatialIndex(), self.controls.graph)
+
+    def setScene(self, scene):
+        """
+        Показывать сцену scene (HypScene) вместо текущей.
+        Текущее построение останавливается.
+        """
+        self.controls.cancelJob()
+        self.controls.setStores(scene.points, scene.lines, scene.graph)
+        self.drawing.setStores(scene.points, scene.lines, scene.index)
+        self.drawing.setTransform(scene.transform)
+        self.controls.setModel(scene.model)
+
+    @QtCore.Slot(str)
+    def saveScene(self, path):
+        """
+        Сохранить объекты, выделение и вид плоскости в файл, см. p11_geometry.saveScene.
+        """
+        try:
+            saveScene(path, self.currentScene())
+        except OSError as e:
+            QtWidgets.QMessageBox.warning(self, 'Save scene', str(e))
+
+    @QtCore.Slot(str)
+    def openScene(self, path):
+        """
+        Открыть сцену, сохранённую saveScene. Файл отображается в память,
+        а индекс объектов сохранён в нём же, так что открытие не зависит от
+        размера сцены, а с диска читается то, что нужно для отрисовки.
+        """
+        try:
+            scene = loadScene(path)
+        except (OSError, ValueError) as e:
+            QtWidgets.QMessageBox.warning(self, 'Open scene', str(e))
+            return
+        self.setScene(scene)
+
+    @QtCore.Slot(str)
+    def exportView(self, path):
+        """
+        Записать текущую отрисовку в SVG или PDF, см. HypArea.exportView.
+        """
+        try:
+            self.drawing.exportView(path)
+        except (OSError, ValueError) as e:
+            QtWidgets.QMessageBox.warning(self, 'Export view', str(e))
+
+    @QtCore.Slot(str)
+    def exportTrace(self, path):
+        """
+        Выгрузить замеры кадров отрисовки в файл трассы, см. p11_profile.HypFrameProfiler.exportTrace.
+        """
+        try:
+            self.drawing.profiler.exportTrace(path)
+        except OSError as e:
+            QtWidgets.QMessageBox.warning(self, 'Export trace', str(e))
+
+    @QtCore.Slot(str)
+    def startRecording(self, path):
+        """
+        Начать запись сеанса в файл path, см. p11_session.HypSessionRecorder.
+        """
+        try:
+            self.recorder.start(path)
+        except OSError as e:
+            QtWidgets.QMessageBox.warning(self, 'Record session', str(e))
+        self.controls.setRecording(self.recorder.isRecording())
+
+    @QtCore.Slot()
+    def stopRecording(self):
+        """
+        Закончить запись сеанса и записать его файл.
+        """
+        try:
+            self.recorder.stop()
+        except OSError as e:
+            QtWidgets.QMessageBox.warning(self, 'Record session', str(e))
+        self.controls.setRecording(False)
+
+    @QtCore.Slot(dict)
+    def showFrameStats(self, stats):
+        self.setWindowTitle('Hyperbolic plane: {achieved}/{target} fps'.format(**stats))
+
+
+def main():
+    app = QtWidgets.QApplication([])
+
+    window = HypWindow()
+    window.resize(800, 600)
+    window.show()
+
+    sys.exit(app.exec_())
+
+
+if __name__ == "__main__":
+    main()
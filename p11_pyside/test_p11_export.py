@@ -0,0 +1,134 @@
+import os
+import re
+import zlib
+import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+import pytest
+
+from p11_export import HypVectorWriter, vectorWriter, _fixed, _rows
+
+SVG = '{http://www.w3.org/2000/svg}'
+
+
+def layer(rng, points=7, segments=5, arcs=3):
+    # часть слоя: точки, отрезки и дуги внутри единичного диска
+    z = 0.9 * np.sqrt(rng.random(points)) * np.exp(2j * np.pi * rng.random(points))
+    return (np.stack([z.real, z.imag], -1), rng.uniform(-0.7, 0.7, (segments, 4)),
+            [(rng.uniform(1, 2, arcs), rng.uniform(-1, 1, arcs), rng.uniform(0.5, 1, arcs),
+              rng.uniform(0, 360, arcs), rng.uniform(-170, 170, arcs))])
+
+
+def svgPaths(path):
+    # пути SVG: (заливка, число подпутей)
+    root = ElementTree.parse(path).getroot()
+    assert root.tag == SVG + 'svg'
+    return [(element.get('fill'), element.get('d').count('M')) for element in root.iter(SVG + 'path')]
+
+
+def pdfContent(path):
+    # содержимое страницы PDF, проверив перекрёстные ссылки и длину потока
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert data.startswith(b'%PDF-1.4') and data.endswith(b'%%EOF\n')
+    xref = int(data.rsplit(b'startxref\n', 1)[1].split()[0])
+    lines = data[xref:].split(b'\n')
+    assert lines[0] == b'xref'
+    count = int(lines[1].split()[1])
+    assert lines[2] == b'0000000000 65535 f '
+    for number, entry in enumerate(lines[3:3 + count - 1], 1):
+        offset = int(entry.split()[0])
+        assert data[offset:].startswith(b'%d 0 obj' % number)
+    assert lines[3 + count - 1] == b'trailer'
+    start = data.index(b'stream\n') + len(b'stream\n')
+    length = int(re.search(rb'5 0 obj\n(\d+)\nendobj', data).group(1))
+    assert data[start + length:].startswith(b'\nendstream')
+    return zlib.decompress(data[start:start + length]).decode('ascii')
+
+
+def testFixed():
+    values = np.array([0, -0.001, 0.004, -1.5, 123.456, 1e6, -7.125001, 0.995])
+    assert [row.tobytes().decode().strip() for row in _fixed(values, 2)] == \
+           ['0.00', '0.00', '0.00', '-1.50', '123.46', '1000000.00', '-7.13', '1.00']
+    assert [row.tobytes().decode().strip() for row in _fixed(np.array([0, 1, -12, 345]), 0)] == \
+           ['0', '1', '-12', '345']
+    # поля одной ширины, значения -- с точностью до округления
+    values = np.random.default_rng(0).uniform(-5000, 5000, 1000)
+    fields = _fixed(values, 2)
+    assert len({len(row) for row in fields}) == 1
+    assert np.allclose([float(row.tobytes()) for row in fields], values, atol=0.005 + 1e-9)
+
+
+def testRows():
+    text = _rows('M%.2f %.2fL%d\n', np.array([1.0, -2.25]), np.array([0.5, 10]), np.array([3, 40]))
+    assert [re.sub(' +', ' ', line) for line in text.decode().splitlines()] == ['M 1.00 0.50L 3', 'M-2.25 10.00L40']
+
+
+def testWriterContract():
+    # формат без записи одного из примитивов не создаётся
+    class Writer(HypVectorWriter):
+        def _segments(self, x1, y1, x2, y2, color):
+            pass
+
+    with pytest.raises(TypeError):
+        Writer(os.devnull, 100, 100, (50, 50), 40)
+
+
+def testSvg(tmp_path):
+    path = str(tmp_path / 'view.svg')
+    rng = np.random.default_rng(1)
+    with vectorWriter(path, 200, 100, (100, 50), 45) as writer:
+        writer.absolute((0, 0, 0))
+        writer.layer(*layer(rng), (255, 0, 0), 3)
+    # абсолют -- две полуокружности, затем отрезки, дуги и залитые точки
+    assert svgPaths(path) == [('none', 2), ('none', 5), ('none', 3), ('#ff0000', 7)]
+
+
+def testPdf(tmp_path):
+    path = str(tmp_path / 'view.pdf')
+    rng = np.random.default_rng(2)
+    with vectorWriter(path, 200, 100, (100, 50), 45) as writer:
+        writer.absolute((0, 0, 0))
+        writer.layer(*layer(rng), (255, 0, 0), 3)
+    content = pdfContent(path).splitlines()
+    assert content[0] == '1 0 0 -1 0 100 cm'
+    # абсолют -- четыре кривых Безье, дуги до 170 градусов -- по одной или две
+    curves = sum(line.endswith(' c') for line in content)
+    assert 4 + 3 <= curves <= 4 + 6
+    assert sum(line.endswith(' l') for line in content) == 5 + 7
+    assert sum(line == 'S' for line in content) == 4
+
+
+def testUnknownFormat(tmp_path):
+    with pytest.raises(ValueError):
+        vectorWriter(str(tmp_path / 'view.png'), 100, 100, (50, 50), 40)
+
+
+def testExportViewCulls(tmp_path):
+    # объекты мельче пикселя отрисовки в файл не попадают
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    QtWidgets = pytest.importorskip('PySide2.QtWidgets')
+    from p11_geometry import HypPointStore, HypLineStore, HypPointArray, HypLineArray
+    from p11_widgets import HypArea
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    rng = np.random.default_rng(3)
+    phi = 2 * np.pi * rng.random(60)
+    # по 40 заметных точек и прямых и по 20 у самого абсолюта
+    radius = np.concatenate([rng.uniform(0, 0.9, 40), np.full(20, 1 - 1e-6)])
+    points, lines = HypPointStore(), HypLineStore()
+    points.append(**HypPointStore.columnsOf(HypPointArray(radius * np.exp(1j * phi))))
+    lines.append(**HypLineStore.columnsOf(HypLineArray(np.cos(phi), np.sin(phi), -radius, normalized=True)))
+    area = HypArea()
+    area.resize(400, 400)
+    area.show()
+    app.processEvents()
+    area.setStores(points, lines)
+    path = str(tmp_path / 'view.svg')
+    area.exportView(path, chunkSize=16)
+    paths = svgPaths(path)
+    assert paths[0] == ('none', 2)
+    # по пути на отрезки и на точки в каждой части из 16 объектов
+    assert sum(count for fill, count in paths[1:] if fill == 'none') == 40
+    assert sum(count for fill, count in paths[1:] if fill != 'none') == 40
+    area.close()
@@ -0,0 +1,176 @@
+import numpy as np
+import pytest
+
+from p11_geometry import (HypModel, HypScene, HypObjectStore, HypPointStore, HypLineStore, HypPoint,
+                          HypPointArray, HypLineArray, HypTransform, drawLineThroughPoints, intersectLines,
+                          drawPerpendicular, drawParallels, pointDistance, drawLineThroughPointsBatch,
+                          intersectLinesBatch, drawPerpendicularBatch, drawParallelsBatch, pointDistanceBatch,
+                          intersectAllLinePairs, saveScene, loadScene, SCENE_VERSION, _SCENE_PREFIX)
+
+
+def farScene(rng, n=2000):
+    # точки у абсолюта и прямые с нормалью под углом около 0 и pi: ключи на краю сетки
+    scene = HypScene()
+    z = (1 - 10.0 ** -rng.uniform(3, 9, n)) * np.exp(2j * np.pi * rng.random(n))
+    scene.points.append(**HypPointStore.columnsOf(HypPointArray(z)))
+    phi = np.pi * rng.integers(0, 2, n) + rng.uniform(-1e-6, 1e-6, n)
+    lines = HypLineArray(np.cos(phi), np.sin(phi), rng.uniform(-0.99, 0.99, n), normalized=True)
+    scene.lines.append(**HypLineStore.columnsOf(lines))
+    return scene
+
+
+def testSaveFarObjects(tmp_path):
+    scene = farScene(np.random.default_rng(0))
+    path = str(tmp_path / 'scene.hyp')
+    saveScene(path, scene)
+    loaded = loadScene(path)
+    for store, original in [(loaded.points, scene.points), (loaded.lines, scene.lines)]:
+        assert np.array_equal(store.ids, original.ids)
+        values = {name: store.column(name) for name in store.columns}
+        keys, probes = store.dedupeKeys(values)
+        assert (keys >= 0).all() and ((probes >= 0) | (probes == -1)).all()
+        # в индексе ровно ключи объектов хранилища
+        live = store.dedupe.keys[store.dedupe.keys >= 0]
+        assert np.array_equal(np.sort(live), np.unique(keys))
+        assert not store.isNew(**values).any()
+    # совпадающие с открытыми объекты отбрасываются, остальные добавляются
+    points = loaded.points
+    z = points.column('bk')
+    assert not points.isNew(**HypPointStore.columnsOf(HypPointArray(z * (1 + 1e-13)))).any()
+    assert points.isNew(**HypPointStore.columnsOf(HypPointArray(z * (1 - 1e-4)))).all()
+
+
+def fullScene(rng):
+    # точки в обеих моделях, прямые через пары точек с записями в графе, выделение и вид
+    scene = HypScene(transform=HypTransform(1.2 + 0.3j, 0.4 - 0.5j), model=HypModel.Poincare)
+    z = 0.9 * np.sqrt(rng.random(300)) * np.exp(2j * np.pi * rng.random(300))
+    scene.points.append(**HypPointStore.columnsOf(HypPointArray(z[:150])))
+    scene.points.append(**HypPointStore.columnsOf(HypPointArray(z[150:], HypModel.Poincare)))
+    pairs = rng.choice(len(scene.points), (100, 2))
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    lines = drawLineThroughPointsBatch(scene.points.points(pairs[:, 0]), scene.points.points(pairs[:, 1]))
+    keep = scene.lines.isNew(**HypLineStore.columnsOf(lines))
+    lineIds = scene.lines.append(**HypLineStore.columnsOf(lines[keep]))
+    scene.graph.add('lines', lineIds, 'lineThroughPoints', scene.points.ids[pairs[keep]])
+    scene.points.setSelected(rng.choice(len(scene.points), 20, replace=False), True)
+    scene.lines.setSelected(rng.choice(len(scene.lines), 10, replace=False), True)
+    return scene
+
+
+def testSceneRoundTrip(tmp_path):
+    scene = fullScene(np.random.default_rng(4))
+    path = str(tmp_path / 'scene.hyp')
+    saveScene(path, scene)
+    loaded = loadScene(path)
+    assert loaded.model is scene.model
+    assert (loaded.transform.a, loaded.transform.b) == (scene.transform.a, scene.transform.b)
+    for kind in ['points', 'lines', 'graph']:
+        state, original = getattr(loaded, kind).state(), getattr(scene, kind).state()
+        assert state.keys() == original.keys()
+        for name, array in original.items():
+            assert state[name].dtype == array.dtype and np.array_equal(state[name], array), (kind, name)
+    assert len(loaded.graph) == len(scene.graph) > 0
+    assert loaded.points.selected.sum() == 20 and loaded.lines.selected.sum() == 10
+    # открытая сцена -- копия при записи: изменения не попадают в файл
+    loaded.points.setSelected(np.arange(len(loaded.points)), False)
+    assert loadScene(path).points.selected.sum() == 20
+
+
+def testCorruptScene(tmp_path):
+    path = str(tmp_path / 'scene.hyp')
+    saveScene(path, fullScene(np.random.default_rng(5)))
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version, headerSize = _SCENE_PREFIX.unpack(data[:_SCENE_PREFIX.size])
+    assert version == SCENE_VERSION
+    broken = str(tmp_path / 'broken.hyp')
+    header = data[_SCENE_PREFIX.size:_SCENE_PREFIX.size + headerSize]
+    variants = [b'not a scene at all', data[:5], data[:_SCENE_PREFIX.size + headerSize // 2], data[:len(data) // 2],
+                data[:-1], _SCENE_PREFIX.pack(magic, SCENE_VERSION + 1, headerSize) + data[_SCENE_PREFIX.size:],
+                data.replace(header, header.replace(b'"columns"', b'"columns\x00'), 1)]
+    for variant in variants:
+        with open(broken, 'wb') as f:
+            f.write(variant)
+        with pytest.raises(ValueError):
+            loadScene(broken)
+
+
+def testStoreContract():
+    # наследник без ключей совпадений или объекта строки не создаётся
+    class Store(HypObjectStore):
+        columns = {'x': np.float64}
+
+        def object(self, row):
+            return float(self.column('x')[row])
+
+    with pytest.raises(TypeError):
+        Store()
+
+
+def randomLines(rng, n):
+    # прямые через пары случайных точек и несколько прямых, не пересекающих абсолют
+    z = 0.95 * np.sqrt(rng.random((2, n))) * np.exp(2j * np.pi * rng.random((2, n)))
+    lines = drawLineThroughPointsBatch(HypPointArray(z[0]), HypPointArray(z[1]))
+    c = lines.c.copy()
+    c[::17] = rng.uniform(1.01, 2, len(c[::17])) * np.sign(rng.standard_normal(len(c[::17])))
+    return HypLineArray(lines.a, lines.b, c, normalized=True)
+
+
+def testIntersectAllLinePairs():
+    lines = randomLines(np.random.default_rng(6), 300)
+    # перебор всех пар скалярным intersectLines
+    expected = {(i, j) for i in range(len(lines)) for j in range(i + 1, len(lines))
+                if lines[i].isValid() and lines[j].isValid() and intersectLines(lines[i], lines[j]).isValid()}
+    assert len(expected) > 1000
+    for chunkSize in [1 << 15, 100]:
+        pairs = [(min(i, j), max(i, j)) for i, j, _ in intersectAllLinePairs(lines, chunkSize)
+                 for i, j in zip(i.tolist(), j.tolist())]
+        # каждая пара -- ровно один раз
+        assert len(pairs) == len(set(pairs)) and set(pairs) == expected
+    fractions = [fraction for _, _, fraction in intersectAllLinePairs(lines, 100)]
+    assert fractions == sorted(fractions) and fractions[-1] == 1
+
+
+def assertLinesClose(batch, lines):
+    expected = HypLineArray.fromLines(lines)
+    for name in 'abc':
+        assert np.allclose(getattr(batch, name), getattr(expected, name), rtol=1e-12, atol=1e-12), name
+
+
+def assertPointsClose(batch, points):
+    assert all(p.m is batch.m for p in points)
+    assert np.allclose(batch.z, [p.z for p in points], rtol=1e-12, atol=1e-12)
+
+
+def testBatchMatchesScalar():
+    rng = np.random.default_rng(9)
+    lines = randomLines(rng, 200)
+    valid = lines.isValid()
+    assert np.array_equal(valid, [line.isValid() for line in lines]) and not valid.all()
+    lines = lines[valid]
+    n = len(lines)
+    # точки в обеих моделях
+    z = 0.95 * np.sqrt(rng.random((2, n))) * np.exp(2j * np.pi * rng.random((2, n)))
+    p, q = HypPointArray(z[0]), HypPointArray(z[1], HypModel.Poincare)
+    assert p.isValid().all() and not HypPointArray(z[0] / 0.9).isValid().all()
+    for m in HypModel:
+        assertPointsClose(p.toModel(m), [point.toModel(m) for point in p])
+        assertPointsClose(q.toModel(m), [point.toModel(m) for point in q])
+    pairs = list(zip(p, q))
+    assertLinesClose(drawLineThroughPointsBatch(p, q), [drawLineThroughPoints(a, b) for a, b in pairs])
+    assert np.allclose(pointDistanceBatch(p, q), [pointDistance(a, b) for a, b in pairs], rtol=1e-12)
+    other = lines[np.roll(np.arange(n), 1)]
+    assertPointsClose(intersectLinesBatch(lines, other), [intersectLines(a, b) for a, b in zip(lines, other)])
+    ideal = lines.idealPoints(HypModel.Poincare)
+    for k in range(2):
+        assertPointsClose(ideal[k], [line.idealPoints(HypModel.Poincare)[k] for line in lines])
+    # полюса прямых около центра далеко, сравниваются с относительной точностью
+    assert np.allclose(lines.pole().z, [line.pole().z for line in lines], rtol=1e-9, atol=0)
+    assertLinesClose(drawPerpendicularBatch(lines, p), [drawPerpendicular(line, a) for line, a in zip(lines, p)])
+    parallels = drawParallelsBatch(lines, q)
+    for k in range(2):
+        assertLinesClose(parallels[k], [drawParallels(line, b)[k] for line, b in zip(lines, q)])
+    # массивы из объектов и обратно
+    assertLinesClose(HypLineArray.fromLines(list(lines)), list(lines))
+    assertPointsClose(HypPointArray.fromPoints(list(q), HypModel.Poincare), list(q))
+    assert HypPointArray.fromPoints([HypPoint(0.5 + 0j)], HypModel.Poincare)[0].z == pytest.approx(2 - 3 ** 0.5)
@@ -0,0 +1,77 @@
+import numpy as np
+
+from p11_geometry import HypPointArray, drawLineThroughPointsBatch, drawPerpendicularBatch, intersectLinesBatch
+from p11_index import HypSpatialIndex, HypIncrementalIndex, bkDistance, gridKeys
+
+
+def testGridKeysNonNegative():
+    # на краю квадрата [-1, 1]^2 упаковка пары номеров ячеек не переполняется
+    edge = np.nextafter(1.0, 0.0)
+    u = np.array([-1.0, -edge, 0.0, edge, 1.0, 1.0])
+    v = np.array([-1.0, edge, -edge, 1.0, -1.0, 1.0])
+    keys, probes = gridKeys(u, v)
+    assert (keys >= 0).all()
+    assert ((probes >= 0) | (probes == -1)).all()
+
+
+def randomObjects(rng, n):
+    # точки по всему диску, в том числе у абсолюта, и прямые через пары таких точек
+    z = (1 - 10.0 ** -rng.uniform(0, 6, (3, n))) * np.exp(2j * np.pi * rng.random((3, n)))
+    lines = drawLineThroughPointsBatch(HypPointArray(z[1]), HypPointArray(z[2]))
+    return z[0], lines
+
+
+def lineDistances(u, lines):
+    # расстояние до основания перпендикуляра из u
+    points = HypPointArray(np.full(len(lines), u))
+    return bkDistance(u, intersectLinesBatch(lines, drawPerpendicularBatch(lines, points)).z)
+
+
+def queries(rng):
+    return [(0.9 * np.sqrt(rng.random()) * np.exp(2j * np.pi * rng.random()), rho)
+            for rho in [0.0, 1e-3, 0.1, 1.0, 3.0, 10.0, np.inf] for _ in range(5)]
+
+
+def assertLinesWithin(found, u, rho, lines, ids):
+    # у прямых на расстоянии ровно rho ответ зависит от округления
+    d = lineDistances(u, lines)
+    assert len(found) == len(set(found.tolist()))
+    assert set(ids[d <= rho * (1 - 1e-9) - 1e-12].tolist()) <= set(found.tolist())
+    assert set(found.tolist()) <= set(ids[d <= rho * (1 + 1e-9) + 1e-12].tolist())
+
+
+def testSpatialIndexQueries():
+    rng = np.random.default_rng(7)
+    points, lines = randomObjects(rng, 3000)
+    index = HypSpatialIndex(points, lines.a, lines.b, lines.c, leafSize=16)
+    rows = np.arange(len(points))
+    for u, rho in queries(rng):
+        # перебор всех точек с bkDistance
+        d = bkDistance(u, points)
+        assert np.array_equal(np.sort(index.pointsWithin(u, rho)), rows[d <= rho])
+        assertLinesWithin(index.linesWithin(u, rho), u, rho, lines, rows)
+        for k in [0, 1, 7, 100, len(points) + 1]:
+            nearest = np.lexsort((rows, d))[:k]
+            found, distances = index.nearestPoints(u, k)
+            assert np.array_equal(found, nearest) and np.array_equal(distances, d[nearest])
+
+
+def testIncrementalIndexQueries():
+    rng = np.random.default_rng(8)
+    points, lines = randomObjects(rng, 3000)
+    pointIds, lineIds = rng.permutation(10 ** 6)[:len(points)], rng.permutation(10 ** 6)[:len(lines)]
+    index = HypIncrementalIndex(leafSize=16)
+    # объекты добавляются частями разного размера: часть уровней сливается, часть остаётся
+    bounds = [0, 2000, 2500, 2900, 2980, 3000]
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        index.add(pointIds[lo:hi], points[lo:hi], lineIds[lo:hi], lines.a[lo:hi], lines.b[lo:hi], lines.c[lo:hi])
+    assert len(index) == 6000 and len(index.levels) == 4
+    assert index.containsPoints(pointIds).all() and not index.containsPoints(lineIds[~np.isin(lineIds, pointIds)]).any()
+    for u, rho in queries(rng):
+        d = bkDistance(u, points)
+        assert np.array_equal(np.sort(index.pointsWithin(u, rho)), np.sort(pointIds[d <= rho]))
+        assertLinesWithin(index.linesWithin(u, rho), u, rho, lines, lineIds)
+        for k in [0, 1, 7, 100, len(points) + 1]:
+            nearest = np.argsort(d, kind='stable')[:k]
+            found, distances = index.nearestPoints(u, k)
+            assert np.array_equal(found, pointIds[nearest]) and np.array_equal(distances, d[nearest])
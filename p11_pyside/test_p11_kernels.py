@@ -0,0 +1,123 @@
+import importlib
+import math
+import warnings
+
+import numpy as np
+import pytest
+
+import p11_kernels as kernels
+from p11_geometry import HypModel, HypPoint, HypLine, HypTransform, intersectLines
+
+TOLERANCE = 1e-12
+
+
+def disk(rng, n, radius=1.2):
+    # точки в круге радиуса radius: есть и внутри абсолюта, и вне его
+    return np.sqrt(rng.random(n)) * radius * np.exp(2j * np.pi * rng.random(n))
+
+
+def parityInputs(n, rng):
+    # входы ядер со всеми особыми случаями: точки вне абсолюта, прямые вне
+    # плоскости, параллельные в модели прямые, nan
+    z = disk(rng, n)
+    z[:3] = [0, 1, np.nan]
+    phi = 2 * np.pi * rng.random((2, n))
+    c = rng.uniform(-1.2, 1.2, (2, n))
+    phi[1, :2] = phi[0, :2]
+    a, b = np.cos(phi), np.sin(phi)
+    s = rng.uniform(0.5, 2, n) * np.exp(2j * np.pi * rng.random(n))
+    t = disk(rng, n, 0.9)
+    return {'toPoincare': (z,), 'toKlein': (z,), 'idealPoints': (a[0], b[0], c[0]),
+            'intersect': (a[0], b[0], c[0], a[1], b[1], c[1]),
+            'moebius': (np.cosh(abs(s)) * np.exp(1j * np.angle(s)), np.sinh(abs(s)) * t / abs(t), z),
+            'pToQ': (z, disk(rng, n))}
+
+
+def mismatch(expected, got):
+    # Наибольшее расхождение результатов двух реализаций ядра: относительное, а у
+    # значений меньше 1 по модулю -- абсолютное. Не конечные значения должны
+    # совпадать с не конечными, иначе расхождение -- inf.
+    if not isinstance(expected, tuple):
+        expected, got = (expected,), (got,)
+    error = 0.0
+    for x, y in zip(expected, got):
+        finite = np.isfinite(x)
+        if np.any(finite != np.isfinite(y)):
+            return math.inf
+        if finite.any():
+            error = max(error, float(np.max(np.abs(x[finite] - y[finite]) / np.maximum(1, np.abs(x[finite])))))
+    return error
+
+
+@pytest.fixture(scope='module')
+def inputs():
+    return parityInputs(10000, np.random.default_rng(0))
+
+
+@pytest.mark.parametrize('kernel', kernels.KERNELS)
+@pytest.mark.parametrize('name', [name for name in kernels.BACKENDS if name != kernels.REFERENCE])
+def testBackendParity(inputs, name, kernel):
+    if name not in kernels.available():
+        pytest.skip('{} is not installed'.format(name))
+    # особые входы нарочно дают nan и inf
+    with np.errstate(invalid='ignore', divide='ignore'):
+        expected = kernels.implementation(kernel, kernels.REFERENCE)(*inputs[kernel])
+        got = kernels.implementation(kernel, name)(*inputs[kernel])
+    assert mismatch(expected, got) <= TOLERANCE
+
+
+def testScalarParity():
+    # одиночные объекты считают своими формулами; внутри плоскости они совпадают с эталоном
+    rng = np.random.default_rng(1)
+
+    def reference(kernel, *args):
+        # эталон на одном элементе
+        result = kernels.implementation(kernel, kernels.REFERENCE)(*(np.array([x]) for x in args))
+        return tuple(x[0] for x in result) if isinstance(result, tuple) else result[0]
+
+    z = disk(rng, 200, 0.95)
+    phi = 2 * np.pi * rng.random((2, 100))
+    a, b, c = np.cos(phi), np.sin(phi), rng.uniform(-0.9, 0.9, (2, 100))
+    for i in range(100):
+        p, q = HypPoint(z[i]), HypPoint(z[100 + i], HypModel.Poincare)
+        assert abs(p.toModel(HypModel.Poincare).z - reference('toPoincare', p.z)) <= TOLERANCE
+        assert abs(q.toModel(HypModel.BeltramiKlein).z - reference('toKlein', q.z)) <= TOLERANCE
+        l1, l2 = HypLine(a[0, i], b[0, i], c[0, i]), HypLine(a[1, i], b[1, i], c[1, i])
+        for point, expected in zip(l1.idealPoints(), reference('idealPoints', l1.a, l1.b, l1.c)):
+            assert abs(point.z - expected) <= TOLERANCE
+        expected = reference('intersect', l1.a, l1.b, l1.c, l2.a, l2.b, l2.c)
+        assert abs(intersectLines(l1, l2).z - expected) <= TOLERANCE * max(1, abs(expected))
+        pz = p.toModel(HypModel.Poincare).z
+        ta, tb = reference('pToQ', pz, q.z)
+        # HypTransform нормирует параметры к |a|**2 - |b|**2 = 1
+        k = math.sqrt(abs(ta) ** 2 - abs(tb) ** 2)
+        t = HypTransform.pToQ(p, q)
+        assert abs(t.a - ta / k) <= TOLERANCE and abs(t.b - tb / k) <= TOLERANCE
+        assert abs(t(p).z - reference('moebius', t.a, t.b, pz)) <= TOLERANCE
+
+
+def testUnavailableBackendFallsBack():
+    if 'numba' in kernels.available():
+        pytest.skip('numba is installed')
+    try:
+        assert set(kernels.setBackend('numba').values()) == {kernels.REFERENCE}
+    finally:
+        kernels.setBackend(kernels.REFERENCE)
+
+
+def testUnknownBackend(monkeypatch):
+    with pytest.raises(ValueError):
+        kernels.setBackend('bogus')
+    # опечатка в переменной окружения -- предупреждение и эталон, а не исключение
+    try:
+        monkeypatch.setenv('HYP_BACKEND', 'bogus')
+        with pytest.warns(RuntimeWarning):
+            importlib.reload(kernels)
+        assert set(kernels.backend().values()) == {kernels.REFERENCE}
+        monkeypatch.setenv('HYP_BACKEND', 'python')
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            importlib.reload(kernels)
+        assert set(kernels.backend().values()) == {'python'}
+    finally:
+        kernels.setBackend(kernels.REFERENCE)
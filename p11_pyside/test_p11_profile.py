@@ -0,0 +1,38 @@
+import threading
+
+from p11_profile import HypFrameProfiler
+
+
+def testDisabledRecordsNothing():
+    profiler = HypFrameProfiler()
+    profiler.setEnabled(True)
+    profiler.input()
+    profiler.setEnabled(False)
+    profiler.shown(profiler.now())
+    assert not profiler.latencies and not profiler.events
+    # ввод до выключения не приписывается первому кадру после включения
+    profiler.setEnabled(True)
+    profiler.shown(profiler.now())
+    assert not profiler.latencies
+
+
+def testWorkerSpans():
+    # фазы из других потоков попадают в кадры и не теряются
+    profiler = HypFrameProfiler(frames=1000)
+    profiler.setEnabled(True)
+
+    def work():
+        for _ in range(2000):
+            profiler.record('rasterize', 0.0, 0.001)
+
+    workers = [threading.Thread(target=work) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    while any(worker.is_alive() for worker in workers):
+        profiler.endFrame()
+        profiler.summary()
+    for worker in workers:
+        worker.join()
+    profiler.endFrame()
+    total = sum(phases.get('rasterize', 0) for _, phases, _ in profiler.frames)
+    assert abs(total - 8000 * 0.001) < 1e-9
@@ -0,0 +1,238 @@
+import os
+import sys
+import time
+import subprocess
+
+import numpy as np
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+QtCore = pytest.importorskip('PySide2.QtCore')
+QtGui = pytest.importorskip('PySide2.QtGui')
+QtWidgets = pytest.importorskip('PySide2.QtWidgets')
+
+from p11_geometry import HypPoint, HypPointArray, sortedContains
+from p11_session import HypSessionPlayer, loadSession
+from p11_widgets import HypControls, HypWindow
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+@pytest.fixture
+def controls(app):
+    # 400 выделенных точек: прямых через их пары хватает на долгое построение
+    controls = HypControls()
+    rng = np.random.default_rng(1)
+    z = 0.9 * np.sqrt(rng.random(400)) * np.exp(2j * np.pi * rng.random(400))
+    controls.addPoints(HypPointArray(z))
+    controls.pointModel.setSelected(np.arange(len(controls.pointStore)), True)
+    return controls
+
+
+def processUntil(app, done, timeout=60):
+    deadline = time.monotonic() + timeout
+    while not done():
+        assert time.monotonic() < deadline
+        app.processEvents(QtCore.QEventLoop.AllEvents, 5)
+
+
+def assertParentsExist(controls):
+    # у каждой записи графа родители есть в хранилищах
+    stores = {'points': controls.pointStore, 'lines': controls.lineStore}
+    graph = controls.graph
+    for op, (_, parentKinds, _) in enumerate(graph.operations.values()):
+        rows = graph.op == op
+        for parentKind, keys in zip(parentKinds, graph.parents[rows].T):
+            assert stores[parentKind].contains(keys // 2).all()
+
+
+def testDeleteStopsJob(app, controls):
+    controls.addLinesThroughPoints()
+    assert controls.job is not None
+    processUntil(app, lambda: len(controls.lineStore))
+    controls.deleteObjects()
+    assert controls.job is None
+    for _ in range(100):
+        app.processEvents(QtCore.QEventLoop.AllEvents, 5)
+    assert len(controls.pointStore) == len(controls.lineStore) == len(controls.graph) == 0
+
+
+def testChunksOfDeletedParentsDropped(app, controls):
+    # родители удалены мимо deleteObjects, задание продолжает присылать части
+    controls.addLinesThroughPoints()
+    processUntil(app, lambda: len(controls.lineStore))
+    points = controls.pointStore
+    gone = points.ids[::2].copy()
+    controls.pointModel.take(sortedContains(gone, points.ids))
+    controls.lineModel.take(np.ones(len(controls.lineStore), bool))
+    controls.graph.take(np.zeros(0, np.int64), controls.graph.child // 2)
+    processUntil(app, lambda: controls.job is None)
+    assert len(controls.lineStore) == len(controls.graph) > 0
+    assertParentsExist(controls)
+    assert not sortedContains(gone, controls.graph.parents // 2).any()
+
+
+def snapshot(controls):
+    # столбцы хранилищ (кроме выделения) и записи графа по возрастанию ключей
+    state = {}
+    for kind, store in [('points', controls.pointStore), ('lines', controls.lineStore)]:
+        for name in list(store.columns) + ['id']:
+            state[kind, name] = store.column(name).copy()
+    order = np.argsort(controls.graph.child)
+    for name in ['child', 'op', 'slot', 'parents']:
+        state['graph', name] = getattr(controls.graph, name)[order].copy()
+    return state
+
+
+def assertSame(state, expected):
+    assert state.keys() == expected.keys()
+    for key, array in expected.items():
+        assert np.array_equal(state[key], array), key
+
+
+def testUndoRedo(app):
+    controls = HypControls()
+    controls.addPoints(HypPointArray(np.array([0.1 + 0.1j, -0.3 + 0.2j, 0.4 - 0.3j, -0.2 - 0.5j, 0.05 - 0.6j])))
+    snapshots = [snapshot(controls)]
+    # построение: прямые через все пары точек
+    controls.pointModel.setSelected(np.arange(5), True)
+    controls.addLinesThroughPoints()
+    controls.pointModel.setSelected(np.arange(5), False)
+    snapshots.append(snapshot(controls))
+    # удаление точки вместе с прямыми через неё
+    controls.pointModel.setSelected([0], True)
+    controls.deleteObjects()
+    snapshots.append(snapshot(controls))
+    # перемещение точки пересчитывает прямые через неё
+    controls.movePoints(controls.pointStore.ids[:1], [HypPoint(0.3 + 0.3j)])
+    snapshots.append(snapshot(controls))
+    assert len(controls.lineStore) == 6 and len(controls.graph) == 6
+    assert not np.array_equal(snapshots[-1]['lines', 'a'], snapshots[-2]['lines', 'a'])
+
+    for expected in reversed(snapshots[:-1]):
+        controls.undo()
+        assertSame(snapshot(controls), expected)
+    for expected in snapshots[1:]:
+        controls.redo()
+        assertSame(snapshot(controls), expected)
+    assert not controls.history.canRedo()
+
+
+def settle(app, window):
+    # все заказанные кадры нарисованы, слои растеризованы, построения закончены
+    area = window.drawing
+    processUntil(app, lambda: not (area.scheduler.timer.isActive() or area._renderer.isBusy()
+                                   or window.controls.job is not None))
+    app.processEvents()
+
+
+def mouse(app, window, kind, x, y):
+    # событие левой кнопки над плоскостью; окно успокаивается после каждого события,
+    # как при воспроизведении без темпа, так что перемещения сливаются в кадры одинаково
+    left, none = QtCore.Qt.LeftButton, QtCore.Qt.NoButton
+    button = none if kind == QtCore.QEvent.MouseMove else left
+    buttons = none if kind == QtCore.QEvent.MouseButtonRelease else left
+    QtWidgets.QApplication.sendEvent(window.drawing, QtGui.QMouseEvent(
+        kind, QtCore.QPointF(x, y), button, QtCore.Qt.MouseButtons(buttons), QtCore.Qt.NoModifier))
+    settle(app, window)
+
+
+def testSessionReplay(app, tmp_path):
+    window = HypWindow()
+    window.drawing.setFixedSize(400, 400)
+    window.show()
+    z = np.array([0.1 + 0.1j, -0.3 + 0.2j, 0.4 - 0.3j, -0.2 - 0.5j])
+    window.controls.addPoints(HypPointArray(z))
+    settle(app, window)
+    path = str(tmp_path / 'session.json')
+    window.startRecording(path)
+    controls = window.controls
+    # точки двойным щелчком и перетаскивание плоскости
+    for x, y in [(150, 120), (260, 300), (310, 180)]:
+        for kind in [QtCore.QEvent.MouseButtonPress, QtCore.QEvent.MouseButtonRelease,
+                     QtCore.QEvent.MouseButtonDblClick, QtCore.QEvent.MouseButtonRelease]:
+            mouse(app, window, kind, x, y)
+    mouse(app, window, QtCore.QEvent.MouseButtonPress, 200, 200)
+    for x, y in [(215, 205), (230, 215), (260, 230)]:
+        mouse(app, window, QtCore.QEvent.MouseMove, x, y)
+    mouse(app, window, QtCore.QEvent.MouseButtonRelease, 260, 230)
+
+    def select(view, rows):
+        # щелчки по строкам списка, выделение в котором надо поменять
+        store = view.model().store
+        desired = np.isin(np.arange(len(store)), rows)
+        for row in np.flatnonzero(store.selected != desired):
+            view.clicked.emit(view.model().index(row))
+            settle(app, window)
+
+    def click(button):
+        button.click()
+        settle(app, window)
+
+    # построения по выделенным в списках объектам, удаление, отмена и модель
+    select(controls.points, [0, 2, 4, 6])
+    click(controls.linesThroughPointsButton)
+    select(controls.lines, [1])
+    click(controls.perpendicularLinesButton)
+    # удаляется точка 1 вместе с построенным через неё
+    select(controls.lines, [])
+    select(controls.points, [1])
+    click(controls.deleteObjectsButton)
+    click(controls.undoButton)
+    click(controls.redoButton)
+    controls.tilingQ.setValue(4)
+    controls.modelsBox.setCurrentText('Poincare')
+    settle(app, window)
+    window.stopRecording()
+    expected = snapshot(controls)
+    selected = controls.pointStore.selected.copy(), controls.lineStore.selected.copy()
+    transform = window.drawing.currentTransform()
+    window.close()
+
+    session = loadSession(path)
+    kinds = [event['type'] for event in session.events]
+    assert session.size == (400, 400) and session.values['tilingQ'] != 4
+    assert {'press', 'release', 'doubleClick', 'move', 'toggle', 'click', 'value', 'model'} == set(kinds)
+    assert len(expected['points', 'id']) == 6 and len(expected['lines', 'id']) > 6
+
+    # воспроизведение в новом окне без темпа
+    replay = HypWindow()
+    latencies = HypSessionPlayer(replay, session).play()
+    assert len(latencies) == len(session) and (latencies >= 0).all()
+    assertSame(snapshot(replay.controls), expected)
+    assert np.array_equal(replay.controls.pointStore.selected, selected[0])
+    assert np.array_equal(replay.controls.lineStore.selected, selected[1])
+    replayed = replay.drawing.currentTransform()
+    assert (replayed.a, replayed.b) == (transform.a, transform.b)
+    assert replay.drawing.model is window.drawing.model and replay.controls.tilingQ.value() == 4
+    replay.close()
+
+
+# окно с заказанной растеризацией большой сцены, из которого программа сразу выходит
+EXIT_SCRIPT = '''
+import numpy as np
+from PySide2 import QtWidgets
+from p11_geometry import HypPointArray
+from p11_widgets import HypWindow
+app = QtWidgets.QApplication([])
+window = HypWindow()
+window.resize(900, 700)
+window.show()
+rng = np.random.default_rng(0)
+z = 0.99 * np.sqrt(rng.random(300000)) * np.exp(2j * np.pi * rng.random(300000))
+window.controls.addPoints(HypPointArray(z))
+while not window.drawing._renderer.isBusy():
+    app.processEvents()
+'''
+
+
+def testExitWhileRendering():
+    # выход из программы во время растеризации: рабочий поток не обращается к удалённому растеризатору
+    result = subprocess.run([sys.executable, '-c', EXIT_SCRIPT], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            env=dict(os.environ, QT_QPA_PLATFORM='offscreen'), capture_output=True, text=True,
+                            timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert 'already deleted' not in result.stderr